@@ -25,6 +25,7 @@ import argparse
 import json
 import os
 from collections import Counter, defaultdict
+from utils.json_stream import iter_json_array
 
 
 def load_data(path):
@@ -90,6 +91,54 @@ def summary_statistics(data):
     }
 
 
+def analyze_stream(items, n=20):
+    """
+    All of the analyses above in a single pass over `items`, which may be
+    a generator. Memory grows with the number of distinct years, areas,
+    topics and case numbers, not with the number of definitions.
+    Returns (summary, by_year, by_area, sectors, avg_length).
+    """
+    per_year = Counter()
+    per_area = Counter()
+    topics = Counter()
+    year_words = defaultdict(lambda: [0, 0])
+    cases = set()
+    total = words = 0
+    min_words = max_words = None
+
+    for item in items:
+        year = item.get("year", "Unknown")
+        per_year[year] += 1
+        per_area[item.get("policy_area", "Unknown")] += 1
+        topic = item.get("topic", "").strip()
+        if topic:
+            topics[topic] += 1
+        if item.get("case_number"):
+            cases.add(item.get("case_number"))
+
+        wc = len(item.get("text", "").split())
+        year_words[year][0] += wc
+        year_words[year][1] += 1
+        total += 1
+        words += wc
+        min_words = wc if min_words is None else min(min_words, wc)
+        max_words = wc if max_words is None else max(max_words, wc)
+
+    summary = {
+        "total_definitions": total,
+        "unique_cases": len(cases),
+        "mean_definition_length_words": round(words / total, 1) if total else 0,
+        "min_definition_length_words": min_words or 0,
+        "max_definition_length_words": max_words or 0,
+    }
+    avg_length = {
+        year: round(sum_wc / count, 1)
+        for year, (sum_wc, count) in sorted(year_words.items())
+    }
+    return (summary, dict(sorted(per_year.items())), dict(per_area.most_common()),
+            dict(topics.most_common(n)), avg_length)
+
+
 def print_section(title, data_dict, value_label="Count"):
     print(f"\n{'=' * 55}")
     print(f"  {title}")
@@ -101,7 +150,7 @@ def print_section(title, data_dict, value_label="Count"):
         print(f"  {str(k):<{col_width}} {v}")
 
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Quantitative analysis of Lextract output JSON"
     )
@@ -117,18 +166,30 @@ def main():
         "--top-n", type=int, default=20,
         help="Number of top sectors to report (default: 20)"
     )
-    args = p.parse_args()
-
-    print(f"Loading data from {args.input} ...")
-    data = load_data(args.input)
-    print(f"Loaded {len(data)} definitions.")
-
-    # Run all analyses
-    summary    = summary_statistics(data)
-    by_year    = definitions_per_year(data)
-    by_area    = definitions_by_policy_area(data)
-    sectors    = top_sectors(data, n=args.top_n)
-    avg_length = avg_definition_length_per_year(data)
+    p.add_argument(
+        "--stream", action="store_true",
+        help="Stream the input in one pass instead of loading it; one definition is held at a time"
+    )
+    args = p.parse_args(argv)
+
+    if args.stream:
+        if not os.path.exists(args.input):
+            raise FileNotFoundError(f"Input file not found: {args.input}")
+        print(f"Streaming data from {args.input} ...")
+        summary, by_year, by_area, sectors, avg_length = analyze_stream(
+            iter_json_array(args.input), n=args.top_n)
+        print(f"Read {summary['total_definitions']} definitions.")
+    else:
+        print(f"Loading data from {args.input} ...")
+        data = load_data(args.input)
+        print(f"Loaded {len(data)} definitions.")
+
+        # Run all analyses
+        summary    = summary_statistics(data)
+        by_year    = definitions_per_year(data)
+        by_area    = definitions_by_policy_area(data)
+        sectors    = top_sectors(data, n=args.top_n)
+        avg_length = avg_definition_length_per_year(data)
 
     # Print results
     print(f"\n{'=' * 55}")
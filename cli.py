@@ -0,0 +1,77 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import importlib
+import sys
+
+# command → (module whose main(argv) runs it, one-line description).
+# Modules are only imported once their command is chosen, so `lextract
+# --help` or `lextract analyze` never pay for pandas or google.generativeai.
+COMMANDS = {
+    "run":               ("run_pipeline",             "Run the full pipeline (default when no command is given)"),
+    "analyze":           ("analyze",                  "Summary statistics for data/output.json"),
+    "evaluate":          ("evaluate",                 "Score data/output.json against the reference set"),
+    "export":            ("export",                   "Export data/output.json to CSV, JSONL, Parquet, SQLite, BibTeX or RIS"),
+    "scrape-links":      ("scripts.scrape_links",      "Stage 1: extract decision links from cases.xlsx"),
+    "scrape-pdf-text":   ("scripts.scrape_pdf_text",   "Stage 2: download PDFs and write text batches"),
+    "scrape-chunks":     ("scripts.scrape_chunks",     "Stage 3: extract market-definition sections with Gemini"),
+    "scrape-individual": ("scripts.scrape_individual", "Stage 4: extract individual definitions as JSON with Gemini"),
+    "clean-json":        ("scripts.clean_json",        "Stage 5: strip markdown fences from the JSON files"),
+    "json-merge":        ("scripts.json_merge",        "Stage 6: merge the JSON files into data/output.json"),
+    "stream":            ("scripts.stream_pipeline",   "Stages 2-6 for one case at a time, connected by queues"),
+    "jobs":              ("utils.jobs",                "Show or reset the state of a --jobs-db job table"),
+    "bench-pdf":         ("utils.pdf_backends",        "Compare PDF text backends: pages/sec, peak memory, agreement"),
+    "artifacts":         ("utils.artifact_store",      "Show, export or clean up a --store artifact store"),
+}
+
+
+def build_parser():
+    commands = "\n".join(f"  {name:<19} {desc}" for name, (_, desc) in COMMANDS.items())
+    p = argparse.ArgumentParser(
+        prog="lextract",
+        description="Extract market definitions from European Commission decision PDFs",
+        epilog=f"commands:\n{commands}\n\nRun `lextract <command> --help` for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    p.add_argument("command", choices=COMMANDS, metavar="command",
+                   help="One of the commands listed below")
+    p.add_argument("args", nargs=argparse.REMAINDER,
+                   help="Options passed on to the command")
+    return p
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    # `lextract` and `lextract --shard 0/4` keep running the pipeline
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv = ["run"] + argv
+
+    args = build_parser().parse_args(argv)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,7 @@ import json
 import os
 import re
 from collections import Counter
+from utils.json_stream import iter_json_array
 
 def tokenize(text):
     return re.findall(r"\b[a-z0-9]+\b", text.lower())
@@ -140,12 +141,16 @@ def score_definition(text, patterns):
         },
     }
 
-def evaluate(reference_data, predicted_data):
+def evaluate(reference_data, predicted_data, per_definition=True):
+    # predicted_data may be a generator; with per_definition=False the
+    # per-definition scores are not kept, so memory does not grow with it
     patterns = learn_patterns(reference_data)
 
     results      = []
+    total        = 0
     valid_count  = 0
     fail_counts  = Counter() 
+    by_year      = {}
 
     for item in predicted_data:
         text   = item.get("text", "")
@@ -154,7 +159,9 @@ def evaluate(reference_data, predicted_data):
         scored["topic"]        = item.get("topic", "")
         scored["year"]         = item.get("year", "")
         scored["policy_area"]  = item.get("policy_area", "")
-        results.append(scored)
+        if per_definition:
+            results.append(scored)
+        total += 1
 
         if scored["valid"]:
             valid_count += 1
@@ -163,18 +170,16 @@ def evaluate(reference_data, predicted_data):
                 if not passed:
                     fail_counts[check] += 1
 
-    total      = len(results)
-    valid_pct  = round(valid_count / total * 100, 1) if total else 0.0
-    invalid    = total - valid_count
-
-    # Validity by year
-    by_year = {}
-    for r in results:
-        year = r.get("year", "Unknown")
+        # Validity by year
+        year = scored.get("year", "Unknown")
         by_year.setdefault(year, {"valid": 0, "total": 0})
         by_year[year]["total"] += 1
-        if r["valid"]:
+        if scored["valid"]:
             by_year[year]["valid"] += 1
+
+    valid_pct  = round(valid_count / total * 100, 1) if total else 0.0
+    invalid    = total - valid_count
+
     validity_by_year = {
         y: {
             "valid": v["valid"],
@@ -232,7 +237,7 @@ def print_report(results):
     for year, v in results["validity_by_year"].items():
         print(f"  {year:<8} {v['valid']:>6} {v['total']:>6} {v['pct']:>6.1f}%")
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Assess validity of Lextract definitions using patterns learned from a reference set"
     )
@@ -251,16 +256,26 @@ def main():
         default=os.path.join("data", "evaluation_report.json"),
         help="Where to save the full report"
     )
-    args = p.parse_args()
+    p.add_argument(
+        "--stream", action="store_true",
+        help="Stream the predictions instead of loading them; one definition is held at a time"
+    )
+    args = p.parse_args(argv)
 
     print(f"Loading reference set from : {args.reference}")
     reference = json.load(open(args.reference, encoding="utf-8"))
-    print(f"Loading predictions from   : {args.predicted}")
-    predicted = json.load(open(args.predicted, encoding="utf-8"))
+    if args.stream:
+        print(f"Streaming predictions from : {args.predicted}")
+        predicted = iter_json_array(args.predicted)
+    else:
+        print(f"Loading predictions from   : {args.predicted}")
+        predicted = json.load(open(args.predicted, encoding="utf-8"))
 
     print(f"\nLearning patterns from {len(reference)} reference definitions ...")
-    print(f"Scoring {len(predicted)} extracted definitions ...")
-    results = evaluate(reference, predicted)
+    if not args.stream:
+        print(f"Scoring {len(predicted)} extracted definitions ...")
+    # the saved report leaves out the per-definition scores, so don't keep them
+    results = evaluate(reference, predicted, per_definition=False)
 
     print_report(results)
 
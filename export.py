@@ -27,6 +27,7 @@ import json
 import os
 import re
 import sqlite3
+from utils.json_stream import batched, iter_json_array
 
 SUPPORTED_FORMATS = ["csv", "jsonl", "parquet", "sqlite", "bibtex", "ris", "all"]
 
@@ -49,21 +50,26 @@ def export_csv(data, output_dir):
     with open(path, "w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(data)
-    print(f"[export] CSV       → {path}  ({len(data)} rows)")
+        count = 0
+        for item in data:
+            writer.writerow(item)
+            count += 1
+    print(f"[export] CSV       → {path}  ({count} rows)")
     return path
 
 
 def export_jsonl(data, output_dir):
     path = os.path.join(output_dir, "output.jsonl")
+    count = 0
     with open(path, "w", encoding="utf-8") as f:
         for item in data:
             f.write(json.dumps(item, ensure_ascii=False) + "\n")
-    print(f"[export] JSONL     → {path}  ({len(data)} records)")
+            count += 1
+    print(f"[export] JSONL     → {path}  ({count} records)")
     return path
 
 
-def export_parquet(data, output_dir):
+def export_parquet(data, output_dir, batch_size=None):
     try:
         import pandas as pd
     except ImportError:
@@ -76,12 +82,35 @@ def export_parquet(data, output_dir):
         return None
 
     path = os.path.join(output_dir, "output.parquet")
+    if batch_size:
+        return _export_parquet_batches(data, path, batch_size)
     df = pd.DataFrame(data)
     df.to_parquet(path, index=False)
     print(f"[export] Parquet   → {path}  ({len(df)} rows, {df.memory_usage(deep=True).sum() // 1024} KB in memory)")
     return path
 
 
+def _export_parquet_batches(data, path, batch_size):
+    # one row group per batch, so at most batch_size rows are in memory
+    import pyarrow
+    import pyarrow.parquet as pq
+
+    writer = None
+    count = 0
+    for batch in batched(data, batch_size):
+        table = pyarrow.Table.from_pylist(batch, schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+        count += len(batch)
+    if writer is None:
+        pq.write_table(pyarrow.table({}), path)
+    else:
+        writer.close()
+    print(f"[export] Parquet   → {path}  ({count} rows, {batch_size} per row group)")
+    return path
+
+
 def export_sqlite(data, output_dir):
     path = os.path.join(output_dir, "output.db")
     if os.path.exists(path):
@@ -105,25 +134,28 @@ def export_sqlite(data, output_dir):
     cur.execute("CREATE INDEX idx_year   ON definitions (year)")
     cur.execute("CREATE INDEX idx_policy ON definitions (policy_area)")
 
-    rows = [
-        (
-            item.get("case_number", ""),
-            item.get("year", ""),
-            item.get("policy_area", ""),
-            item.get("link", ""),
-            item.get("topic", ""),
-            item.get("text", ""),
-        )
-        for item in data
-    ]
+    # executemany pulls rows one at a time, so data may be a generator
+    count = 0
+    def rows():
+        nonlocal count
+        for item in data:
+            count += 1
+            yield (
+                item.get("case_number", ""),
+                item.get("year", ""),
+                item.get("policy_area", ""),
+                item.get("link", ""),
+                item.get("topic", ""),
+                item.get("text", ""),
+            )
     cur.executemany(
         "INSERT INTO definitions (case_number, year, policy_area, link, topic, text) "
         "VALUES (?, ?, ?, ?, ?, ?)",
-        rows
+        rows()
     )
     conn.commit()
     conn.close()
-    print(f"[export] SQLite    → {path}  ({len(rows)} rows, table: definitions)")
+    print(f"[export] SQLite    → {path}  ({count} rows, table: definitions)")
     return path
 
 
@@ -137,8 +169,10 @@ def _bibtex_key(item, index):
 
 def export_bibtex(data, output_dir):
     path = os.path.join(output_dir, "output.bib")
+    count = 0
     with open(path, "w", encoding="utf-8") as f:
         for i, item in enumerate(data):
+            count += 1
             key      = _bibtex_key(item, i)
             case     = item.get("case_number", "")
             year     = item.get("year", "")
@@ -156,14 +190,16 @@ def export_bibtex(data, output_dir):
             f.write(f"  abstract     = {{{text}}},\n")
             f.write(f"  note         = {{Extracted by Lextract}}\n")
             f.write("}\n\n")
-    print(f"[export] BibTeX    → {path}  ({len(data)} entries)")
+    print(f"[export] BibTeX    → {path}  ({count} entries)")
     return path
 
 
 def export_ris(data, output_dir):
     path = os.path.join(output_dir, "output.ris")
+    count = 0
     with open(path, "w", encoding="utf-8") as f:
         for item in data:
+            count += 1
             f.write("TY  - GOVDOC\n")
             f.write(f"AU  - European Commission\n")
             f.write(f"TI  - {item.get('topic', '')}\n")
@@ -174,7 +210,7 @@ def export_ris(data, output_dir):
                     f"Policy area: {item.get('policy_area', '')} | "
                     f"Extracted by Lextract\n")
             f.write("ER  - \n\n")
-    print(f"[export] RIS       → {path}  ({len(data)} records)")
+    print(f"[export] RIS       → {path}  ({count} records)")
     return path
 
 EXPORTERS = {
@@ -187,13 +223,16 @@ EXPORTERS = {
 }
 
 
-def run_export(fmt, data, output_dir):
+def run_export(fmt, data, output_dir, batch_size=None):
     if fmt not in EXPORTERS:
         print(f"[export] Unknown format: {fmt}. Choose from: {', '.join(EXPORTERS)}")
         return
-    EXPORTERS[fmt](data, output_dir)
+    if fmt == "parquet":
+        EXPORTERS[fmt](data, output_dir, batch_size=batch_size)
+    else:
+        EXPORTERS[fmt](data, output_dir)
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Export Lextract output.json to multiple research-friendly formats"
     )
@@ -217,7 +256,23 @@ def main():
         default="exports",
         help="Directory to write exported files (default: exports/)"
     )
-    args = p.parse_args()
+    p.add_argument(
+        "--max-memory", type=int, metavar="N", default=None,
+        help="Stream the input once per format instead of loading it, holding at most N definitions at once"
+    )
+    args = p.parse_args(argv)
+
+    formats = list(EXPORTERS) if args.format == "all" else [args.format]
+
+    if args.max_memory:
+        if not os.path.exists(args.input):
+            raise FileNotFoundError(f"Input file not found: {args.input}")
+        print(f"Streaming data from {args.input} ...")
+        ensure_output_dir(args.output)
+        for fmt in formats:
+            run_export(fmt, iter_json_array(args.input), args.output, batch_size=args.max_memory)
+        print(f"\n[export] Done. Files written to {args.output}/")
+        return
 
     print(f"Loading data from {args.input} ...")
     data = load_data(args.input)
@@ -225,11 +280,8 @@ def main():
 
     ensure_output_dir(args.output)
 
-    if args.format == "all":
-        for fmt in EXPORTERS:
-            run_export(fmt, data, args.output)
-    else:
-        run_export(args.format, data, args.output)
+    for fmt in formats:
+        run_export(fmt, data, args.output)
 
     print(f"\n[export] Done. Files written to {args.output}/")
 
@@ -21,10 +21,20 @@
 #
 # ------------------------------------------------------------------------------------------
 
-import subprocess
-import sys
+import argparse
 import glob
+import importlib
 import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from utils.artifact_store import BATCHES, DEFINITIONS, SECTIONS, STORE
+from utils.jobs import JOBS_DB
+from utils.links import LINKS
+from utils.manifest import manifest_path
+from utils import run_report
+from utils import selection
+from utils.sharding import SHARDS_DIR, shard_arg, shard_dir
 
 # Manually set which chunks to process: "79", "80", or "both"
 # "79" for batches with <80,000 characters
@@ -32,97 +42,351 @@ import os
 # "both" to process all batches
 CHUNKS_SIZE = "both"
 
+# How many independent stages may run at the same time
+MAX_WORKERS = 4
 
-def safe_run(cmd, description=None, input_paths=None):
+# name:    unique stage name, used in deps and log messages
+# func:    zero-argument callable that runs the stage in this interpreter
+# inputs:  files or directories that must exist for the stage to run
+# outputs: files or directories the stage writes
+# deps:    names of stages that must finish before this one starts
+# sizes_in, sizes_out: what to measure for the report's bytes in and out,
+#          if not inputs and outputs: paths or (artifact store, kind) pairs
+Stage = namedtuple("Stage", ["name", "func", "inputs", "outputs", "deps", "sizes_in", "sizes_out"],
+                   defaults=(None, None))
+
+
+def stage_entry(module, argv):
     """
-    Run a subprocess command if all input_paths exist; otherwise warn and skip.
-    description: human‐readable name of this step (e.g. "scrape‐links")
-    input_paths: list of files or directories that must exist to run
+    Return a callable that runs `module.main(argv)` in-process.
+    The module is imported on first call, so every heavy dependency is
+    imported once per pipeline run instead of once per step.
     """
-    if input_paths:
-        missing = [p for p in input_paths if not os.path.exists(p)]
-        if missing:
-            print(f"Warning: missing {', '.join(missing)}; skipping {description or cmd[1]}.")
-            return
-
-    print(f"Running: {' '.join(cmd)}")
-    try:
-        subprocess.run(cmd, check=True)
-    except FileNotFoundError as e:
-        print(f"Warning: file or script not found ({e.filename}); skipping {description or cmd[1]}.")
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: step {description or cmd[1]} failed (exit {e.returncode}); continuing.")
-
-
-def main():
-    # 1) scrape_links.py
-    safe_run(
-        [sys.executable, "scripts/scrape_links.py",
-         "-i", "data/cases.xlsx",
-         "-o", "data/extracted_links.txt"],
-        description="scrape_links",
-        input_paths=["data/cases.xlsx"]
-    )
+    def run():
+        return importlib.import_module(module).main(argv)
+    return run
 
-    # 2) scrape_pdf_text.py
-    safe_run(
-        [sys.executable, "scripts/scrape_pdf_text.py",
-         "-i", "data/extracted_links.txt",
-         "--datadir", "data"],
-        description="scrape_pdf_text",
-        input_paths=["data/extracted_links.txt", "data"]
-    )
 
-    # 3) scrape_chunks.py
-    safe_run(
-        [sys.executable, "scripts/scrape_chunks.py",
-         "--indir", "data/extracted_batches",
-         "--outdir", "data/extracted_sections",
-         "--size", CHUNKS_SIZE],
-        description="scrape_chunks",
-        input_paths=["data/extracted_batches"]
-    )
+def build_stages(chunks_size=CHUNKS_SIZE, stream=False, shard=None, jobs_db=None,
+                 max_memory=None, market_only=False, store=None, since_previous=False,
+                 select_args=()):
+    """
+    Build the pipeline graph. The 79 and 80 chunk sizes share no files,
+    so they are separate stages that can run side by side. Stages that
+    download or call Gemini keep a manifest under data/manifest/ so
+    unchanged cases are skipped on the next run.
 
-    # 4) scrape_individual.py
-    safe_run(
-        [sys.executable, "scripts/scrape_individual.py",
-         "--indir", "data/extracted_sections",
-         "--outdir", "json"],
-        description="scrape_individual",
-        input_paths=["data/extracted_sections"]
-    )
+    With stream=True everything after scrape_links is a single streaming
+    stage that moves each case through to data/output.json on its own;
+    max_memory caps how many cases it holds in flight. (The stage-by-stage
+    graph already holds one document or definition at a time.)
+
+    With shard=(i, N) only cases hashing into shard i are processed, and
+    everything from scrape_pdf_text on lives in data/shards/<i>-of-<N>/,
+    ending in that directory's output.json.
+
+    With jobs_db, scrape_pdf_text and scrape_individual track each case in
+    that SQLite job table instead of a manifest, so an interrupted run
+    resumes where it stopped and extra workers can join in.
+
+    With market_only, scrape_pdf_text keeps only each decision's market
+    definition section, so scrape_chunks gets far less text.
+
+    With store, the batches, sections and definitions are kept in that
+    artifact store (one per shard) instead of one file per document.
+
+    With since_previous, scrape_links lists only the links added or
+    changed since the register of the last such run, and the later
+    stages keep what earlier runs produced for the rest; json_merge
+    merges all of it, so output.json stays complete.
+
+    select_args (the --years, --areas, --cases, --sample and --seed
+    options) are passed to scrape_links, so every later stage only sees
+    the selected cases; the Gemini stages are given the selected link
+    list, so batches of other cases left from earlier runs are not sent,
+    and so is json_merge, so output.json holds only the selected cases.
+    """
+    sizes = [chunks_size] if chunks_size in ("79", "80") else ["79", "80"]
+
+    links = LINKS
+    workdir = shard_dir(shard) if shard else "data"
+    batches = os.path.join(workdir, "extracted_batches")
+    sections = os.path.join(workdir, "extracted_sections")
+    json_dir = os.path.join(workdir, "json") if shard else "json"
+    output = os.path.join(workdir, "output.json")
+    manifests = os.path.join(workdir, "manifest")
+    shard_args = ["--shard", f"{shard[0]}/{shard[1]}"] if shard else []
+    jobs_args = ["--jobs-db", jobs_db] if jobs_db else []
+    store_args = []
+    select_links = ["--links", links] if select_args else []
+    if store:
+        store = os.path.join(workdir, os.path.basename(store)) if shard else store
+        store_args = ["--store", store]
+        batches = sections = json_dir = store
+
+    def stored(kind):
+        # the store file holds every kind, so a stage's bytes are its kind's
+        return [(store, kind)] if store else None
+
+    stages = [
+        Stage(
+            "scrape_links",
+            stage_entry("scripts.scrape_links",
+                        ["-i", os.path.join("data", "cases.xlsx"),
+                         "-o", links,
+                         "--manifest", manifest_path("scrape_links")]
+                        + (["--since-previous"] if since_previous else []) + list(select_args)),
+            inputs=[os.path.join("data", "cases.xlsx")],
+            outputs=[links],
+            deps=[],
+        ),
+    ]
+    if stream:
+        stages.append(Stage(
+            "stream_pipeline",
+            stage_entry("scripts.stream_pipeline",
+                        ["-i", links, "--output", output,
+                         "--manifest", manifest_path("stream_pipeline", manifests),
+                         "--results", os.path.join(workdir, "stream_results")] + shard_args
+                        + (["--max-memory", str(max_memory)] if max_memory else [])),
+            inputs=[links],
+            outputs=[output],
+            deps=["scrape_links"],
+        ))
+        return stages
+
+    stages.append(Stage(
+        "scrape_pdf_text",
+        stage_entry("scripts.scrape_pdf_text",
+                    ["-i", links,
+                     "--datadir", workdir,
+                     "--manifest", manifest_path("scrape_pdf_text", manifests)] + shard_args + jobs_args
+                    + store_args + (["--market-definition-only"] if market_only else [])
+                    + (["--delta"] if since_previous else [])),
+        inputs=[links],
+        outputs=[batches],
+        deps=["scrape_links"],
+        sizes_out=stored(BATCHES),
+    ))
+    for size in sizes:
+        stages.append(Stage(
+            f"scrape_chunks_{size}",
+            stage_entry("scripts.scrape_chunks",
+                        ["--indir", batches,
+                         "--outdir", sections,
+                         "--size", size,
+                         "--manifest", manifest_path(f"scrape_chunks_{size}", manifests)] + store_args
+                        + select_links),
+            inputs=[batches],
+            outputs=[sections],
+            deps=["scrape_pdf_text"],
+            sizes_in=stored(BATCHES),
+            sizes_out=stored(SECTIONS),
+        ))
+    stages += [
+        Stage(
+            "scrape_individual",
+            stage_entry("scripts.scrape_individual",
+                        ["--indir", sections,
+                         "--outdir", json_dir,
+                         "--manifest", manifest_path("scrape_individual", manifests)] + jobs_args
+                        + store_args + (select_links + ["--batches", batches] if select_links else [])),
+            inputs=[sections],
+            outputs=[json_dir],
+            deps=[f"scrape_chunks_{size}" for size in sizes],
+            sizes_in=stored(SECTIONS),
+            sizes_out=stored(DEFINITIONS),
+        ),
+        Stage(
+            "clean_json",
+            stage_entry("scripts.clean_json", ["--indir", json_dir] + store_args),
+            inputs=[json_dir],
+            outputs=[json_dir],
+            deps=["scrape_individual"],
+            sizes_in=stored(DEFINITIONS),
+            sizes_out=stored(DEFINITIONS),
+        ),
+        Stage(
+            "json_merge",
+            stage_entry("scripts.json_merge",
+                        ["--indir", json_dir, "--output", output,
+                         "--duplicates", os.path.join(workdir, "duplicate_cases.json")] + store_args
+                        # a --since-previous list holds only the delta, not all wanted cases
+                        + (select_links + ["--batches", batches] if select_links and not since_previous
+                           else [])),
+            inputs=[json_dir],
+            outputs=[output],
+            deps=["clean_json"],
+            sizes_in=stored(DEFINITIONS),
+        ),
+    ]
+    return stages
+
+
+def run_stage(stage, report=None):
+    """
+    Run a single stage if all of its inputs exist; otherwise warn and skip.
+    A failing stage is reported but never stops the rest of the pipeline.
+    If `report` is a list, a timing/throughput record is appended to it.
+    Returns True if the stage ran to completion.
+    """
+    start = time.monotonic()
+    bytes_in = run_report.artifact_bytes(stage.sizes_in or stage.inputs) if report is not None else 0
+    status, counts = "ok", None
+
+    missing = [p for p in stage.inputs if not os.path.exists(p)]
+    if missing:
+        print(f"Warning: missing {', '.join(missing)}; skipping {stage.name}.")
+        status = "skipped"
+    else:
+        print(f"Running: {stage.name}")
+        try:
+            counts = stage.func()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                print(f"Warning: step {stage.name} failed (exit {e.code}); continuing.")
+                status = "failed"
+        except Exception as e:
+            print(f"Warning: step {stage.name} failed ({e}); continuing.")
+            status = "failed"
+
+    if report is not None:
+        report.append(run_report.stage_record(
+            stage.name, status, time.monotonic() - start,
+            counts=counts if isinstance(counts, dict) else None,
+            bytes_in=bytes_in,
+            bytes_out=run_report.artifact_bytes(stage.sizes_out or stage.outputs),
+        ))
+    return status == "ok"
 
-    # 5) clean_json.py
-    safe_run(
-        [sys.executable, "scripts/clean_json.py",
-         "--indir", "json"],
-        description="clean_json",
-        input_paths=["json"]
-    )
 
-    # 6) json_merge.py
-    safe_run(
-        [sys.executable, "scripts/json_merge.py"],
-        description="json_merge",
-        input_paths=["json"]
+def run_graph(stages, max_workers=MAX_WORKERS, report=None):
+    """
+    Run `stages` in dependency order. Every stage whose deps have finished
+    is started as soon as a worker is free, so independent stages overlap.
+    Stage records are appended to `report` if given (see run_stage).
+    Returns {stage name: True if it ran to completion}.
+    """
+    names = {s.name for s in stages}
+    for s in stages:
+        unknown = set(s.deps) - names
+        if unknown:
+            raise ValueError(f"Stage {s.name} depends on unknown stage(s): {', '.join(sorted(unknown))}")
+
+    pending = list(stages)
+    running = {}
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for stage in [s for s in pending if all(d in results for d in s.deps)]:
+                pending.remove(stage)
+                running[pool.submit(run_stage, stage, report)] = stage.name
+
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {', '.join(s.name for s in pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Run the full Lextract pipeline from data/cases.xlsx to data/output.json"
+    )
+    p.add_argument(
+        "--stream", action="store_true",
+        help="Pass each case through every step as soon as it is ready instead of stage by stage"
+    )
+    p.add_argument(
+        "--shard", type=shard_arg, default=None,
+        help="Only process cases hashing into shard i of N (e.g. 0/4); results go to data/shards/<i>-of-<N>/"
+    )
+    p.add_argument(
+        "--merge-shards", action="store_true",
+        help="Combine every data/shards/*/output.json into data/output.json and exit"
     )
+    p.add_argument(
+        "--jobs-db", nargs="?", const=JOBS_DB, default=None,
+        help="Track downloads and Gemini calls per case in a SQLite job table (default: %(const)s) "
+             "so a crashed run resumes where it stopped and more workers can join"
+    )
+    p.add_argument(
+        "--store", nargs="?", const=STORE, default=None,
+        help="Keep the text batches, sections and JSON definitions in one compressed SQLite "
+             "artifact store (default: %(const)s) instead of a file per document"
+    )
+    p.add_argument(
+        "--since-previous", action="store_true",
+        help="Only process links added or changed since the last --since-previous run "
+             "(the register is kept in data/register_snapshot.jsonl; not with --stream)"
+    )
+    selection.add_arguments(p)
+    p.add_argument(
+        "--max-memory", type=int, metavar="N", default=None,
+        help="With --stream, hold at most N cases in flight at once (only with --stream)"
+    )
+    p.add_argument(
+        "--market-definition-only", action="store_true",
+        help="Extract only the market definition section of each PDF (not with --stream)"
+    )
+    p.add_argument(
+        "--report", default=run_report.REPORT_PATH,
+        help="Where to write the per-stage timing report (default: %(default)s)"
+    )
+    args = p.parse_args(argv)
+    if args.stream and args.since_previous:
+        # the streaming stage rewrites output.json from its links alone
+        p.error("--since-previous cannot be combined with --stream")
+    if args.max_memory and not args.stream:
+        # the stage-by-stage pipeline already holds one document at a time
+        p.error("--max-memory only applies with --stream")
 
-    batches79 = len(glob.glob(os.path.join('data', 'extracted_batches', 'pdf_texts_79_batch_*.txt')))
-    batches80 = len(glob.glob(os.path.join('data', 'extracted_batches', 'pdf_texts_80_batch_*.txt')))
-    
-    sections = len(glob.glob(os.path.join('data', 'extracted_sections', 'extract-sections_batch_*.txt')))
-    
-    json_files = len(glob.glob(os.path.join('json', '*.json')))
+    if args.merge_shards:
+        from scripts import json_merge
+        json_merge.merge_shards(SHARDS_DIR, os.path.join('data', 'output.json'))
+        return
+
+    workdir = shard_dir(args.shard) if args.shard else 'data'
+    json_dir = os.path.join(workdir, 'json') if args.shard else 'json'
+
+    start = time.monotonic()
+    records = []
+    stages = build_stages(stream=args.stream, shard=args.shard, jobs_db=args.jobs_db,
+                          max_memory=args.max_memory, market_only=args.market_definition_only,
+                          store=args.store, since_previous=args.since_previous,
+                          select_args=selection.to_argv(args))
+    run_graph(stages, report=records)
+    report = run_report.write_report(records, time.monotonic() - start, args.report)
 
     # This should always be 1. It will be 0 if the merge fails or is not run.
-    merged = 1 if os.path.exists(os.path.join('data', 'output.json')) else 0
+    output = os.path.join(workdir, 'output.json')
+    merged = 1 if os.path.exists(output) else 0
 
     print("\nPipeline complete.")
-    print(f"- {batches79} x 79 batches   → data/extracted_batches/")
-    print(f"- {batches80} x 80 batches   → data/extracted_batches/")
-    print(f"- {sections} section files   → data/extracted_sections/")
-    print(f"- {json_files} JSON files     → json/")
-    print(f"- {merged} merged file        → data/output.json")
+    if args.store:
+        from utils import artifact_store
+        artifact_store.main(["--store", os.path.join(workdir, os.path.basename(args.store))
+                             if args.shard else args.store])
+    else:
+        batches79 = len(glob.glob(os.path.join(workdir, 'extracted_batches', 'pdf_texts_79_batch_*.txt')))
+        batches80 = len(glob.glob(os.path.join(workdir, 'extracted_batches', 'pdf_texts_80_batch_*.txt')))
+
+        sections = len(glob.glob(os.path.join(workdir, 'extracted_sections', 'extract-sections_*_batch_*.txt')))
+
+        json_files = len(glob.glob(os.path.join(json_dir, '*.json')))
+
+        print(f"- {batches79} x 79 batches   → {os.path.join(workdir, 'extracted_batches')}/")
+        print(f"- {batches80} x 80 batches   → {os.path.join(workdir, 'extracted_batches')}/")
+        print(f"- {sections} section files   → {os.path.join(workdir, 'extracted_sections')}/")
+        print(f"- {json_files} JSON files     → {json_dir}/")
+    print(f"- {merged} merged file        → {output}")
+
+    run_report.print_report(report)
+    print(f"\n[report] Stage timings saved to {args.report}")
 
 
 if __name__ == '__main__':
@@ -24,29 +24,58 @@
 import argparse
 import os
 import glob
+from utils import artifact_store as st
 
-def clean_file(path):
+def strip_fences(text):
     """
-    Remove leading ```json and trailing ``` fences from a JSON file.
+    Remove a leading ```json and trailing ``` fence from a Gemini response.
     """
-    with open(path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    # Drop leading ```json fence
+    lines = text.splitlines(keepends=True)
     if lines and lines[0].strip().startswith('```json'):
         lines = lines[1:]
-
-    # Drop trailing ``` fence
     if lines and lines[-1].strip() == '```':
         lines = lines[:-1]
+    return "".join(lines)
+
+
+def clean_file(path):
+    """
+    Remove leading ```json and trailing ``` fences from a JSON file.
+    Returns True if the file had to be rewritten.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        original = f.read()
+    cleaned = strip_fences(original)
+
+    # leave already-clean files untouched so their hashes and mtimes stay stable
+    if cleaned == original:
+        return False
 
     with open(path, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
+        f.write(cleaned)
 
     print(f"[clean] Cleaned {os.path.basename(path)}")
+    return True
+
+
+def clean_stored(store):
+    """
+    clean_file for every definition kept in the artifact store.
+    Returns (documents rewritten, documents checked).
+    """
+    keys = [key for key, _ in store.items(st.DEFINITIONS)]
+    cleaned = 0
+    for key in keys:
+        original = store.get(st.DEFINITIONS, key)
+        text = strip_fences(original)
+        if text != original:
+            store.put(st.DEFINITIONS, key, text)
+            cleaned += 1
+    print(f"[clean] Cleaned {cleaned} of {len(keys)} stored definitions")
+    return cleaned, len(keys)
 
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Remove markdown fences from all .json files in a directory"
     )
@@ -54,7 +83,16 @@ def main():
         "--indir", default="json",
         help="Directory containing .json files to clean"
     )
-    args = p.parse_args()
+    p.add_argument(
+        "--store", default=None,
+        help="Clean the definitions in this artifact store instead of --indir"
+    )
+    args = p.parse_args(argv)
+
+    if args.store:
+        with st.ArtifactStore(args.store) as store:
+            cleaned, total = clean_stored(store)
+        return {"items": cleaned, "skipped": total - cleaned, "failed": 0}
 
     # find all JSON files in the input directory
     pattern = os.path.join(args.indir, '*.json')
@@ -63,8 +101,8 @@ def main():
         print(f"No JSON files found in {args.indir}")
         return
 
-    for path in sorted(files):
-        clean_file(path)
+    cleaned = sum(1 for path in sorted(files) if clean_file(path))
+    return {"items": cleaned, "skipped": len(files) - cleaned, "failed": 0}
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -21,44 +21,217 @@
 #
 # ------------------------------------------------------------------------------------------
 
+import argparse
 import json
 import os
+import re
+from utils import artifact_store as st
+from utils import selection as sel
+from utils.json_stream import iter_json_array, write_json_array
+
+# Written by scrape_pdf_text: cases sharing an earlier case's text
+DUPLICATES = os.path.join('data', 'duplicate_cases.json')
+
+
+def load_duplicates(path):
+    """
+    {canonical link: [fields of each duplicate case]} from scrape_pdf_text,
+    or {} if there is no such file.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def fan_out(items, duplicates):
+    """
+    Yield each definition, followed by a copy of it for every case that
+    shares its link's text, with that case's number, year, area and link.
+    """
+    for item in items:
+        yield item
+        link = item.get("link") if isinstance(item, dict) else None
+        for fields in duplicates.get(link, ()):
+            yield {**item, **fields}
+
 
 # combine all JSON files into a single file
-def combine_json_files(input_folder, output_file):
-    combined_data = []
+# returns (definitions written, files skipped)
+# only one input file is held in memory at a time
+# with a store, its definitions are read instead of the folder's files
+# with keep, only documents whose file name or store key it accepts are merged
+def combine_json_files(input_folder, output_file, duplicates=None, store=None, keep=None):
+    skipped = 0
 
-    if not os.path.exists(input_folder):
+    if store is None and not os.path.exists(input_folder):
         print(f"Input folder {input_folder} does not exist.")
         return
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith('.json'):
-            file_path = os.path.join(input_folder, filename)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        combined_data.extend(data)
-                    else:
-                        print(f"Skipping {filename}: not a list of dictionaries")
-                except json.JSONDecodeError as e:
-                    print(f"Skipping {filename}: JSONDecodeError - {e}")
+    def documents():
+        # (name, text) of each document, read one at a time
+        if store is not None:
+            for key, _ in store.items(st.DEFINITIONS):
+                if keep is None or keep(key):
+                    yield key, store.get(st.DEFINITIONS, key)
+            return
+        for filename in os.listdir(input_folder):
+            if filename.endswith('.json') and (keep is None or keep(filename)):
+                with open(os.path.join(input_folder, filename), 'r', encoding='utf-8') as f:
+                    yield filename, f.read()
+
+    def items():
+        nonlocal skipped
+        for filename, text in documents():
+            try:
+                data = json.loads(text)
+            except json.JSONDecodeError as e:
+                skipped += 1
+                print(f"Skipping {filename}: JSONDecodeError - {e}")
+                continue
+            if isinstance(data, list):
+                yield from data
+            else:
+                skipped += 1
+                print(f"Skipping {filename}: not a list of dictionaries")
 
+    written = 0
     try:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w', encoding='utf-8') as out_f:
-            json.dump(combined_data, out_f, indent=4)
+        written = write_json_array(output_file, fan_out(items(), duplicates or {}))
         print(f"Combined JSON files saved to {output_file}")
     except IOError as e:
         print(f"Failed to write to {output_file}: IOError - {e}")
+    return written, skipped
+
+
+def append_json_items(output_file, items):
+    """
+    Append items to the JSON array in output_file (creating it if needed).
+    The file is a valid JSON array after every call, so it can be read
+    while a streaming run is still adding to it.
+    """
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    if not os.path.exists(output_file):
+        with open(output_file, 'w', encoding='utf-8') as out_f:
+            out_f.write("[]")
+    if not items:
+        return
+
+    body = ",\n".join(
+        "    " + json.dumps(item, indent=4).replace("\n", "\n    ") for item in items
+    )
+    with open(output_file, 'r+b') as out_f:
+        # walk back over trailing whitespace to the closing bracket
+        pos = out_f.seek(0, os.SEEK_END)
+        close = None
+        while pos > 0:
+            pos -= 1
+            out_f.seek(pos)
+            ch = out_f.read(1)
+            if ch.isspace():
+                continue
+            if close is None and ch == b"]":
+                close = pos
+                continue
+            break
+        if close is None:
+            raise ValueError(f"{output_file} does not end with a JSON array")
+        sep = "\n" if ch == b"[" else ",\n"
+        out_f.seek(pos + 1)
+        out_f.truncate()
+        out_f.write((sep + body + "\n]").encode("utf-8"))
+
+
+def merge_shards(shard_root, output_file):
+    """
+    Combine the output.json of every <i>-of-<N> directory under shard_root
+    into output_file, in shard order. Refuses to merge shards cut with
+    different N (cases could appear twice) and warns about missing shards.
+    Returns the number of definitions written, or None if nothing was merged.
+    """
+    outputs = {}
+    if os.path.isdir(shard_root):
+        for name in os.listdir(shard_root):
+            m = re.fullmatch(r"(\d+)-of-(\d+)", name)
+            path = os.path.join(shard_root, name, 'output.json')
+            if m and os.path.exists(path):
+                outputs[(int(m.group(1)), int(m.group(2)))] = path
+
+    if not outputs:
+        print(f"No shard outputs found in {shard_root}")
+        return None
+
+    counts = {count for _, count in outputs}
+    if len(counts) > 1:
+        print(f"Refusing to merge shards with different counts: {sorted(counts)}")
+        return None
+    count = counts.pop()
+    missing = [i for i in range(count) if (i, count) not in outputs]
+    if missing:
+        print(f"Warning: missing output for shard(s) {', '.join(map(str, missing))} of {count}")
+
+    def items():
+        for key in sorted(outputs):
+            count = 0
+            for item in iter_json_array(outputs[key]):
+                count += 1
+                yield item
+            print(f"[shards] {key[0]}-of-{key[1]}: {count} definitions")
+
+    written = write_json_array(output_file, items())
+    print(f"Merged {len(outputs)} shard(s) into {output_file}")
+    return written
+
 
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Combine all extracted-definition JSON files into one output file"
+    )
+    p.add_argument(
+        "--indir", default="json",
+        help="Directory containing extract-definitions_*.json files"
+    )
+    p.add_argument(
+        "--output", default=os.path.join('data', 'output.json'),
+        help="Where to write the merged JSON (default: data/output.json)"
+    )
+    p.add_argument(
+        "--duplicates", default=DUPLICATES,
+        help="Cases scrape_pdf_text found to share another case's text; their "
+             "definitions are copied from that case (default: %(default)s)"
+    )
+    p.add_argument(
+        "--store", default=None,
+        help="Merge the definitions in this artifact store instead of --indir"
+    )
+    p.add_argument(
+        "--links", default=None,
+        help="Only merge definitions of cases in this link list, e.g. the one scrape_links wrote for a selection"
+    )
+    p.add_argument(
+        "--batches", default=os.path.join("data", "extracted_batches"),
+        help="With --links, directory of the pdf_texts batches the definitions were extracted from"
+    )
+    args = p.parse_args(argv)
 
-def main():
-    input_folder = 'json'
-    output_file = os.path.join('data', 'output.json') 
+    keep = None
+    if args.links:
+        keys = sel.link_keys(args.links)
+        if args.store:
+            keep = lambda key: key in keys
+        else:
+            keep = lambda filename: sel.batch_key(filename, args.batches) in keys
+        print(f"[select] Merging only definitions of the {len(keys)} links in {args.links}")
 
-    combine_json_files(input_folder, output_file)
+    duplicates = load_duplicates(args.duplicates)
+    if args.store:
+        with st.ArtifactStore(args.store) as store:
+            written, skipped = combine_json_files(args.indir, args.output, duplicates, store,
+                                                  keep) or (0, 0)
+    else:
+        written, skipped = combine_json_files(args.indir, args.output, duplicates,
+                                              keep=keep) or (0, 0)
+    return {"items": written, "skipped": 0, "failed": skipped}
 
 if __name__ == '__main__':
     main()
@@ -25,46 +25,134 @@ import argparse
 import glob
 import re
 import os
-import google.generativeai as genai
-
-gemini_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=gemini_key)
+from utils import artifact_store as st
+from utils import gemini
+from utils import manifest as mf
+from utils import selection as sel
 
 DEFAULT_MODEL = "gemini-2.0-flash"
 
-model = genai.GenerativeModel(model_name=DEFAULT_MODEL)
+# Built on first use; importing google.generativeai takes most of a second
+model = None
+
+SECTIONS_PROMPT = (
+    "For text which I will provide, search for the first instance of the words market definition. "
+    "Starting from a line before the first instance of the words market definition extract ONLY the market definition section. "
+    "You can find when the market definition section starts as that is a line before the first instance of the words market definition. "
+    "You can see when the market definition section ends as that is when you will see another heading. "
+    "You might see some subheadings, but do not stop at the subheadings. Instead, stop at the heading. "
+    "This heading typically follows the bullet point pattern of the first instance of market definition. "
+    "For example, if the first instance of market definition is the following \"A. Market Definition\" then the next heading which you would stop at would be \"B. (Insert heading here)\". "
+    "If the first instance of market definition was \"IV. Market Definition\" then the next heading which you would stop at would be \"V. (Insert heading here)\". "
+    "Do not include the text of the heading which you stop at in the final output. "
+    "Also, at the very start of the document, you will find the words \"Case Number:\" followed by the case number, the word \"Year:\" followed by the year, "
+    "the phrase \"Policy Area:\" followed by the policy area, and the word \"Link:\" followed by the link. "
+    "Make sure that you keep the same exact case number, year, policy area, and link in your output. "
+    "You should have it so that at the top of your output file the case number, year, policy area, and link are listed. "
+    "Now, based on what I just told you, extract only the market definition sections (and the case number, year, policy area, and link) from the following text:\n\n"
+)
+
+def load_model(model_name=DEFAULT_MODEL):
+    """
+    Configure the Gemini client from GEMINI_API_KEY and build a model.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(model_name=model_name)
+
+
+def get_model():
+    """
+    The module-wide default model, built on first use.
+    """
+    global model
+    if model is None:
+        model = load_model(DEFAULT_MODEL)
+    return model
+
+
+def extract_section_text(text, gemini_model=None, limiter=None):
+    """
+    Send one batch text (header + PDF text) to Gemini with the
+    market-definition prompt and return the extracted section. The call
+    waits for `limiter`, if given, and retries 429/5xx errors.
+    """
+    response = gemini.generate(gemini_model or get_model(), SECTIONS_PROMPT + text, limiter)
+    return response.text
+
 
-def extract_sections(input_path, output_path):
+def extract_sections(input_path, output_path, gemini_model=None, limiter=None):
     """
     Read input_path, send to Gemini with the market-definition prompt,
     and write the extracted section to output_path.
     """
     text = open(input_path, encoding="utf-8").read()
-    prompt = (
-        "For text which I will provide, search for the first instance of the words market definition. "
-        "Starting from a line before the first instance of the words market definition extract ONLY the market definition section. "
-        "You can find when the market definition section starts as that is a line before the first instance of the words market definition. "
-        "You can see when the market definition section ends as that is when you will see another heading. "
-        "You might see some subheadings, but do not stop at the subheadings. Instead, stop at the heading. "
-        "This heading typically follows the bullet point pattern of the first instance of market definition. "
-        "For example, if the first instance of market definition is the following \"A. Market Definition\" then the next heading which you would stop at would be \"B. (Insert heading here)\". "
-        "If the first instance of market definition was \"IV. Market Definition\" then the next heading which you would stop at would be \"V. (Insert heading here)\". "
-        "Do not include the text of the heading which you stop at in the final output. "
-        "Also, at the very start of the document, you will find the words \"Case Number:\" followed by the case number, the word \"Year:\" followed by the year, "
-        "the phrase \"Policy Area:\" followed by the policy area, and the word \"Link:\" followed by the link. "
-        "Make sure that you keep the same exact case number, year, policy area, and link in your output. "
-        "You should have it so that at the top of your output file the case number, year, policy area, and link are listed. "
-        "Now, based on what I just told you, extract only the market definition sections (and the case number, year, policy area, and link) from the following text:\n\n"
-        + text
-    )
-    response = model.generate_content([prompt])
+    section = extract_section_text(text, gemini_model, limiter)
     os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
     with open(output_path, 'w', encoding='utf-8') as fo:
-        fo.write(response.text)
+        fo.write(section)
     print(f"[chunks] Wrote extracted sections → {os.path.basename(output_path)}")
 
 
-def main():
+def plan_file(input_path, args, manifest=None):
+    """
+    Decide whether one pdf_texts batch file needs sending to Gemini.
+    Returns (input_path, output_path, input_hash) if it does, "skipped"
+    if the manifest shows the same text was already sent with the same
+    prompt and model, or None if the file name does not match.
+    """
+    fname = os.path.basename(input_path)
+    match = re.search(r"pdf_texts_(\d+)_batch_(\d+)\.txt$", fname)
+    if not match:
+        return
+    size_label, batch_num = match.group(1), match.group(2)
+
+    out_fname = f"extract-sections_{size_label}_batch_{batch_num}.txt"
+    output_path = os.path.join(args.outdir, out_fname)
+
+    input_hash = mf.hash_text(mf.file_hash(input_path, manifest), SECTIONS_PROMPT, args.model)
+    if mf.lookup(manifest, out_fname, input_hash):
+        print(f"[chunks] Unchanged {fname}; keeping {out_fname}")
+        return "skipped"
+
+    print(f"[chunks] Processing {fname} → {out_fname}")
+    return input_path, output_path, input_hash
+
+
+def plan_stored(store, key, args, manifest=None):
+    """
+    plan_file for a batch kept in the artifact store, whose section is
+    stored under the same key. Returns (key, batch text, input_hash) or
+    "skipped".
+    """
+    input_hash = mf.hash_text(store.digest(st.BATCHES, key), SECTIONS_PROMPT, args.model)
+    if mf.lookup(manifest, key, input_hash) and store.digest(st.SECTIONS, key):
+        print(f"[chunks] Unchanged {key}")
+        return "skipped"
+
+    print(f"[chunks] Processing {key}")
+    return key, store.get(st.BATCHES, key), input_hash
+
+
+def run_tasks(tasks, work, record, workers):
+    """
+    Run work(task) for each task in up to `workers` threads, calling
+    record(task, result) in this thread as each one finishes. The
+    manifest and the store are only touched from this thread. Returns
+    the outcome of each task: "done" or "failed".
+    """
+    outcomes = []
+    for task, result, error in gemini.run_concurrently(work, tasks, workers):
+        if error is not None:
+            print(f"[chunks] Failed {os.path.basename(str(task[0]))}: {error}")
+            outcomes.append("failed")
+            continue
+        record(task, result)
+        outcomes.append("done")
+    return outcomes
+
+
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Batch-extract market-definition sections from pdf_texts files using Gemini"
     )
@@ -84,11 +172,40 @@ def main():
         "--model", default=DEFAULT_MODEL,
         help="Gemini model to use (default: %(default)s)"
     )
-    args = p.parse_args()
+    p.add_argument(
+        "--manifest", default=None,
+        help="Manifest file; batches whose text, prompt and model are unchanged are skipped"
+    )
+    p.add_argument(
+        "--store", default=None,
+        help="Artifact store to read batches from and write sections to, instead of --indir/--outdir"
+    )
+    p.add_argument(
+        "--links", default=None,
+        help="Only batches of cases in this link list, e.g. the one scrape_links wrote for a selection"
+    )
+    p.add_argument(
+        "--llm-workers", type=int, default=gemini.CONCURRENCY,
+        help="Batches sent to Gemini at once (default: %(default)s)"
+    )
+    p.add_argument(
+        "--rpm", type=int, default=gemini.RPM,
+        help="Requests per minute to stay under (default: %(default)s)"
+    )
+    p.add_argument(
+        "--tpm", type=int, default=gemini.TPM,
+        help="Input tokens per minute to stay under (default: %(default)s)"
+    )
+    args = p.parse_args(argv)
 
-    global model
-    if args.model != DEFAULT_MODEL:
-        model = genai.GenerativeModel(model_name=args.model)
+    # passed down rather than kept in module globals, as run_pipeline runs
+    # the 79 and 80 sizes side by side in this interpreter; None is the
+    # default model, built on first use
+    gemini_model = load_model(args.model) if args.model != DEFAULT_MODEL else None
+    limiter = gemini.shared_limiter(args.model, args.rpm, args.tpm)
+
+    if args.store:
+        return run_store(args, gemini_model, limiter)
 
     if not os.path.isdir(args.indir):
         print(f"Error: indir not found: {args.indir}")
@@ -102,23 +219,79 @@ def main():
         pattern = os.path.join(args.indir, f"pdf_texts_{size}_batch_*.txt")
         all_files.extend(sorted(glob.glob(pattern)))
 
+    if args.links:
+        keys = sel.link_keys(args.links)
+        all_files = [path for path in all_files if sel.header_key(path) in keys]
+        print(f"[select] {len(all_files)} batches of cases in {args.links}")
+
     if not all_files:
         print(f"No files matched size={args.size} in {args.indir}")
         return
 
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+
     # process matching files and save relevant information
-    for input_path in all_files:
-        fname = os.path.basename(input_path)
-        match = re.search(r"pdf_texts_(\d+)_batch_(\d+)\.txt$", fname)
-        if not match:
-            continue
-        size_label, batch_num = match.group(1), match.group(2)
+    outcomes = []
+    try:
+        tasks = []
+        for input_path in all_files:
+            task = plan_file(input_path, args, manifest)
+            if isinstance(task, tuple):
+                tasks.append(task)
+            else:
+                outcomes.append(task)
+
+        def record(task, _):
+            _, output_path, input_hash = task
+            mf.record(manifest, os.path.basename(output_path), input_hash, [output_path])
+
+        outcomes += run_tasks(tasks, lambda task: extract_sections(*task[:2], gemini_model, limiter),
+                              record, args.llm_workers)
+    finally:
+        if manifest is not None:
+            mf.save_manifest(manifest, args.manifest)
+
+    return {"items": outcomes.count("done"), "skipped": outcomes.count("skipped"),
+            "failed": outcomes.count("failed")}
+
+def run_store(args, gemini_model=None, limiter=None):
+    sizes = [args.size] if args.size in ["79","80"] else ["79","80"]
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+    outcomes = []
+    with st.ArtifactStore(args.store) as store:
+        keys = [key for key, meta in store.items(st.BATCHES) if meta.get("size") in sizes]
+        if args.links:
+            selected = sel.link_keys(args.links)
+            keys = [key for key in keys if key in selected]
+            print(f"[select] {len(keys)} batches of cases in {args.links}")
+        if not keys:
+            print(f"No batches matched size={args.size} in {args.store}")
+            return
+
+        def tasks():
+            # drawn lazily, so only the batches in flight are held in memory
+            for key in keys:
+                task = plan_stored(store, key, args, manifest)
+                if task == "skipped":
+                    outcomes.append(task)
+                else:
+                    yield task
+
+        def record(task, section):
+            key, _, input_hash = task
+            store.put(st.SECTIONS, key, section)
+            mf.record(manifest, key, input_hash)
 
-        out_fname = f"extract-sections_{size_label}_batch_{batch_num}.txt"
-        output_path = os.path.join(args.outdir, out_fname)
+        try:
+            outcomes += run_tasks(tasks(),
+                                  lambda task: extract_section_text(task[1], gemini_model, limiter),
+                                  record, args.llm_workers)
+        finally:
+            if manifest is not None:
+                mf.save_manifest(manifest, args.manifest)
 
-        print(f"[chunks] Processing {fname} → {out_fname}")
-        extract_sections(input_path, output_path)
+    return {"items": outcomes.count("done"), "skipped": outcomes.count("skipped"),
+            "failed": outcomes.count("failed")}
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
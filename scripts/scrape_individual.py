@@ -25,18 +25,17 @@ import argparse
 import glob
 import re
 import os
-import google.generativeai as genai
+from utils import artifact_store as st
+from utils import gemini
+from utils import jobs
+from utils import manifest as mf
+from utils import selection as sel
+from scripts.scrape_chunks import DEFAULT_MODEL, load_model
 
-gemini_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=gemini_key)
+# Stage name of this script's jobs in a --jobs-db table
+JOB_STAGE = "scrape_individual"
 
-DEFAULT_MODEL = "gemini-2.0-flash"
-
-model = genai.GenerativeModel(model_name=DEFAULT_MODEL)
-
-def generate_content(model, input_text):
-    response = model.generate_content([
-        """
+DEFINITIONS_PROMPT = """
         I will provide you with an excerpt of text from a competition case decision. In this excerpt, you will see many market definitions. I want you to extract
         the entirety of each individual market definition. I want the output to be in a json format. 
         Also, at the very start of the document, you will find the words "Case Number:" followed by the case number, the word "Year:" followed by the year, the phrase "Policy Area:" followed by the policy area, and the word "Link:" followed by the link. Make sure that you keep the same exact case number, year, policy area, and link in the your output. It should be that the case number and link should be above each market definition. Make sure that there is not extra text in the json file, above or below the brackets.
@@ -107,12 +106,93 @@ def generate_content(model, input_text):
         Example: Trimethylolpropane ("TMP") is a polyhydric alcohol that serves, inter alia, as an input into trimethylolpropane branched hydroxyl terminated saturated polyester and it is, thus, a common building block in the polymer industry. Chemtura uses TMP for the production of: (i) resins; (ii) PU-hardeners; and (iii) lubricant products; although it also has other uses.29 (37) The Commission has previously considered whether TMP is part of an overall market for polyhydric alcohols or forms a separate product market but has left the product market definition open.30 It has never considered further segmenting the market for TMP. (38) The Notifying Party considers that TMP is substitutable with other polyhydric alcohols therefore that the relevant market should be defined as including all polyhydric alcohols. Moreover, the Notifying Party submits that it supplies one grade of TMP for all applications.31 (39) A vertically affected market arises in relation to the supply of TMP therefore this market which is therefore considered below in the competitive assessment. (40) For the purpose of the present decision, the exact scope of the product market definition for the supply of TMP can be left open, since no serious doubts as to the compatibility of the Proposed Transaction with the internal market arise even under the narrowest possible market definition (that is TMP).
         Also, the text I provide you might have some words separated by spaces. For example, the word "example" might be displayed as "exa mple". If you see any words like that, remove the space or spaces that are separating both parts of the word and put the word back together. If there are two words that are spelled correctly, and are separated by a space, do not remove the space or spaces. Only put word fragments together if you know that by putting the fragments together, it fixes the word. Lastly, the relevant market definition is always at least 4 sentences long, but never longer than 12 sentences. Also, it is typically the ending part of a certain topic or product.
         Now, based on what I just told you, extract all of the individual relevant market definitions from the following text:
-        """ + input_text
-    ])
+        """
+
+def generate_content(model, input_text, limiter=None):
+    # waits for `limiter`, if given, and retries 429/5xx errors
+    response = gemini.generate(model, DEFINITIONS_PROMPT + input_text, limiter)
     return response
 
+def extract_file(path, out_path, model):
+    with open(path, encoding='utf-8') as f:
+        input_text = f.read()
+    response = generate_content(model, input_text)
+    with open(out_path, 'w', encoding='utf-8') as fo:
+        fo.write(response.text)
+
+
+def extract_stored(store, key, model):
+    """
+    extract_file for a section kept in the artifact store; the JSON is
+    stored under the same key.
+    """
+    response = generate_content(model, store.get(st.SECTIONS, key))
+    store.put(st.DEFINITIONS, key, response.text)
+
+
+def section_key(path, batch_dir):
+    """
+    The "<case>|<url>" key of a section file, read from the header of the
+    batch it was extracted from (Gemini's copy of the header may differ),
+    or from its own header if that batch is gone.
+    """
+    return sel.batch_key(path, batch_dir) or sel.header_key(path)
+
+
+def run_jobs(tasks, jobs_db, model_name=DEFAULT_MODEL, retry=False, store=None):
+    """
+    Work through (path, out_path, input_hash) tasks via the job table in
+    `jobs_db`, so a crash loses at most the file being processed and
+    several workers can share the section files. With a `store`, path
+    and out_path are both the key of a section in it. The `model_name`
+    model is only built once a job has been claimed.
+    """
+    conn = jobs.connect(jobs_db)
+    jobs.enqueue(conn, JOB_STAGE, [
+        (os.path.basename(out_path) if store is None else out_path, input_hash,
+         {"path": path, "out": out_path})
+        for path, out_path, input_hash in tasks
+    ])
+    if retry:
+        jobs.retry_failed(conn, JOB_STAGE)
+
+    worker = jobs.worker_id()
+    model = None
+    done = 0
+    touched, failed = set(), set()
+    with jobs.Heartbeat(jobs_db, JOB_STAGE, worker):
+        while True:
+            job = jobs.claim(conn, JOB_STAGE, worker)
+            if job is None:
+                break
+            touched.add(job.key)
+            failed.discard(job.key)
+            path, out_path = job.payload["path"], job.payload["out"]
+            print(f"Processing {os.path.basename(path)} → {job.key} (attempt {job.attempts})")
+            if model is None:
+                model = load_model(model_name)
+            try:
+                if store is None:
+                    extract_file(path, out_path, model)
+                else:
+                    extract_stored(store, path, model)
+            except Exception as e:
+                jobs.fail(conn, job.id, f"Error: {e}")
+                print(f"Failed {job.key}: {e}")
+                failed.add(job.key)
+                continue
+            jobs.finish(conn, job.id, "done", outputs=[out_path] if store is None else [])
+            done += 1
+            print(f"Saved JSON → {job.key}")
+
+    counts = jobs.counts(conn, JOB_STAGE).get(JOB_STAGE, {})
+    conn.close()
+    print("[jobs] " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+    return {"items": done, "skipped": len(tasks) - len(touched), "failed": len(failed)}
+
+
 # find input files with extracted sections
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="Batch-extract each market definition as JSON from section files using Gemini"
     )
@@ -128,39 +208,137 @@ def main():
         "--model", default=DEFAULT_MODEL,
         help="Gemini model to use"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--manifest", default=None,
+        help="Manifest file; sections whose text, prompt and model are unchanged are skipped"
+    )
+    parser.add_argument(
+        "--jobs-db", default=None,
+        help="SQLite job table; progress survives crashes and several workers can share it"
+    )
+    parser.add_argument(
+        "--retry-failed", action="store_true",
+        help="With --jobs-db, give files that failed every attempt another try"
+    )
+    parser.add_argument(
+        "--store", default=None,
+        help="Artifact store to read sections from and write definitions to, instead of --indir/--outdir"
+    )
+    parser.add_argument(
+        "--links", default=None,
+        help="Only sections of cases in this link list, e.g. the one scrape_links wrote for a selection"
+    )
+    parser.add_argument(
+        "--batches", default=os.path.join("data", "extracted_batches"),
+        help="With --links, directory of the pdf_texts batches the sections were extracted from"
+    )
+    args = parser.parse_args(argv)
 
-    global model
-    if args.model != DEFAULT_MODEL:
-        model = genai.GenerativeModel(model_name=args.model)
+    if args.store:
+        with st.ArtifactStore(args.store) as store:
+            return run_store(store, args)
 
     os.makedirs(args.indir, exist_ok=True)
     os.makedirs(args.outdir, exist_ok=True)
 
     pattern = os.path.join(args.indir, 'extract-sections_*_batch_*.txt')
     files = sorted(glob.glob(pattern))
+    if args.links:
+        keys = sel.link_keys(args.links)
+        files = [path for path in files if section_key(path, args.batches) in keys]
+        print(f"[select] {len(files)} sections of cases in {args.links}")
+
     if not files:
         print(f"No section files found in {args.indir} matching pattern")
         return
 
+    if args.jobs_db:
+        # the job table records inputs and outputs itself, so no manifest is needed
+        tasks = []
+        for path in files:
+            m = re.search(r"extract-sections_(\d+)_batch_(\d+)\.txt$", os.path.basename(path))
+            if m:
+                out_fname = f"extract-definitions_{m.group(1)}_batch_{m.group(2)}.json"
+                input_hash = mf.hash_text(mf.file_hash(path), DEFINITIONS_PROMPT, args.model)
+                tasks.append((path, os.path.join(args.outdir, out_fname), input_hash))
+        return run_jobs(tasks, args.jobs_db, args.model, args.retry_failed)
+
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+
     # extract definitions with Gemini and save as JSON with metadata
-    for path in files:
-        fname = os.path.basename(path)
-
-        m = re.search(r"extract-sections_(\d+)_batch_(\d+)\.txt$", fname)
-        if not m:
-            continue
-        size_label, batch = m.group(1), m.group(2)
-        out_fname = f"extract-definitions_{size_label}_batch_{batch}.json"
-        out_path = os.path.join(args.outdir, out_fname)
-
-        print(f"Processing {fname} → {out_fname}")
-        with open(path, encoding='utf-8') as f:
-            input_text = f.read()
-        response = generate_content(model, input_text)
-        with open(out_path, 'w', encoding='utf-8') as fo:
-            fo.write(response.text)
-        print(f"Saved JSON → {out_fname}")
+    done = skipped = 0
+    try:
+        tasks = []
+        for path in files:
+            fname = os.path.basename(path)
+
+            m = re.search(r"extract-sections_(\d+)_batch_(\d+)\.txt$", fname)
+            if not m:
+                continue
+            size_label, batch = m.group(1), m.group(2)
+            out_fname = f"extract-definitions_{size_label}_batch_{batch}.json"
+            out_path = os.path.join(args.outdir, out_fname)
+
+            input_hash = mf.hash_text(mf.file_hash(path, manifest), DEFINITIONS_PROMPT, args.model)
+            if mf.lookup(manifest, out_fname, input_hash):
+                print(f"Unchanged {fname}; keeping {out_fname}")
+                skipped += 1
+                continue
+            tasks.append((path, fname, out_fname, out_path, input_hash))
+
+        # built per run, only when there is something to send
+        model = load_model(args.model) if tasks else None
+        for path, fname, out_fname, out_path, input_hash in tasks:
+            print(f"Processing {fname} → {out_fname}")
+            extract_file(path, out_path, model)
+            mf.record(manifest, out_fname, input_hash, [out_path])
+            done += 1
+            print(f"Saved JSON → {out_fname}")
+    finally:
+        if manifest is not None:
+            mf.save_manifest(manifest, args.manifest)
+
+    return {"items": done, "skipped": skipped, "failed": 0}
+
+def run_store(store, args):
+    keys = [key for key, _ in store.items(st.SECTIONS)]
+    if args.links:
+        selected = sel.link_keys(args.links)
+        keys = [key for key in keys if key in selected]
+        print(f"[select] {len(keys)} sections of cases in {args.links}")
+    if not keys:
+        print(f"No sections found in {args.store}")
+        return
+
+    def input_hash(key):
+        return mf.hash_text(store.digest(st.SECTIONS, key), DEFINITIONS_PROMPT, args.model)
+
+    if args.jobs_db:
+        return run_jobs([(key, key, input_hash(key)) for key in keys], args.jobs_db,
+                        args.model, args.retry_failed, store)
+
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+    done = skipped = 0
+    try:
+        tasks = []
+        for key in keys:
+            digest = input_hash(key)
+            if mf.lookup(manifest, key, digest) and store.digest(st.DEFINITIONS, key):
+                print(f"Unchanged {key}")
+                skipped += 1
+                continue
+            tasks.append((key, digest))
+
+        model = load_model(args.model) if tasks else None
+        for key, digest in tasks:
+            print(f"Processing {key}")
+            extract_stored(store, key, model)
+            mf.record(manifest, key, digest)
+            done += 1
+    finally:
+        if manifest is not None:
+            mf.save_manifest(manifest, args.manifest)
+    return {"items": done, "skipped": skipped, "failed": 0}
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -23,36 +23,196 @@
 
 import argparse
 import os
-import pandas as pd
+import random
 import re
+import time
+from utils import manifest as mf
+from utils import selection as sel
+from utils.links import LinkWriter, read_links, write_links
+from utils.register import CACHE_DIR, load_register
+
+# "Decision text: EN published on DD.MM.YYYY - <url>" and "Decision text: EN - <url>"
+DATED_LINK_RE = re.compile(
+    r"Decision text: EN published on \d{2}\.\d{2}\.\d{4} - "
+    r"(https://ec\.europa\.eu/competition/[^ \n]*\.pdf)")
+UNDATED_LINK_RE = re.compile(
+    r"Decision text: EN - "
+    r"(https://ec\.europa\.eu/competition/[^ \n]*\.pdf)")
+
+# YYYY from a DD.MM.YYYY date
+YEAR_RE = re.compile(r"\d{2}\.\d{2}\.(\d{4})")
+
+# Full link list of the register last read with --since-previous
+SNAPSHOT = os.path.join("data", "register_snapshot.jsonl")
+
+# URL path part → policy area; the first match wins
+POLICY_AREAS = (
+    ("/mergers/", "Merger"),
+    ("/antitrust/", "Antitrust & Cartels"),
+    ("/state_aid/", "State Aid"),
+    ("/digital_markets_act/", "Digital Markets Act"),
+    ("/foreign_subsidies/", "Foreign Subsidies"),
+)
 
 def get_policy_area(link):
     """
     Determine the policy area from the URL path.
     """
-    if "/mergers/" in link:
-        return "Merger"
-    elif "/antitrust/" in link:
-        return "Antitrust & Cartels"
-    elif "/state_aid/" in link:
-        return "State Aid"
-    elif "/digital_markets_act/" in link:
-        return "Digital Markets Act"
-    elif "/foreign_subsidies/" in link:
-        return "Foreign Subsidies"
-    else:
-        return "Unknown"
-
-def main():
+    for part, area in POLICY_AREAS:
+        if part in link:
+            return area
+    return "Unknown"
+
+def policy_areas(links):
+    """
+    get_policy_area for a whole Series of links at once.
+    """
+    import numpy as np
+    return np.select([links.str.contains(part, regex=False).to_numpy(dtype=bool)
+                      for part, _ in POLICY_AREAS],
+                     [area for _, area in POLICY_AREAS], default="Unknown")
+
+def extract_links(df):
+    """
+    Every decision link in the register `df`, as (links, cases without
+    links). `links` is a DataFrame of case_number, year (a string, NaN if
+    the date has none), policy_area and link, in register order; within
+    a case dated links come before undated ones.
+    """
+    import pandas as pd
+
+    df = df.reset_index(drop=True)
+    decisions = df['Decisions'].fillna("").astype(str)
+    found = pd.concat(
+        [decisions.str.extractall(DATED_LINK_RE)[0], decisions.str.extractall(UNDATED_LINK_RE)[0]],
+        keys=[0, 1], names=["kind", "row", "match"],
+    ).reset_index().sort_values(["row", "kind", "match"], kind="stable")
+
+    rows = found["row"].to_numpy(dtype=int)
+    years = df['Last decision date'].astype(str).str.extract(YEAR_RE, expand=False)
+    links = pd.DataFrame({
+        "case_number": df['Case number'].to_numpy()[rows],
+        "year": years.to_numpy()[rows],
+        "policy_area": policy_areas(found[0]),
+        "link": found[0].to_numpy(),
+    })
+    without = df['Case number'][~df.index.isin(rows)].tolist()
+    return links, without
+
+def diff_links(previous, current):
+    """
+    Compare two lists of (case_number, year, policy_area, link), keyed by
+    (case_number, link). Returns (added, changed, removed): links only in
+    `current`, links in both whose other fields differ (as in `current`),
+    and links only in `previous`.
+    """
+    before = {(str(c), l): (str(c), y, a, l) for c, y, a, l in previous}
+    after = {(str(c), l): (str(c), y, a, l) for c, y, a, l in current}
+    added = [link for key, link in after.items() if key not in before]
+    changed = [link for key, link in after.items() if key in before and before[key] != link]
+    removed = [link for key, link in before.items() if key not in after]
+    return added, changed, removed
+
+def _extract_rowwise(df):
+    # the row-by-row extraction extract_links replaced; kept as the
+    # baseline the benchmark checks and times it against
+    links, without = [], []
+    for _, row in df.iterrows():
+        decision_text = row['Decisions'] if isinstance(row['Decisions'], str) else ""
+        m = YEAR_RE.search(str(row['Last decision date']))
+        found = DATED_LINK_RE.findall(decision_text) + UNDATED_LINK_RE.findall(decision_text)
+        if not found:
+            without.append(row['Case number'])
+        for link in found:
+            links.append((row['Case number'], m.group(1) if m else None, get_policy_area(link), link))
+    return links, without
+
+def synthetic_register(rows, seed=0):
+    """
+    A register DataFrame shaped like cases.xlsx with `rows` random cases:
+    dated and undated links in every policy area, several links per case,
+    and some cases without any.
+    """
+    import pandas as pd
+
+    rng = random.Random(seed)
+    paths = [part.strip("/") for part, _ in POLICY_AREAS] + ["other"]
+    decisions, cases, dates = [], [], []
+    for n in range(rows):
+        date = f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1990, 2025)}"
+        parts = []
+        for k in range(rng.choice([0, 1, 1, 1, 2, 3])):
+            url = f"https://ec.europa.eu/competition/{rng.choice(paths)}/cases/{n}_{k}.pdf"
+            parts.append(f"Decision text: EN published on {date} - {url}" if rng.random() < 0.5
+                         else f"Decision text: EN - {url}")
+            parts.append(f"Decision text: FR - {url[:-4]}_fr.pdf")
+        decisions.append("\n".join(parts) if parts or rng.random() < 0.5 else None)
+        cases.append(f"M.{n}")
+        dates.append(date if rng.random() < 0.95 else "")
+    return pd.DataFrame({"Decisions": decisions, "Case number": cases, "Last decision date": dates})
+
+def bench(rows):
+    """
+    Time extract_links against the row-by-row loop on a synthetic register
+    of `rows` cases, and check they find the same links.
+    """
+    df = synthetic_register(rows)
+
+    start = time.perf_counter()
+    expected, expected_without = _extract_rowwise(df)
+    rowwise = time.perf_counter() - start
+
+    start = time.perf_counter()
+    links, without = extract_links(df)
+    vectorized = time.perf_counter() - start
+
+    got = [(c, None if not isinstance(y, str) else y, a, l) for c, y, a, l in links.itertuples(index=False)]
+    return {
+        "rows": rows,
+        "links": len(got),
+        "rowwise_seconds": round(rowwise, 3),
+        "vectorized_seconds": round(vectorized, 3),
+        "speedup": round(rowwise / vectorized, 1) if vectorized else None,
+        "same": got == expected and without == expected_without,
+    }
+
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Extract case links from an Excel file")
     p.add_argument(
-        "-i", "--input", required=True,
+        "-i", "--input",
         help="Path to the Excel file (e.g. data/cases.xlsx)")
     p.add_argument(
-        "-o", "--output", required=True,
-        help="Where to save the extracted links (e.g. data/extracted_links.txt)")
-    args = p.parse_args()
+        "-o", "--output",
+        help="Where to save the extracted links as JSON Lines (e.g. data/extracted_links.jsonl)")
+    p.add_argument(
+        "--manifest", default=None,
+        help="Manifest file; the register is not re-read if it is unchanged since the last run")
+    p.add_argument(
+        "--register-cache", default=CACHE_DIR,
+        help="Where a columnar copy of the workbook is kept for the next run (default: %(default)s)")
+    p.add_argument(
+        "--no-register-cache", action="store_true",
+        help="Read the workbook itself, without using or writing the copy")
+    p.add_argument(
+        "--since-previous", nargs="?", const=SNAPSHOT, default=None, metavar="SNAPSHOT",
+        help="Only write links added or changed since the register kept in SNAPSHOT "
+             "(default: %(const)s), then keep this register there for next time")
+    sel.add_arguments(p)
+    p.add_argument(
+        "--bench", type=int, metavar="ROWS", default=None,
+        help="Instead, time link extraction on a synthetic register of ROWS cases")
+    args = p.parse_args(argv)
+
+    if args.bench:
+        result = bench(args.bench)
+        print(f"[bench] {result['rows']} rows, {result['links']} links: "
+              f"row by row {result['rowwise_seconds']:.2f}s, vectorized "
+              f"{result['vectorized_seconds']:.2f}s ({result['speedup']}x); "
+              f"{'same' if result['same'] else 'DIFFERENT'} links")
+        return result
+    if not args.input or not args.output:
+        p.error("-i/--input and -o/--output are required")
 
     # debugging
     print(f"Current Working Directory: {os.getcwd()}")
@@ -62,10 +222,27 @@ def main():
         print(f"Error: The file {args.input} does not exist.")
         return
 
-    # oad excel file
-    df = pd.read_excel(args.input)
+    selection = sel.from_args(args)
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+    digest = mf.file_hash(args.input, manifest)
+    # a delta, a selection and the full list of one workbook are different outputs
+    input_hash = digest
+    if args.since_previous or selection:
+        parts = [digest, bool(args.since_previous), sel.describe(selection)]
+        if args.since_previous and os.path.exists(args.since_previous):
+            # a delta is taken against the snapshot, which every delta run rewrites
+            parts.append(mf.file_hash(args.since_previous, manifest))
+        input_hash = mf.hash_text(*parts)
+    if mf.lookup(manifest, args.output, input_hash):
+        print(f"[scrape-links] {args.input} unchanged; keeping {args.output}")
+        mf.save_manifest(manifest, args.manifest)
+        return {"items": 0, "skipped": 1, "failed": 0}
+
+    # only the three columns used are read, or loaded from a columnar
+    # copy made the last time this workbook was read
+    df = load_register(args.input, None if args.no_register_cache else args.register_cache,
+                       digest=digest)
     print("File loaded successfully.")
-    df.columns = df.columns.str.strip()
     print("Column Names:", list(df.columns))
 
     # make sure required columns exist
@@ -75,47 +252,60 @@ def main():
         print(f"Error: Missing required columns: {missing}")
         return
 
-    all_links = []
-
-    # extract links and metadata
-    for idx, row in df.iterrows():
-        decision_text = row['Decisions'] or ""
-        case_number    = row['Case number']
-        date_str       = str(row['Last decision date'])
-        # pull YYYY from DD.MM.YYYY
-        m = re.search(r'\d{2}\.\d{2}\.(\d{4})', date_str)
-        year = m.group(1) if m else 'Unknown'
-
-        # filtering out empty case decisions
-        links_with_date = re.findall(
-            r"Decision text: EN published on \d{2}\.\d{2}\.\d{4} - "
-            r"(https://ec\.europa\.eu/competition/[^ \n]*\.pdf)",
-            decision_text
-        )
-        links_without_date = re.findall(
-            r"Decision text: EN - "
-            r"(https://ec\.europa\.eu/competition/[^ \n]*\.pdf)",
-            decision_text
-        )
-        links = links_with_date + links_without_date
-
-        if not links:
-            print(f"No links found for case number {case_number}.")
-            continue
+    links, without = extract_links(df)
+    for case_number in without:
+        print(f"No links found for case number {case_number}.")
 
+    links = [(case_number, int(year) if isinstance(year, str) else None, area, link)
+             for case_number, year, area, link in links.itertuples(index=False)]
+    # the delta is taken against the whole register, and only then narrowed
+    # to the selection, so the snapshot never holds just a slice of it
+    register = links
+    if args.since_previous:
+        previous = []
+        if os.path.exists(args.since_previous):
+            previous = list(read_links(args.since_previous))
+        else:
+            print(f"[delta] No previous register at {args.since_previous}; every link is new")
+        added, changed, removed = diff_links(previous, register)
+        new = {(str(c), l) for c, _, _, l in added + changed}
+        links = [link for link in register if (str(link[0]), link[3]) in new]
+        print(f"[delta] {len(added)} added, {len(changed)} changed, {len(removed)} removed "
+              f"since {args.since_previous}")
+    if selection:
+        links = sel.select(selection, links)
+        print(f"[select] {len({c for c, _, _, _ in links})} cases, {len(links)} links "
+              f"({sel.describe(selection)})")
+
+    # written and flushed a line at a time, so scrape_pdf_text --follow
+    # can start downloading before the whole list is out
+    with LinkWriter(args.output) as out:
         for link in links:
-            area = get_policy_area(link)
-            all_links.append((case_number, year, area, link))
+            out.write(*link)
 
     # summary of links
-    with open(args.output, 'w') as fo:
-        for case, year, area, link in all_links:
-            fo.write(f"Case Number: {case}\n")
-            fo.write(f"Year: {year}\n")
-            fo.write(f"Policy Area: {area}\n")
-            fo.write(f"Link: {link}\n\n")
-
-    print(f"[scrape-links] Extracted {len(all_links)} links → {args.output}")
+    print(f"[scrape-links] Extracted {out.count} links → {args.output}")
+
+    if args.since_previous:
+        # only once the delta is out, so a failed run is diffed again next time;
+        # new or changed links the selection left out keep their previous
+        # state, so the next delta still offers them
+        written = {(str(c), l) for c, _, _, l in links}
+        before = {(str(link[0]), link[3]): link for link in previous}
+        snapshot = []
+        for link in register:
+            key = (str(link[0]), link[3])
+            if key in new and key not in written:
+                link = before.get(key)
+            if link is not None:
+                snapshot.append(link)
+        write_links(args.since_previous, snapshot)
+
+    if manifest is not None:
+        mf.record(manifest, args.output, input_hash, [args.output])
+        mf.save_manifest(manifest, args.manifest)
+
+    return {"items": out.count, "skipped": 0, "failed": 0}
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -22,10 +22,34 @@
 # ------------------------------------------------------------------------------------------
 
 import argparse
+import hashlib
+import json
 import os
-import requests
-from PyPDF2 import PdfReader
-from io import BytesIO
+import re
+import tempfile
+from functools import partial
+from utils import artifact_store as st
+from utils import downloader as dl
+from utils import jobs
+from utils import links as lk
+from utils import manifest as mf
+from utils import market_section as ms
+from utils import parse_pool as pp
+from utils import selection as sel
+from utils.pdf_backends import BACKENDS, DEFAULT_BACKEND, open_pdf
+from utils.pdf_cache import CACHE_DIR, MAX_BYTES, PdfCache
+from utils.range_reader import open_ranged
+from utils.sharding import in_shard, shard_arg
+
+# Stage name of this script's jobs in a --jobs-db table
+JOB_STAGE = "scrape_pdf_text"
+
+# Written next to the case lists: the cases whose text is the same as an
+# earlier case's, by that case's link, for json_merge to fan out
+DUPLICATES_FILE = "duplicate_cases.json"
+
+# Job table note on a case finished as a duplicate of another link
+DUPLICATE_OF = "Duplicate of "
 
 # Exclude PDFs with these phrases
 EXCLUSION_PHRASES = [
@@ -36,131 +60,875 @@ EXCLUSION_PHRASES = [
     "Merger Regulation and Article 57 of the EEA Agreement"
 ]
 
-def get_pdf_text(url):
+# Only documents of exactly this many pages are checked for the phrases
+EXCLUSION_PAGES = 3
+
+# All phrases in one case-insensitive pass
+EXCLUSION_RE = re.compile("|".join(re.escape(p) for p in EXCLUSION_PHRASES), re.IGNORECASE)
+
+# A phrase may straddle a page break; this much of the previous page is
+# searched again together with the next one
+_PHRASE_OVERLAP = max(map(len, EXCLUSION_PHRASES))
+
+# PDFs with at least this many pages are split into page ranges that are
+# parsed in parallel and joined again in page order
+FAN_OUT_PAGES = 100
+
+# ...but never into ranges shorter than this
+MIN_RANGE_PAGES = 20
+
+# Downloaded PDFs up to this size are read into memory; larger ones are
+# handed to the parser by path and read from a memory map
+MAX_IN_MEMORY = 16 << 20
+
+def extract_text(content, backend=DEFAULT_BACKEND):
+    """
+    (full text, page count) of the PDF given as bytes or as a path.
+    """
+    return extract_pages((content, 0, None), backend)
+
+
+def extract_pages(part, backend=DEFAULT_BACKEND):
+    """
+    (text of pages start..stop-1, total page count) for a
+    (content, start, stop) part of a PDF; stop=None runs to the end.
+    A whole document that may be excluded is read page by page and
+    abandoned as soon as an exclusion phrase turns up; its text is None.
+    """
+    content, start, stop = part
+    with open_pdf(content, backend) as reader:
+        return _extract(reader, start, stop)
+
+
+def _extract(reader, start=0, stop=None):
+    pages = len(reader.pages)
+    if pages != EXCLUSION_PAGES or (start, stop) != (0, None):
+        return "".join(p.extract_text() or "" for p in reader.pages[start:stop]), pages
+
+    texts = []
+    for page in reader.pages:
+        tail = texts[-1][-_PHRASE_OVERLAP:] if texts else ""
+        texts.append(page.extract_text() or "")
+        if EXCLUSION_RE.search(tail + texts[-1]):
+            return None, pages
+    return "".join(texts), pages
+
+
+def extract_market_section(content, backend=DEFAULT_BACKEND):
+    """
+    (text, page count) of only the market definition section: the pages
+    the PDF outline gives for it (or all pages if it has no such entry)
+    are read until the next heading at the section's level, and just the
+    text from its heading up to there is kept. Without an outline entry or
+    heading, this is the whole document's text, as from extract_text.
+    """
+    with open_pdf(content, backend) as reader:
+        pages = len(reader.pages)
+        if pages == EXCLUSION_PAGES:
+            return extract_text(content, backend)
+
+        start, stop = ms.outline_range(reader) or (0, pages)
+        scanner = ms.SectionScanner()
+        texts = []
+        for page in reader.pages[start:stop]:
+            texts.append(page.extract_text() or "")
+            scanner.feed(texts[-1])
+            if scanner.done:
+                break
+    section = scanner.text()
+    return (section if section is not None else "".join(texts)), pages
+
+
+def page_ranges(pages, workers, fan_out=FAN_OUT_PAGES):
+    """
+    Split `pages` pages into (start, stop) ranges: one below `fan_out`
+    pages, otherwise up to `workers` ranges of at least MIN_RANGE_PAGES.
+    """
+    if pages < fan_out or workers < 2:
+        return [(0, None)]
+    size = max(MIN_RANGE_PAGES, -(-pages // workers))
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
+
+
+def split_pdf(content, workers, fan_out=FAN_OUT_PAGES, backend=DEFAULT_BACKEND):
+    """
+    The parts extract_pages should run on for `content`: a single part,
+    or a list of page-range parts for a large PDF.
+    """
+    if workers < 2:
+        return (content, 0, None)
+    try:
+        with open_pdf(content, backend) as doc:
+            pages = len(doc.pages)
+    except Exception:
+        # let the worker run into (and report) the same error
+        pages = 0
+    ranges = page_ranges(pages, workers, fan_out)
+    if len(ranges) == 1:
+        return (content, 0, None)
+    return [(content, start, stop) for start, stop in ranges]
+
+
+def join_pages(parts):
+    """
+    Reassemble extract_pages results (one, or a list in page order) into
+    (full text, page count).
+    """
+    if isinstance(parts, tuple):
+        return parts
+    return "".join(text for text, _ in parts), parts[0][1]
+
+
+def classify(text, pages):
+    """
+    Returns (text, None), or (None, reason) if the document is excluded:
+    extract_pages found an exclusion phrase (text is None), or a 3-page
+    text from elsewhere contains one.
+    """
+    if text is None or (pages == EXCLUSION_PAGES and EXCLUSION_RE.search(text)):
+        return None, "Excluded by criteria"
+    return text, None
+
+
+def text_kind(mode="full", backend=DEFAULT_BACKEND):
+    """
+    Name of a kind of extracted text, as used for the cache and input
+    hashes: the mode ("full" or "market"), plus the backend unless it is
+    the default one, e.g. "market.pdfminer".
+    """
+    return mode if backend == DEFAULT_BACKEND else f"{mode}.{backend}"
+
+
+def link_hash(case, year, area, url, kind="full", pdf_sha256=None):
+    """
+    Input hash of one case for the manifest and job table; it changes
+    with the kind of extraction, so switching kinds re-extracts, and with
+    the SHA-256 of the PDF when the PdfCache knows it, so a PDF
+    republished under the same URL is extracted again.
+    """
+    return mf.hash_text(case, year, area, url, *([kind] if kind != "full" else []),
+                        *([pdf_sha256] if pdf_sha256 else []))
+
+
+def cached_sha256(cache, url):
+    """
+    SHA-256 of the copy of `url` in `cache`, or None if there is none.
+    """
+    meta = cache.meta(url) if cache is not None else None
+    return meta.get("sha256") if meta else None
+
+
+def pdf_source(path, max_in_memory=MAX_IN_MEMORY):
+    """
+    What to parse for the PDF saved at `path`: its bytes if it is no
+    larger than `max_in_memory`, otherwise the path itself.
+    """
+    if os.path.getsize(path) > max_in_memory:
+        return path
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def is_pdf(data):
+    """
+    True if download_pdf's data still needs parsing (bytes or a path),
+    rather than being cached (text, page count).
+    """
+    return isinstance(data, (bytes, str))
+
+
+def triage_pdf(url, downloader, backend=DEFAULT_BACKEND):
+    """
+    Read the trailer, cross-reference table and page tree of the PDF at
+    `url` with HTTP Range requests, and for a document of EXCLUSION_PAGES
+    pages go on to extract its text (stopping at an exclusion phrase)
+    from the byte ranges its pages use.
+    Returns (text or None, page count) for such a document, or None if
+    the PDF is to be downloaded in full: it has another page count, the
+    server does not support Range requests, or reading it lazily failed.
+    """
+    try:
+        f = open_ranged(url, downloader)
+        if f is None:
+            return None
+        with open_pdf(f, backend) as reader:
+            if len(reader.pages) != EXCLUSION_PAGES:
+                return None
+            result = _extract(reader)
+    except Exception:
+        return None
+    print(f"[triage] {url}: {f.fetched} of {f.size} bytes in {f.requests} requests")
+    return result
+
+
+def download_pdf(url, downloader=None, cache=None, kind="full", max_in_memory=MAX_IN_MEMORY,
+                 triage=False):
+    """
+    Fetch the PDF at `url` through `downloader` (default: the shared one),
+    which pools connections, times out and retries 429/5xx with backoff.
+    The body is streamed to disk: into the PdfCache if there is one (so
+    unchanged PDFs are not downloaded again), else into a temporary file.
+    Returns (data, None), where data is the PDF's bytes, or its path if
+    it is larger than `max_in_memory`, or its (text, page count) if the
+    cache already holds that `kind` of text; or (None, reason) if it could
+    not be fetched. A temporary path is the caller's to remove.
+    With `triage`, PDFs not in the cache are first tried with triage_pdf,
+    and only downloaded in full if it cannot decide them; its text is
+    returned as (text, page count) but not cached.
+    """
+    try:
+        downloader = downloader or dl.shared_downloader()
+        if triage and not (cache and (cache.offline or cache.meta(url))):
+            mode, _, backend = kind.partition(".")
+            triaged = triage_pdf(url, downloader, backend or DEFAULT_BACKEND)
+            if triaged:
+                return triaged, None
+
+        if cache is None:
+            fd, path = tempfile.mkstemp(prefix="lextract-", suffix=".pdf")
+            os.close(fd)
+            data = None
+            try:
+                resp, _ = downloader.download(url, path)
+                if resp.status_code != 200:
+                    return None, f"HTTP {resp.status_code}"
+                data = pdf_source(path, max_in_memory)
+                return data, None
+            finally:
+                if data != path:
+                    _remove(path)
+
+        return cached_pdf(url, cache.fetch(url, downloader), cache, kind, max_in_memory)
+    except Exception as e:
+        return None, f"Error: {e}"
+
+
+def cached_pdf(url, status, cache, kind="full", max_in_memory=MAX_IN_MEMORY):
+    """
+    download_pdf's result for `url` once cache.fetch has answered `status`.
+    """
+    if status is None:
+        return None, "Not cached (offline)"
+    if status != 200:
+        return None, f"HTTP {status}"
+    try:
+        return cache.load_text(url, kind) or pdf_source(cache.pdf_path(url), max_in_memory), None
+    except Exception as e:
+        return None, f"Error: {e}"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_pdf_text(url, downloader=None, cache=None, fetched=None):
     """
     Download the PDF at `url`, extract all text, and decide
     whether to exclude based on page count & exclusion phrases.
+    Everything runs in the calling thread; see extract_all for the
+    process-pool version used on whole link lists. `fetched` is
+    download_pdf's result, if the caller already has it.
     Returns (text or None, exclusion_reason or None).
     """
+    data, reason = fetched or download_pdf(url, downloader, cache)
+    if data is None:
+        return None, reason
+    # a PDF too large to hold in memory was spilled to a temporary file
+    spilled = data if cache is None and isinstance(data, str) else None
     try:
-        resp = requests.get(url)
-        if resp.status_code != 200:
-            return None, f"HTTP {resp.status_code}"
-        reader = PdfReader(BytesIO(resp.content))
-        full_text = "".join(p.extract_text() or "" for p in reader.pages)
-        # if exactly 3 pages, check for any exclusion phrase
-        if len(reader.pages) == 3:
-            low = full_text.lower()
-            for phrase in EXCLUSION_PHRASES:
-                if phrase.lower() in low:
-                    return None, "Excluded by criteria"
-        return full_text, None
+        if is_pdf(data):
+            data = extract_text(data)
+            if cache:
+                cache.store_text(url, *data)
+        return classify(*data)
     except Exception as e:
         return None, f"Error: {e}"
+    finally:
+        if spilled:
+            _remove(spilled)
+
+
+def extract_all(fetched, pool, cache=None, fan_out=FAN_OUT_PAGES, kind="full"):
+    """
+    The parsing stage behind the downloads: `fetched` yields
+    (ctx, url, data, reason) as returned by download_pdf, and this yields
+    (ctx, text, reason) in the same order, with the text of downloaded
+    PDFs extracted in `pool`'s worker processes. PDFs of `fan_out` pages
+    or more are split into page ranges across the workers. `kind` (see
+    text_kind) picks the backend, and whether only the market definition
+    section is extracted. Without a cache, the temporary files of PDFs
+    passed by path are removed once parsed.
+    """
+    mode, _, backend = kind.partition(".")
+    backend = backend or DEFAULT_BACKEND
+    market = mode == "market"
+
+    def handoff():
+        for ctx, url, data, reason in fetched:
+            # only raw PDFs need a worker; cached text and failures pass through.
+            # Large PDFs go by path, so workers map the file instead of
+            # receiving a pickled copy of its bytes
+            part = None
+            if is_pdf(data):
+                part = data if market else split_pdf(data, pool.workers, fan_out, backend)
+            yield (ctx, url, data, reason), part
+
+    func = partial(extract_market_section if market else extract_pages, backend=backend)
+    for (ctx, url, data, reason), parts, error in pool.map(func, handoff()):
+        if cache is None and isinstance(data, str):
+            _remove(data)
+        if error is not None:
+            yield ctx, None, f"Error: {error}"
+        elif parts is not None:
+            extracted = join_pages(parts)
+            if cache:
+                cache.store_text(url, *extracted, kind=kind)
+            yield (ctx,) + classify(*extracted)
+        elif data is not None:
+            yield (ctx,) + classify(*data)
+        else:
+            yield ctx, None, reason
+
+def read_links(path, follow=False):
+    """
+    Yield (case, year, area, url) for every link in a link list written
+    by scrape_links (see utils.links), with the year as a string
+    ("Unknown" if missing) and the policy area normalised to e.g.
+    "antitrust_&_cartels". With follow=True, links are yielded while
+    scrape_links is still writing the list.
+    """
+    for link in lk.read_links(path, follow=follow):
+        yield (
+            link.case_number,
+            "Unknown" if link.year is None else str(link.year),
+            link.policy_area.lower().replace(" ", "_"),
+            link.link,
+        )
+
+
+def case_header(case, year, area, url):
+    """
+    The metadata block written at the top of every batch file and for
+    every case in included_cases.txt.
+    """
+    return (
+        f"Case Number: {case}\n"
+        f"Year: {year}\n"
+        f"Policy Area: {area.capitalize()}\n"
+        f"Link: {url}\n\n"
+    )
+
+
+def size_label(text):
+    """
+    "80" for documents over 80,000 characters, otherwise "79".
+    """
+    return "80" if len(text) > 80_000 else "79"
+
+
+def write_batch(batch_dir, label, num, case, year, area, url, text, store=None):
+    """
+    Write one case's header and text to its batch file, or to `store`
+    under "<case>|<url>" if given. Returns the file's path, or None.
+    """
+    if store is not None:
+        store.put(st.BATCHES, f"{case}|{url}", case_header(case, year, area, url) + text, size=label)
+        print(f"[batch] stored {case}")
+        return None
+    fname = f"pdf_texts_{label}_batch_{num}.txt"
+    outp = os.path.join(batch_dir, fname)
+    with open(outp, "w", encoding="utf-8") as fo:
+        fo.write(case_header(case, year, area, url))
+        fo.write(text)
+    print(f"[batch] wrote {fname}")
+    return outp
+
+
+def excluded_entry(case, year, area, url, reason):
+    """
+    One block of excluded_cases.txt: the case header plus the reason.
+    """
+    return case_header(case, year, area, url)[:-1] + f"Reason: {reason}\n\n"
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_repeated_urls(links):
+    """
+    (links whose URL has not come up before, [later links repeating one])
+    so a PDF listed under several cases is fetched once.
+    """
+    first, repeats, seen = [], [], set()
+    for link in links:
+        (repeats if link[3] in seen else first).append(link)
+        seen.add(link[3])
+    return first, repeats
+
+
+def duplicate_entry(case, year, area, url):
+    """
+    The fields json_merge replaces in a copy of the canonical case's definitions.
+    """
+    return {"case_number": case, "year": year, "policy_area": area.capitalize(), "link": url}
+
+
+def write_duplicates(path, duplicates, update=None):
+    """
+    Write {canonical link: [duplicate_entry, ...]} for json_merge. With
+    `update` (the links of this run, when it was given only the links
+    that changed), entries already in the file for other links are kept.
+    """
+    if update is not None and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            earlier = json.load(f)
+        merged = {}
+        for canon, entries in earlier.items():
+            entries = [e for e in entries if e["link"] not in update]
+            if entries:
+                merged[canon] = entries
+        for canon, entries in duplicates.items():
+            merged.setdefault(canon, []).extend(entries)
+        duplicates = merged
+    with open(path, "w", encoding="utf-8") as fo:
+        json.dump(duplicates, fo, indent=4)
+    print(f"[duplicates] {sum(map(len, duplicates.values()))} → {path}")
+
+
+def write_case_lists(inc_path, exc_path, included, excluded):
+    # write included_cases.txt
+    with open(inc_path, "w", encoding="utf-8") as fo:
+        for case, year, area, url in included:
+            fo.write(case_header(case, year, area, url))
+    print(f"[included] {len(included)} → {inc_path}")
+
+    # write excluded_cases.txt
+    with open(exc_path, "w", encoding="utf-8") as fo:
+        for case, year, area, url, reason in excluded:
+            fo.write(excluded_entry(case, year, area, url, reason))
+    print(f"[excluded] {len(excluded)} → {exc_path}")
+
 
-def main():
+def run_jobs(links, batch_dir, inc_path, exc_path, jobs_db, downloader, pool, cache=None,
+             retry=False, fan_out=FAN_OUT_PAGES, kind="full", max_in_memory=MAX_IN_MEMORY,
+             triage=False, store=None, delta=False):
+    """
+    Work through `links` via the job table in `jobs_db`. Cases are
+    claimed as download slots free up and parsed in `pool`, and each is
+    written to its batch file (numbered by job id) as soon as it is
+    fetched, so a crash loses
+    at most the cases in flight and other workers pointed at the same
+    table share the remaining cases. The case lists are rewritten from
+    the table, covering every worker.
+    A URL is only queued for its first case, and text this worker has
+    already written for another link is not written again; both kinds
+    of duplicate are listed in DUPLICATES_FILE instead.
+    """
+    first, repeats = split_repeated_urls(links)
+    conn = jobs.connect(jobs_db)
+    jobs.enqueue(conn, JOB_STAGE, [
+        (f"{case}|{url}", link_hash(case, year, area, url, kind),
+         {"case": case, "year": year, "area": area, "url": url})
+        for case, year, area, url in first
+    ])
+    if retry:
+        jobs.retry_failed(conn, JOB_STAGE)
+
+    worker = jobs.worker_id()
+    claims = 0
+
+    def claimed():
+        # runs in this thread, so the connection is never shared
+        nonlocal claims
+        while True:
+            job = jobs.claim(conn, JOB_STAGE, worker)
+            if job is None:
+                return
+            claims += 1
+            yield job
+
+    def fetch(job):
+        case, area, url = job.payload["case"], job.payload["area"], job.payload["url"]
+        print(f"[fetch] Case {case} ({area}), URL: {url} (attempt {job.attempts})")
+        return (job, url) + download_pdf(url, downloader, cache, kind, max_in_memory, triage)
+
+    done = 0
+    touched, failed = set(), set()
+    seen = {}
+    try:
+        with jobs.Heartbeat(jobs_db, JOB_STAGE, worker):
+            # jobs.fail puts a failed attempt straight back in the queue, behind
+            # the jobs tried fewer times; claims may run dry while it is still
+            # downloading, so go round until a round claims nothing
+            while True:
+                claims = 0
+                parsed = extract_all(downloader.map(fetch, claimed()), pool, cache, fan_out, kind)
+                for job, text, reason in parsed:
+                    touched.add(job.key)
+                    failed.discard(job.key)
+                    case, year, area, url = (job.payload[k] for k in ("case", "year", "area", "url"))
+                    if text:
+                        canon = seen.setdefault(text_hash(text), url)
+                        if canon != url:
+                            jobs.finish(conn, job.id, "done", error=DUPLICATE_OF + canon)
+                            print(f"[duplicate] Case {case} → same text as {canon}")
+                        else:
+                            outp = write_batch(batch_dir, size_label(text), job.id, case, year, area, url,
+                                               text, store)
+                            jobs.finish(conn, job.id, "done", outputs=[outp] if outp else [])
+                            print(f"[included] Case {case} → {len(text)} chars")
+                        done += 1
+                    elif reason == "Excluded by criteria":
+                        jobs.finish(conn, job.id, "excluded", error=reason)
+                        print(f"[excluded] Case {case} → {reason}")
+                        done += 1
+                    else:
+                        jobs.fail(conn, job.id, reason)
+                        print(f"[failed] Case {case} → {reason}")
+                        failed.add(job.key)
+                if not claims:
+                    break
+    finally:
+        # cases claimed but not finished go back to the queue
+        jobs.release(conn, JOB_STAGE, worker)
+
+    included, excluded, duplicates = [], [], {}
+    table = jobs.rows(conn, JOB_STAGE)
+    outcome = {url: table[f"{case}|{url}"] for case, _, _, url in first}
+    for link in first + repeats:
+        case, year, area, url = link
+        state, _, error = outcome[url]
+        if state == "done":
+            included.append(link)
+            canon = error[len(DUPLICATE_OF):] if error else url
+            if canon != url or link in repeats:
+                duplicates.setdefault(canon, []).append(duplicate_entry(*link))
+        elif state in ("excluded", "failed"):
+            excluded.append((case, year, area, url, error))
+    write_case_lists(inc_path, exc_path, included, excluded)
+    write_duplicates(os.path.join(os.path.dirname(inc_path), DUPLICATES_FILE), duplicates,
+                     {url for _, _, _, url in first} if delta else None)
+
+    counts = jobs.counts(conn, JOB_STAGE).get(JOB_STAGE, {})
+    conn.close()
+    print("[jobs] " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+    return {"items": done, "skipped": len(links) - len(touched), "failed": len(failed)}
+
+
+def main(argv=None):
     p = argparse.ArgumentParser(
         description="Download case PDFs, extract text, and batch into files"
     )
     p.add_argument(
         "-i", "--input", required=True,
-        help="Path to extracted_links.txt"
+        help="Link list written by scrape_links (e.g. data/extracted_links.jsonl)"
+    )
+    p.add_argument(
+        "--follow", action="store_true",
+        help="Start on the first links while scrape_links is still writing the list"
+    )
+    p.add_argument(
+        "--delta", action="store_true",
+        help="The link list only holds links added or changed since the last run "
+             "(scrape_links --since-previous): keep what earlier runs found for the others"
     )
     p.add_argument(
         "--datadir", default="data",
         help="Root data directory (batches → data/extracted_batches/)"
     )
-    args = p.parse_args()
+    p.add_argument(
+        "--manifest", default=None,
+        help="Manifest file; cases whose link is unchanged since the last run are skipped"
+    )
+    p.add_argument(
+        "--shard", type=shard_arg, default=None,
+        help="Only process cases whose case number hashes into shard i of N (e.g. 0/4)"
+    )
+    sel.add_arguments(p)
+    p.add_argument(
+        "--concurrency", type=int, default=dl.CONCURRENCY,
+        help="Downloads in flight at once (default: %(default)s)"
+    )
+    p.add_argument(
+        "--per-host", type=int, default=dl.PER_HOST,
+        help="Downloads in flight at once against one host (default: %(default)s)"
+    )
+    p.add_argument(
+        "--timeout", type=float, default=dl.TIMEOUT[1],
+        help="Seconds to wait for the server to send data before retrying (default: %(default)s)"
+    )
+    p.add_argument(
+        "--parse-workers", type=int, default=pp.WORKERS,
+        help="Processes extracting PDF text; 0 parses in this process (default: %(default)s)"
+    )
+    p.add_argument(
+        "--parse-timeout", type=float, default=pp.TIMEOUT,
+        help="Seconds one PDF may take to parse before it is given up on (default: %(default)s)"
+    )
+    p.add_argument(
+        "--fan-out-pages", type=int, default=FAN_OUT_PAGES,
+        help="Split PDFs of at least this many pages across the parse workers (default: %(default)s)"
+    )
+    p.add_argument(
+        "--market-definition-only", action="store_true",
+        help="Keep only the market definition section of each decision, found from the "
+             "PDF outline or its numbered headings (whole text if neither has one)"
+    )
+    p.add_argument(
+        "--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+        help="PDF text extractor; pypdfium2 and pdfminer need installing "
+             "(compare them with `lextract bench-pdf`; default: %(default)s)"
+    )
+    p.add_argument(
+        "--max-pdf-memory-mb", type=int, default=MAX_IN_MEMORY >> 20,
+        help="Parse larger PDFs from disk instead of reading them into memory (default: %(default)s)"
+    )
+    p.add_argument(
+        "--range-triage", action="store_true",
+        help="Fetch only the byte ranges needed to count each PDF's pages and check 3-page "
+             "ones for the exclusion phrases; other PDFs are then downloaded in full"
+    )
+    p.add_argument(
+        "--cache-dir", default=CACHE_DIR,
+        help="Where downloaded PDFs and their text are kept between runs (default: %(default)s)"
+    )
+    p.add_argument(
+        "--no-cache", action="store_true",
+        help="Download every PDF and extract its text again"
+    )
+    p.add_argument(
+        "--offline", action="store_true",
+        help="Make no network requests; cases whose PDF is not cached are excluded"
+    )
+    p.add_argument(
+        "--cache-max-age", type=float, metavar="DAYS", default=None,
+        help="Use cached PDFs checked within DAYS without asking the server (default: always revalidate)"
+    )
+    p.add_argument(
+        "--cache-size-mb", type=int, default=MAX_BYTES >> 20,
+        help="Evict least recently used PDFs beyond this size (default: %(default)s)"
+    )
+    p.add_argument(
+        "--jobs-db", default=None,
+        help="SQLite job table; progress survives crashes and several workers can share it"
+    )
+    p.add_argument(
+        "--store", default=None,
+        help="Artifact store to write the text batches to, instead of extracted_batches/"
+    )
+    p.add_argument(
+        "--retry-failed", action="store_true",
+        help="With --jobs-db, give cases that failed every attempt another try"
+    )
+    args = p.parse_args(argv)
 
-    # write the pdf batches into data/extracted_batches
+    # write the pdf batches into data/extracted_batches, or the artifact store
     batch_dir = os.path.join(args.datadir, "extracted_batches")
-    os.makedirs(batch_dir, exist_ok=True)
+    store = st.ArtifactStore(args.store) if args.store else None
+    os.makedirs(batch_dir if store is None else args.datadir, exist_ok=True)
     inc_path = os.path.join(args.datadir, "included_cases.txt")
     exc_path = os.path.join(args.datadir, "excluded_cases.txt")
 
-    # read links
-    links = []
-    with open(args.input, encoding="utf-8") as f:
-        block = []
-        for line in f:
-            line = line.strip()
-            if not line:
-                info = {k: v for k, v in (l.split(": ",1) for l in block)}
-                links.append((
-                    info["Case Number"],
-                    info["Year"],
-                    info["Policy Area"].lower().replace(" ", "_"),
-                    info["Link"]
-                ))
-                block = []
-            else:
-                block.append(line)
-        if block:
-            info = {k: v for k, v in (l.split(": ",1) for l in block)}
-            links.append((
-                info["Case Number"],
-                info["Year"],
-                info["Policy Area"].lower().replace(" ", "_"),
-                info["Link"]
-            ))
-
-    # download as plain text file and classify file
-    pdf_texts = []
-    included  = []
-    excluded  = []
-
-    for case, year, area, url in links:
-        print(f"[fetch] Case {case} ({area}), URL: {url}")
-        text, reason = get_pdf_text(url)
-        if text:
-            pdf_texts.append((case, year, area, url, text))
-            included.append((case, year, area, url))
-            print(f"[included] Case {case} → {len(text)} chars")
-        else:
-            excluded.append((case, year, area, url, reason))
-            print(f"[excluded] Case {case} → {reason}")
+    selection = sel.from_args(args)
+    links = (l for l in read_links(args.input, args.follow)
+             if in_shard(l[0], args.shard) and sel.matches(selection, *l[:3]))
+    if selection and selection.sample is not None:
+        # a sample needs every link first
+        links = sel.stratified_sample(list(links), selection.sample, selection.seed)
+
+    downloader = dl.Downloader(concurrency=args.concurrency, per_host=args.per_host,
+                               timeout=(dl.TIMEOUT[0], args.timeout))
+
+    kind = text_kind("market" if args.market_definition_only else "full", args.backend)
+    max_in_memory = args.max_pdf_memory_mb << 20
+
+    cache = None
+    if not args.no_cache:
+        max_age = args.cache_max_age * 86400 if args.cache_max_age is not None else None
+        cache = PdfCache(args.cache_dir, max_bytes=args.cache_size_mb << 20,
+                         offline=args.offline, max_age=max_age)
+
+    if args.jobs_db:
+        # the job table records inputs and outputs itself, so no manifest is
+        # needed; every link is queued before the first is claimed
+        links = list(links)
+        if args.shard:
+            print(f"[shard] {args.shard[0]}/{args.shard[1]}: {len(links)} links")
+        try:
+            with pp.ParsePool(args.parse_workers, args.parse_timeout) as pool:
+                return run_jobs(links, batch_dir, inc_path, exc_path, args.jobs_db, downloader,
+                                pool, cache, args.retry_failed, args.fan_out_pages, kind,
+                                max_in_memory, args.range_triage, store, args.delta)
+        finally:
+            if cache:
+                cache.evict()
+            if store is not None:
+                store.close()
 
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+
+    # download as plain text file and classify file; each document is
+    # written out as soon as it is fetched, so only the downloads in
+    # flight are held in memory
+    included = excluded = skipped = failed = 0
     batches_79 = {}
     batches_80 = {}
 
-    for case, year, area, url, text in pdf_texts:
-        if len(text) > 80_000:
-            dct, label = batches_80, "80"
-        else:
-            dct, label = batches_79, "79"
+    # a PDF listed under several cases is fetched for the first one only,
+    # and text already written for one link is not written again for
+    # another: json_merge copies the first case's definitions instead
+    first, repeats = [], []
+    seen = {}         # text hash → link its batch was written for
+    outcome = {}      # link → (canonical link, None) or (None, exclusion reason)
+    duplicates = {}   # canonical link → [duplicate_entry, ...]
 
-        dct[area] = dct.get(area, 0) + 1
-        num = dct[area]
-        fname = f"pdf_texts_{label}_batch_{num}.txt"
-        outp = os.path.join(batch_dir, fname)
+    # batch numbers already taken by cases recorded in the manifest
+    next_num = {"79": 1, "80": 1}
+    if manifest:
+        for key, entry in manifest["items"].items():
+            label, num = entry.get("batch") or (None, 0)
+            if label in next_num:
+                next_num[label] = max(next_num[label], num + 1)
+            if args.delta and entry.get("text_hash") and entry.get("batch"):
+                # cases of earlier lists are not in this one, but their text still counts
+                seen.setdefault(entry["text_hash"], key.split("|", 1)[1])
 
-        with open(outp, "w", encoding="utf-8") as fo:
-            fo.write(f"Case Number: {case}\n")
-            fo.write(f"Year: {year}\n")
-            fo.write(f"Policy Area: {area.capitalize()}\n")
-            fo.write(f"Link: {url}\n\n")
-            fo.write(text)
+    def first_links():
+        # drawn lazily by downloader.map in this thread, so downloads start
+        # on the first links while the rest are still being read
+        urls = set()
+        for link in links:
+            case, year, area, url = link
+            if url in urls:
+                repeats.append(link)
+                continue
+            urls.add(url)
+            first.append(link)
+            if manifest:
+                entry = mf.lookup(manifest, f"{case}|{url}",
+                                  link_hash(case, year, area, url, kind, cached_sha256(cache, url)))
+                if entry and entry.get("text_hash") and entry.get("batch"):
+                    seen.setdefault(entry["text_hash"], url)
+            yield link
 
-        print(f"[batch] wrote {fname}")
+    # read here: the store's connection belongs to this thread
+    stored = {key for key, _ in store.items(st.BATCHES)} if store is not None else None
 
-    # write included_cases.txt
-    with open(inc_path, "w", encoding="utf-8") as fo:
-        for case, year, area, url in included:
-            fo.write(f"Case Number: {case}\n")
-            fo.write(f"Year: {year}\n")
-            fo.write(f"Policy Area: {area.capitalize()}\n")
-            fo.write(f"Link: {url}\n\n")
-    print(f"[included] {len(included)} → {inc_path}")
+    def fetch(link):
+        # runs in a download thread; the manifest is only read here
+        case, year, area, url = link
+        key = f"{case}|{url}"
+        status = checked = None
+        if cache is not None and not (args.range_triage and cache.meta(url) is None):
+            # revalidated even for a case the manifest has, so a PDF
+            # republished under the same URL is not missed (a PDF left to
+            # triage is not cached, and is only fetched if it is needed)
+            try:
+                status, checked = cache.fetch(url, downloader), True
+            except Exception:
+                pass
+        input_hash = link_hash(case, year, area, url, kind, cached_sha256(cache, url))
+        entry = mf.lookup(manifest, key, input_hash)
+        if entry and stored is not None and entry.get("batch") and key not in stored:
+            entry = None
+        if entry:
+            return (link, key, input_hash, entry), url, None, None
+        print(f"[fetch] Case {case} ({area}), URL: {url}")
+        if checked:
+            return ((link, key, input_hash, None), url) + cached_pdf(url, status, cache, kind,
+                                                                     max_in_memory)
+        return ((link, key, input_hash, None), url) + download_pdf(url, downloader, cache, kind,
+                                                                   max_in_memory, args.range_triage)
 
-    # write excluded_cases.txt
-    with open(exc_path, "w", encoding="utf-8") as fo:
-        for case, year, area, url, reason in excluded:
-            fo.write(f"Case Number: {case}\n")
-            fo.write(f"Year: {year}\n")
-            fo.write(f"Policy Area: {area.capitalize()}\n")
-            fo.write(f"Link: {url}\n")
-            fo.write(f"Reason: {reason}\n\n")
-    print(f"[excluded] {len(excluded)} → {exc_path}")
+    # downloads overlap in threads and parsing in worker processes, but
+    # results are handled in link order
+    with open(inc_path, "w", encoding="utf-8") as inc, \
+         open(exc_path, "w", encoding="utf-8") as exc, \
+         pp.ParsePool(args.parse_workers, args.parse_timeout) as pool:
+        fetched = downloader.map(fetch, first_links())
+        parsed = extract_all(fetched, pool, cache, args.fan_out_pages, kind)
+        for (link, key, input_hash, entry), text, reason in parsed:
+            case, year, area, url = link
+            if entry:
+                skipped += 1
+                if entry.get("reason"):
+                    exc.write(excluded_entry(case, year, area, url, entry["reason"]))
+                    excluded += 1
+                    outcome[url] = None, entry["reason"]
+                else:
+                    inc.write(case_header(case, year, area, url))
+                    included += 1
+                    outcome[url] = entry.get("duplicate_of", url), None
+                    if url != outcome[url][0]:
+                        duplicates.setdefault(outcome[url][0], []).append(duplicate_entry(*link))
+                print(f"[unchanged] Case {case}")
+                continue
+            # a PDF first fetched while downloading is only now in the cache
+            input_hash = link_hash(case, year, area, url, kind, cached_sha256(cache, url))
+
+            if not text:
+                exc.write(excluded_entry(case, year, area, url, reason))
+                excluded += 1
+                outcome[url] = None, reason
+                print(f"[excluded] Case {case} → {reason}")
+                # only a deliberate exclusion is stable; HTTP errors are retried next run
+                if reason == "Excluded by criteria":
+                    mf.record(manifest, key, input_hash, reason=reason)
+                else:
+                    failed += 1
+                continue
+
+            inc.write(case_header(case, year, area, url))
+            included += 1
+            digest = text_hash(text)
+            canon = seen.setdefault(digest, url)
+            outcome[url] = canon, None
+            if canon != url:
+                duplicates.setdefault(canon, []).append(duplicate_entry(*link))
+                mf.record(manifest, key, input_hash, duplicate_of=canon)
+                print(f"[duplicate] Case {case} → same text as {canon}")
+                continue
+            print(f"[included] Case {case} → {len(text)} chars")
+
+            label = size_label(text)
+            dct = batches_80 if label == "80" else batches_79
+            # numbers run across areas so two areas never write the same file
+            dct[area] = dct.get(area, 0) + 1
+            num = next_num[label]
+            next_num[label] += 1
+            outp = write_batch(batch_dir, label, num, case, year, area, url, text, store)
+            mf.record(manifest, key, input_hash, [outp] if outp else [], batch=[label, num],
+                      text_hash=digest)
+
+        for link in repeats:
+            case, year, area, url = link
+            canon, reason = outcome[url]
+            if canon:
+                inc.write(case_header(case, year, area, url))
+                included += 1
+                duplicates.setdefault(canon, []).append(duplicate_entry(*link))
+                print(f"[duplicate] Case {case} → same link as an earlier case")
+            else:
+                exc.write(excluded_entry(case, year, area, url, reason))
+                excluded += 1
+
+    write_duplicates(os.path.join(args.datadir, DUPLICATES_FILE), duplicates,
+                     {url for _, _, _, url in first} if args.delta else None)
+    if args.shard:
+        print(f"[shard] {args.shard[0]}/{args.shard[1]}: {len(first) + len(repeats)} links")
+    if manifest is not None:
+        mf.save_manifest(manifest, args.manifest)
+    if cache:
+        cache.evict()
+    if store is not None:
+        store.close()
+
+    print(f"[included] {included} → {inc_path}")
+    print(f"[excluded] {excluded} → {exc_path}")
 
     # summary of batches
     total_79 = sum(batches_79.values())
@@ -170,6 +938,10 @@ def main():
     print(f"Documents <80k chars : {total_79}")
     print(f"Documents >80k chars : {total_80}")
     print(f"Total documents      : {total}")
+    if manifest is not None:
+        print(f"Unchanged (skipped)  : {skipped}")
+
+    return {"items": len(first) - skipped, "skipped": skipped, "failed": failed}
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
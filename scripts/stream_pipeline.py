@@ -0,0 +1,444 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from scripts import clean_json, json_merge, scrape_chunks, scrape_individual, scrape_pdf_text
+from utils import downloader as dl
+from utils import gemini
+from utils import manifest as mf
+from utils import selection as sel
+from utils.links import LINKS
+from utils.pdf_cache import CACHE_DIR, PdfCache
+from utils.sharding import in_shard, shard_arg
+
+# Sentinel that tells a stage its upstream has finished
+_DONE = object()
+
+# Each case's cleaned definitions, read back for cases the manifest has
+RESULTS_DIR = os.path.join("data", "stream_results")
+
+
+def _stage(name, func, inbox, outbox, workers, stats):
+    """
+    Start `workers` threads that take items from inbox, apply func and put
+    every non-None result on outbox. Once all of them have seen the end of
+    the input, a single _DONE is passed on. Returns the coordinator thread.
+    """
+    def work():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)   # let sibling workers see it too
+                return
+            try:
+                result = func(item)
+            except Exception as e:
+                with stats["lock"]:
+                    stats["failed"] += 1
+                print(f"[stream] {name} failed for case {item['case']}: {e}")
+                continue
+            if result is not None:
+                outbox.put(result)
+
+    threads = [threading.Thread(target=work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    def close():
+        for t in threads:
+            t.join()
+        outbox.put(_DONE)
+
+    coordinator = threading.Thread(target=close, name=f"{name}-close", daemon=True)
+    coordinator.start()
+    return coordinator
+
+
+def memory_budget(max_items, fetch_workers, llm_workers):
+    """
+    Split a budget of max_items in-flight cases over the workers and the
+    four queues between steps. Every worker count and queue gets at least
+    one, so the smallest possible footprint is 7 cases.
+    Returns (fetch_workers, llm_workers, queue_size).
+    """
+    # keep one slot per queue, split the rest over the three worker pools
+    per_pool = (max_items - 4) // 3
+    fetch_workers = max(1, min(fetch_workers, per_pool))
+    llm_workers = max(1, min(llm_workers, per_pool))
+    queue_size = max(1, (max_items - fetch_workers - 2 * llm_workers) // 4)
+    return fetch_workers, llm_workers, queue_size
+
+
+def results_path(results_dir, key):
+    """
+    Where the cleaned definitions of the case with manifest key `key` are kept.
+    """
+    return os.path.join(results_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def case_hash(item, pdf_sha256, model_name):
+    """
+    Input hash of one case: its link (and PDF, when the cache knows it),
+    both prompts and the model, so a change to any of them sends the case
+    to Gemini again.
+    """
+    return mf.hash_text(
+        scrape_pdf_text.link_hash(item["case"], item["year"], item["area"], item["url"],
+                                  pdf_sha256=pdf_sha256),
+        scrape_chunks.SECTIONS_PROMPT, scrape_individual.DEFINITIONS_PROMPT, model_name,
+    )
+
+
+def run_stream(links, output_file, chunk_model=None, definition_model=None,
+               fetch_workers=4, llm_workers=4, queue_size=8, cache=None, limiter=None,
+               manifest=None, results_dir=RESULTS_DIR, model_name=scrape_chunks.DEFAULT_MODEL):
+    """
+    Move every (case, year, area, url) through download → text → section →
+    definitions → cleaned JSON on its own, connected by bounded queues, and
+    append each case's definitions to output_file as soon as they arrive.
+
+    PDFs are downloaded through `cache` (a PdfCache), if given, and both
+    Gemini steps wait for `limiter`. Each case's definitions are also kept
+    in results_dir; a case recorded in `manifest` with the same input hash
+    is read back from there instead of being sent to Gemini again. A case
+    whose link or text came up before is not sent either: like json_merge,
+    it gets a copy of the first case's definitions under its own details.
+    Returns a dict of counts and timings.
+    """
+    stats = {"lock": threading.Lock(), "failed": 0, "excluded": [], "included": 0,
+             "unchanged": 0, "duplicates": 0}
+    downloader = dl.shared_downloader()
+    seen_urls = {}    # url → key of the first case with it
+    seen_texts = {}   # text hash → key of the first case with it
+    dropped = {}      # key → exclusion reason, for cases repeating its link
+
+    # both LLM steps can share the default model; build it once up front
+    chunk_model = chunk_model or scrape_chunks.get_model()
+    definition_model = definition_model or chunk_model
+
+    def exclude(item, key, reason):
+        with stats["lock"]:
+            stats["excluded"].append((item["case"], reason))
+            dropped[key] = reason
+        print(f"[stream] excluded case {item['case']} → {reason}")
+
+    def fetch(item):
+        url = item["url"]
+        key = f"{item['case']}|{url}"
+        with stats["lock"]:
+            canon = seen_urls.setdefault(url, key)
+        if canon != key:
+            return dict(item, key=key, duplicate_of=canon)
+
+        fetched = None
+        if cache is not None:
+            # revalidated even for a case the manifest has, so a PDF
+            # republished under the same URL is not missed
+            try:
+                fetched = scrape_pdf_text.cached_pdf(url, cache.fetch(url, downloader), cache)
+            except Exception:
+                pass
+        input_hash = case_hash(item, scrape_pdf_text.cached_sha256(cache, url), model_name)
+        with stats["lock"]:
+            entry = mf.lookup(manifest, key, input_hash)
+            if entry and entry.get("text_hash"):
+                seen_texts.setdefault(entry["text_hash"], key)
+        if entry and entry.get("reason"):
+            exclude(item, key, entry["reason"])
+            return None
+        if entry:
+            return dict(item, key=key, unchanged=True)
+
+        text, reason = scrape_pdf_text.get_pdf_text(url, downloader, cache, fetched)
+        # a PDF first fetched just now is only now in the cache
+        input_hash = case_hash(item, scrape_pdf_text.cached_sha256(cache, url), model_name)
+        if not text:
+            exclude(item, key, reason)
+            # only a deliberate exclusion is stable; HTTP errors are retried next run
+            if reason == "Excluded by criteria":
+                with stats["lock"]:
+                    mf.record(manifest, key, input_hash, reason=reason)
+            return None
+        digest = scrape_pdf_text.text_hash(text)
+        with stats["lock"]:
+            canon = seen_texts.setdefault(digest, key)
+        if canon != key:
+            return dict(item, key=key, input_hash=input_hash, text_hash=digest, duplicate_of=canon)
+        header = scrape_pdf_text.case_header(item["case"], item["year"], item["area"], url)
+        return dict(item, key=key, input_hash=input_hash, text_hash=digest, text=header + text)
+
+    def sections(item):
+        if "text" not in item:
+            return item
+        return dict(item, text=scrape_chunks.extract_section_text(item["text"], chunk_model, limiter))
+
+    def definitions(item):
+        if "text" not in item:
+            return item
+        response = scrape_individual.generate_content(definition_model, item["text"], limiter)
+        return dict(item, text=clean_json.strip_fences(response.text))
+
+    links_q   = queue.Queue(maxsize=queue_size)
+    texts_q   = queue.Queue(maxsize=queue_size)
+    section_q = queue.Queue(maxsize=queue_size)
+    result_q  = queue.Queue(maxsize=queue_size)
+
+    _stage("fetch", fetch, links_q, texts_q, fetch_workers, stats)
+    _stage("sections", sections, texts_q, section_q, llm_workers, stats)
+    _stage("definitions", definitions, section_q, result_q, llm_workers, stats)
+
+    def feed():
+        # links may be read lazily; a bad link list still ends the run
+        try:
+            for case, year, area, url in links:
+                links_q.put({"case": case, "year": year, "area": area, "url": url})
+        finally:
+            links_q.put(_DONE)
+
+    threading.Thread(target=feed, name="feed", daemon=True).start()
+
+    # start from an empty array so the file is valid JSON from the first moment
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("[]")
+
+    start = time.monotonic()
+    first_result = None
+    written = 0
+    done = set()      # keys whose definitions are in output_file
+    waiting = {}      # key → cases repeating its link or text, until it is done
+
+    def fail(item, message):
+        with stats["lock"]:
+            stats["failed"] += 1
+        print(f"[stream] case {item['case']}: {message}")
+
+    def write(item, data):
+        nonlocal first_result, written
+        if not item.get("unchanged"):
+            # copies are kept too, so a later run can read every case back
+            path = results_path(results_dir, item["key"])
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            if "input_hash" in item:
+                with stats["lock"]:
+                    mf.record(manifest, item["key"], item["input_hash"], [path],
+                              text_hash=item["text_hash"])
+        json_merge.append_json_items(output_file, data)
+        written += len(data)
+        with stats["lock"]:
+            stats["included"] += 1
+        if first_result is None:
+            first_result = time.monotonic() - start
+        print(f"[stream] case {item['case']} → {len(data)} definitions ({written} total)")
+        done.add(item["key"])
+        for dup in waiting.pop(item["key"], ()):
+            write_copy(dup)
+
+    def write_copy(item):
+        with open(results_path(results_dir, item["duplicate_of"]), encoding="utf-8") as f:
+            fields = scrape_pdf_text.duplicate_entry(item["case"], item["year"], item["area"], item["url"])
+            data = [{**d, **fields} for d in json.load(f)]
+        with stats["lock"]:
+            stats["duplicates"] += 1
+        write(item, data)
+
+    while True:
+        item = result_q.get()
+        if item is _DONE:
+            break
+        if "duplicate_of" in item:
+            if item["duplicate_of"] in done:
+                write_copy(item)
+            else:
+                waiting.setdefault(item["duplicate_of"], []).append(item)
+            continue
+        if item.get("unchanged"):
+            with open(results_path(results_dir, item["key"]), encoding="utf-8") as f:
+                data = json.load(f)
+            with stats["lock"]:
+                stats["unchanged"] += 1
+            write(item, data)
+            continue
+        try:
+            data = json.loads(item["text"])
+        except json.JSONDecodeError as e:
+            fail(item, f"JSONDecodeError - {e}")
+            continue
+        if not isinstance(data, list):
+            fail(item, "not a list of dictionaries")
+            continue
+        write(item, data)
+
+    # the first case of these was excluded or failed
+    for canon, items in waiting.items():
+        for item in items:
+            if canon in dropped:
+                exclude(item, item["key"], dropped[canon])
+            else:
+                fail(item, "the case with the same PDF failed")
+
+    return {
+        "definitions": written,
+        "included": stats["included"],
+        "excluded": stats["excluded"],
+        "failed": stats["failed"],
+        "unchanged": stats["unchanged"],
+        "duplicates": stats["duplicates"],
+        "time_to_first_result": first_result,
+        "wall_time": time.monotonic() - start,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Stream each case through download, Gemini extraction and merge without stage-wide barriers"
+    )
+    p.add_argument(
+        "-i", "--input", default=LINKS,
+        help="Link list written by scrape_links (default: %(default)s)"
+    )
+    p.add_argument(
+        "--follow", action="store_true",
+        help="Start on the first links while scrape_links is still writing the list"
+    )
+    p.add_argument(
+        "--output", default=os.path.join("data", "output.json"),
+        help="JSON array that grows as definitions arrive (default: data/output.json)"
+    )
+    p.add_argument(
+        "--model", default=scrape_chunks.DEFAULT_MODEL,
+        help="Gemini model to use for both LLM steps (default: %(default)s)"
+    )
+    p.add_argument(
+        "--fetch-workers", type=int, default=4,
+        help="Concurrent PDF downloads (default: 4)"
+    )
+    p.add_argument(
+        "--llm-workers", type=int, default=4,
+        help="Concurrent Gemini calls per LLM step (default: 4)"
+    )
+    p.add_argument(
+        "--queue-size", type=int, default=8,
+        help="Maximum items waiting between two steps (default: 8)"
+    )
+    p.add_argument(
+        "--max-memory", type=int, metavar="N", default=None,
+        help="Hold at most N cases in flight across all steps; overrides --queue-size "
+             "and caps the worker counts"
+    )
+    p.add_argument(
+        "--rpm", type=int, default=gemini.RPM,
+        help="Gemini requests per minute allowed for the model (default: %(default)s)"
+    )
+    p.add_argument(
+        "--tpm", type=int, default=gemini.TPM,
+        help="Gemini input tokens per minute allowed for the model (default: %(default)s)"
+    )
+    p.add_argument(
+        "--manifest", default=None,
+        help="Manifest file; cases whose PDF, prompts and model are unchanged since "
+             "the last run are not sent to Gemini again"
+    )
+    p.add_argument(
+        "--results", default=RESULTS_DIR,
+        help="Where each case's definitions are kept for later runs (default: %(default)s)"
+    )
+    p.add_argument(
+        "--cache-dir", default=CACHE_DIR,
+        help="Where downloaded PDFs and their text are kept between runs (default: %(default)s)"
+    )
+    p.add_argument(
+        "--no-cache", action="store_true",
+        help="Download every PDF and extract its text again"
+    )
+    p.add_argument(
+        "--shard", type=shard_arg, default=None,
+        help="Only process cases whose case number hashes into shard i of N (e.g. 0/4)"
+    )
+    sel.add_arguments(p)
+    args = p.parse_args(argv)
+
+    if args.max_memory:
+        args.fetch_workers, args.llm_workers, args.queue_size = memory_budget(
+            args.max_memory, args.fetch_workers, args.llm_workers)
+        print(f"[stream] {args.fetch_workers} fetch + 2 x {args.llm_workers} Gemini workers, "
+              f"queues of {args.queue_size}")
+
+    if not args.follow and not os.path.isfile(args.input):
+        print(f"Error: input not found: {args.input}")
+        return
+
+    chunk_model = definition_model = None
+    if args.model != scrape_chunks.DEFAULT_MODEL:
+        chunk_model = definition_model = scrape_chunks.load_model(args.model)
+
+    selection = sel.from_args(args)
+    links = (l for l in scrape_pdf_text.read_links(args.input, args.follow)
+             if in_shard(l[0], args.shard) and sel.matches(selection, *l[:3]))
+    if selection and selection.sample is not None:
+        links = sel.stratified_sample(list(links), selection.sample, selection.seed)
+
+    cache = None if args.no_cache else PdfCache(args.cache_dir)
+    manifest = mf.load_manifest(args.manifest) if args.manifest else None
+    try:
+        result = run_stream(
+            links,
+            args.output,
+            chunk_model=chunk_model, definition_model=definition_model,
+            fetch_workers=args.fetch_workers, llm_workers=args.llm_workers,
+            queue_size=args.queue_size, cache=cache,
+            limiter=gemini.shared_limiter(args.model, args.rpm, args.tpm),
+            manifest=manifest, results_dir=args.results, model_name=args.model,
+        )
+    finally:
+        if manifest is not None:
+            mf.save_manifest(manifest, args.manifest)
+        if cache:
+            cache.evict()
+
+    first = result["time_to_first_result"]
+    print()
+    print(f"Definitions written  : {result['definitions']} → {args.output}")
+    print(f"Cases included       : {result['included']}")
+    print(f"Cases excluded       : {len(result['excluded'])}")
+    print(f"Failed items         : {result['failed']}")
+    print(f"Duplicates copied    : {result['duplicates']}")
+    if manifest is not None:
+        print(f"Unchanged (skipped)  : {result['unchanged']}")
+    print(f"Time to first result : {first:.1f}s" if first is not None else "Time to first result : -")
+    print(f"Wall time            : {result['wall_time']:.1f}s")
+
+    return {"items": result["definitions"], "skipped": result["unchanged"], "failed": result["failed"]}
+
+
+if __name__ == '__main__':
+    main()
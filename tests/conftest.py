@@ -23,8 +23,12 @@
 
 import pytest
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
-from PyPDF2 import PdfWriter
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
 
 class DummyResponse:
     def __init__(self, content, status_code=200):
@@ -63,3 +67,149 @@ def short_pdf_bytes():
     out = BytesIO()
     writer.write(out)
     return out.getvalue()
+
+@pytest.fixture
+def make_pdf():
+    """
+    make_pdf(["text of page 1", ...]) -> bytes of a PDF whose pages
+    PyPDF2 extracts back to exactly those strings. `padding` adds that
+    many bytes of unused data after each page, like an embedded image.
+    """
+    def build(pages, padding=0):
+        writer = PdfWriter()
+        font = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        })
+        for text in pages:
+            page = PageObject.create_blank_page(None, 595, 842)
+            stream = DecodedStreamObject()
+            stream.set_data(f"BT /F1 12 Tf 50 800 Td ({text}) Tj ET".encode("latin-1"))
+            page[NameObject("/Contents")] = writer._add_object(stream)
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+            })
+            writer.add_page(page)
+            if padding:
+                blob = DecodedStreamObject()
+                blob.set_data(os.urandom(padding))
+                writer._add_object(blob)
+        out = BytesIO()
+        writer.write(out)
+        return out.getvalue()
+    return build
+
+
+class LocalServer:
+    """
+    A threaded HTTP/1.1 server on 127.0.0.1 standing in for ec.europa.eu.
+    Register a route with `server.routes[path] = func`; func(handler, n)
+    gets the request handler and how many times the path was requested
+    (1-based) and returns (status, headers, body).
+    """
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self.clients = set()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    n = server.hits[self.path] = server.hits.get(self.path, 0) + 1
+                    server.clients.add(self.client_address)
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    route = server.routes.get(self.path)
+                    status, headers, body = route(self, n) if route else (404, {}, b"")
+                finally:
+                    with server.lock:
+                        server.active -= 1
+                try:
+                    self.send_response(status)
+                    for k, v in headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def http_server():
+    server = LocalServer()
+    yield server
+    server.close()
+
+
+class GeminiError(Exception):
+    """
+    Stands in for a google.api_core exception, which carries its HTTP status as `code`.
+    """
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Answers generate_content after `latency` seconds, raising the errors
+    in `errors` first, and records how many calls overlap.
+    """
+    error = GeminiError
+
+    def __init__(self, latency=0.0, errors=()):
+        self.latency = latency
+        self.errors = list(errors)
+        self.calls = self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, parts):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            time.sleep(self.latency)
+            if error:
+                raise error
+            return FakeGeminiResponse("section of " + parts[0][-8:])
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def fake_gemini():
+    """
+    The FakeGeminiModel class; FakeGeminiModel.error(429) builds an API error.
+    """
+    return FakeGeminiModel
@@ -117,4 +117,23 @@ def test_main_runs_end_to_end(tmp_path):
     assert "definitions_per_year" in result
     assert "definitions_by_policy_area" in result
     assert "top_5_sectors" in result
-    assert "avg_definition_length_per_year" in result
\ No newline at end of file
+    assert "avg_definition_length_per_year" in result
+
+def test_analyze_stream_matches_list_analyses():
+    from analyze import analyze_stream
+    summary, by_year, by_area, sectors, avg_length = analyze_stream(iter(SAMPLE_DATA), n=2)
+    assert summary == summary_statistics(SAMPLE_DATA)
+    assert by_year == definitions_per_year(SAMPLE_DATA)
+    assert list(by_area.items()) == list(definitions_by_policy_area(SAMPLE_DATA).items())
+    assert list(sectors.items()) == list(top_sectors(SAMPLE_DATA, n=2).items())
+    assert avg_length == avg_definition_length_per_year(SAMPLE_DATA)
+
+
+def test_main_stream_writes_the_same_results(tmp_path):
+    import analyze as an
+    input_file = tmp_path / "output.json"
+    input_file.write_text(json.dumps(SAMPLE_DATA, indent=4))
+
+    an.main(["--input", str(input_file), "--output", str(tmp_path / "full.json")])
+    an.main(["--input", str(input_file), "--output", str(tmp_path / "stream.json"), "--stream"])
+    assert (tmp_path / "full.json").read_text() == (tmp_path / "stream.json").read_text()
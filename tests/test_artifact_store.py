@@ -0,0 +1,120 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+import sys
+import pytest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import artifact_store as st
+from utils.artifact_store import ArtifactStore
+from scripts import clean_json, json_merge, scrape_chunks, scrape_individual, scrape_pdf_text
+from utils.links import write_links
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ArtifactStore(str(tmp_path / "artifacts.sqlite")) as store:
+        yield store
+
+
+def test_put_and_get(store):
+    digest = store.put(st.BATCHES, "M.1|https://x/a.pdf", "Case Number: M.1\n\ntext é", size="79")
+    assert store.get(st.BATCHES, "M.1|https://x/a.pdf") == "Case Number: M.1\n\ntext é"
+    assert store.digest(st.BATCHES, "M.1|https://x/a.pdf") == digest
+    assert store.items(st.BATCHES) == [("M.1|https://x/a.pdf", {"size": "79"})]
+    assert store.get(st.SECTIONS, "M.1|https://x/a.pdf") is None
+    assert store.digest(st.BATCHES, "missing") is None
+
+
+def test_identical_documents_are_stored_once_and_compressed(store):
+    text = "The relevant product market is the market for widgets. " * 2000
+    store.put(st.BATCHES, "M.1|a", text)
+    store.put(st.BATCHES, "M.2|b", text)
+    assert store.conn.execute("SELECT COUNT(*) FROM blobs").fetchone() == (1,)
+    n, raw, stored = store.stats()[st.BATCHES]
+    assert (n, raw) == (2, 2 * len(text))
+    assert stored < raw / 50
+
+
+def test_replace_and_gc(store):
+    store.put(st.DEFINITIONS, "M.1|a", "```json\n[]\n```")
+    store.put(st.DEFINITIONS, "M.1|a", "[]")
+    assert store.get(st.DEFINITIONS, "M.1|a") == "[]"
+    assert store.gc() == 1
+    store.delete(st.DEFINITIONS, "M.1|a")
+    assert store.gc() == 1 and store.items(st.DEFINITIONS) == []
+
+
+def test_main_shows_and_exports(tmp_path, store, capsys):
+    store.put(st.SECTIONS, "M.1|https://x/a.pdf", "section")
+    table = st.main(["--store", store.path, "--export", st.SECTIONS, str(tmp_path / "out")])
+    assert table[st.SECTIONS][0] == 1
+    assert [p.read_text() for p in (tmp_path / "out").iterdir()] == ["section"]
+    assert "sections" in capsys.readouterr().out
+
+
+def test_stages_read_and_write_through_the_store(tmp_path):
+    links = tmp_path / "extracted_links.jsonl"
+    write_links(links, [(f"M.{n}", 2024, "Merger", f"https://ec.europa.eu/competition/mergers/{n}.pdf")
+                        for n in (1, 2)])
+    path = str(tmp_path / "artifacts.sqlite")
+
+    class Reader:
+        def __init__(self, stream):
+            text = stream.read().decode()
+            self.pages = [mock.Mock(extract_text=lambda: text)] * 4
+
+    def get(url, **kwargs):
+        resp = mock.Mock(status_code=200, headers={}, content=url.encode())
+        resp.iter_content = lambda size: [resp.content]
+        return resp
+
+    with mock.patch("requests.Session.get", side_effect=get), \
+         mock.patch("utils.pdf_backends.PdfReader", Reader):
+        scrape_pdf_text.main(["-i", str(links), "--datadir", str(tmp_path), "--store", path,
+                              "--parse-workers", "0"])
+
+    sections_model = mock.Mock()
+    sections_model.generate_content.side_effect = lambda parts: mock.Mock(
+        text=parts[0].split("Case Number: ", 1)[1].split("\n", 1)[0])
+    definitions_model = mock.Mock()
+    definitions_model.generate_content.side_effect = lambda parts: mock.Mock(
+        text="```json\n" + json.dumps([{"case_number": parts[0].rsplit("\n", 1)[-1].strip(),
+                                       "topic": "t"}]) + "\n```")
+    with mock.patch.object(scrape_chunks, "model", sections_model), \
+         mock.patch.object(scrape_individual, "load_model", return_value=definitions_model):
+        assert scrape_chunks.main(["--store", path])["items"] == 2
+        assert scrape_individual.main(["--store", path])["items"] == 2
+    assert clean_json.main(["--store", path])["items"] == 2
+    output = tmp_path / "output.json"
+    json_merge.main(["--store", path, "--output", str(output), "--duplicates", ""])
+
+    assert sorted(d["case_number"] for d in json.loads(output.read_text())) == ["M.1", "M.2"]
+    # nothing was written as one file per document
+    assert not (tmp_path / "extracted_batches").exists()
+    with ArtifactStore(path) as store:
+        assert {stage: v[0] for stage, v in store.stats().items()} == {
+            st.BATCHES: 2, st.SECTIONS: 2, st.DEFINITIONS: 2}
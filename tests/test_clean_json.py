@@ -62,3 +62,8 @@ def test_main_removes_fences_from_multiple_files(tmp_path):
 
     assert f1.read_text(encoding="utf-8").strip() == "{\"a\": 1}"
     assert f2.read_text(encoding="utf-8").strip() == "{\"b\": 2}"
+
+
+def test_strip_fences():
+    assert clean_json.strip_fences("```json\n[1, 2]\n```") == "[1, 2]\n"
+    assert clean_json.strip_fences("[1, 2]") == "[1, 2]"
@@ -0,0 +1,99 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+import cli
+
+# Modules that make a command slow to start if they are imported eagerly
+HEAVY_MODULES = ["pandas", "google.generativeai", "pyarrow"]
+
+# Generous ceiling for importing the CLI and every command module that
+# has no heavy dependency of its own; today this takes a few tens of ms
+IMPORT_BUDGET_S = 0.5
+
+
+def test_dispatches_to_command_main(monkeypatch):
+    import analyze
+    calls = []
+    monkeypatch.setattr(analyze, "main", lambda argv: calls.append(argv))
+
+    cli.main(["analyze", "--input", "x.json", "--top-n", "5"])
+    assert calls == [["--input", "x.json", "--top-n", "5"]]
+
+
+def test_options_without_command_run_the_pipeline(monkeypatch):
+    import run_pipeline
+    calls = []
+    monkeypatch.setattr(run_pipeline, "main", lambda argv: calls.append(argv))
+
+    cli.main(["--shard", "0/4"])
+    cli.main([])
+    assert calls == [["--shard", "0/4"], []]
+
+
+def test_help_lists_commands(capsys):
+    with pytest.raises(SystemExit) as e:
+        cli.main(["--help"])
+    assert e.value.code == 0
+    out = capsys.readouterr().out
+    for name in cli.COMMANDS:
+        assert name in out
+
+
+def test_unknown_command_is_rejected(capsys):
+    with pytest.raises(SystemExit) as e:
+        cli.main(["no-such-command"])
+    assert e.value.code == 2
+
+
+def test_every_command_module_has_main():
+    import importlib
+    for module, _ in cli.COMMANDS.values():
+        assert callable(importlib.import_module(module).main)
+
+
+def test_import_time_budget():
+    # run in a fresh interpreter so modules imported by other tests don't count
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import cli, analyze, evaluate, export, run_pipeline\n"
+        "import scripts.scrape_links, scripts.scrape_chunks, scripts.scrape_individual\n"
+        "import scripts.clean_json, scripts.json_merge\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                         text=True, check=True).stdout
+    result = json.loads(out)
+
+    assert result["heavy"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_S, f"imports took {result['elapsed']:.3f}s"
@@ -0,0 +1,235 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import hashlib
+import os
+import socket
+import sys
+import time
+import pytest
+import requests
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils.downloader import Downloader
+from scripts import scrape_pdf_text
+from utils.links import write_links
+
+
+def ok(body=b"%PDF-1.4 body", delay=0):
+    def route(handler, n):
+        time.sleep(delay)
+        return 200, {"Content-Type": "application/pdf"}, body
+    return route
+
+
+def fails_first(times, status, headers=None):
+    def route(handler, n):
+        if n <= times:
+            return status, headers or {}, b""
+        return 200, {}, b"finally"
+    return route
+
+
+def fast(**kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return Downloader(**kwargs)
+
+
+def test_retries_5xx_then_succeeds(http_server):
+    http_server.routes["/flaky.pdf"] = fails_first(2, 503)
+    resp = fast().get(http_server.url("/flaky.pdf"))
+    assert (resp.status_code, resp.content) == (200, b"finally")
+    assert http_server.hits["/flaky.pdf"] == 3
+
+
+def test_gives_up_after_retries(http_server):
+    http_server.routes["/down.pdf"] = fails_first(99, 502)
+    resp = fast(retries=2).get(http_server.url("/down.pdf"))
+    assert resp.status_code == 502
+    assert http_server.hits["/down.pdf"] == 3
+
+
+def test_429_waits_for_retry_after(http_server):
+    http_server.routes["/busy.pdf"] = fails_first(1, 429, {"Retry-After": "0.3"})
+    start = time.monotonic()
+    resp = fast().get(http_server.url("/busy.pdf"))
+    assert resp.status_code == 200
+    assert time.monotonic() - start >= 0.3
+
+
+def test_client_errors_are_not_retried(http_server):
+    resp = fast().get(http_server.url("/missing.pdf"))
+    assert resp.status_code == 404
+    assert http_server.hits["/missing.pdf"] == 1
+
+
+def test_hung_server_times_out(http_server):
+    http_server.routes["/hang.pdf"] = ok(delay=1.0)
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        fast(retries=1, timeout=(1, 0.1)).get(http_server.url("/hang.pdf"))
+    assert http_server.hits["/hang.pdf"] == 2
+    assert time.monotonic() - start < 1.0
+
+
+def test_delay_is_jittered_and_capped():
+    d = Downloader(backoff=1, max_backoff=5)
+    with mock.patch("random.uniform", side_effect=lambda lo, hi: hi):
+        assert [d.delay(a) for a in range(5)] == [1, 2, 4, 5, 5]
+        assert d.delay(0, retry_after=3) == 3
+        assert d.delay(0, retry_after=60) == 5
+    with mock.patch("random.uniform", side_effect=lambda lo, hi: lo):
+        assert d.delay(3) == 0
+
+
+def test_connections_are_reused(http_server):
+    http_server.routes["/a.pdf"] = ok()
+    d = Downloader(concurrency=1)
+    for _ in range(5):
+        assert d.get(http_server.url("/a.pdf")).status_code == 200
+    assert len(http_server.clients) == 1
+
+
+def test_per_host_cap(http_server):
+    paths = [f"/{n}.pdf" for n in range(12)]
+    for path in paths:
+        http_server.routes[path] = ok(delay=0.05)
+    d = Downloader(concurrency=8, per_host=2)
+    list(d.map(lambda p: d.get(http_server.url(p)), paths))
+    assert http_server.max_active == 2
+
+
+def test_per_host_cap_covers_the_streamed_body(tmp_path):
+    # headers arrive at once; the cap must hold while the body is read
+    reading, peak = [0], [0]
+
+    class SlowBody:
+        status_code = 200
+        headers = {}
+
+        def iter_content(self, size):
+            reading[0] += 1
+            peak[0] = max(peak[0], reading[0])
+            time.sleep(0.05)
+            reading[0] -= 1
+            yield b"%PDF-1.4 body"
+
+        def close(self):
+            pass
+
+    session = mock.Mock()
+    session.get.side_effect = lambda url, **kwargs: SlowBody()
+    d = Downloader(concurrency=6, per_host=2, session=session)
+    list(d.map(lambda n: d.download(f"https://ec.europa.eu/{n}.pdf", tmp_path / f"{n}.pdf"), range(6)))
+    assert peak[0] == 2
+    assert d._host_slot("https://ec.europa.eu/x.pdf")._value == 2
+
+
+def test_map_keeps_input_order():
+    d = Downloader(concurrency=4)
+    out = list(d.map(lambda n: time.sleep(0.01 * (5 - n % 5)) or n, range(20)))
+    assert out == list(range(20))
+
+
+def test_throughput_scales_with_concurrency(http_server):
+    paths = [f"/{n}.pdf" for n in range(16)]
+    for path in paths:
+        http_server.routes[path] = ok(delay=0.05)
+
+    elapsed = {}
+    for concurrency in (1, 8):
+        d = Downloader(concurrency=concurrency, per_host=concurrency)
+        start = time.monotonic()
+        list(d.map(lambda p: d.get(http_server.url(p)), paths))
+        elapsed[concurrency] = time.monotonic() - start
+
+    # 16 x 50 ms of server latency: ~0.8 s one at a time, ~0.1 s eight at a time
+    assert elapsed[8] < elapsed[1] / 3, elapsed
+
+
+def cut_off_first(body):
+    def route(handler, n):
+        if n == 1:
+            # promise the whole body, send half, and hang up
+            handler.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body))
+            handler.wfile.write(body[:len(body) // 2])
+            handler.wfile.flush()
+            handler.close_connection = True
+            handler.connection.shutdown(socket.SHUT_RDWR)
+        return 200, {}, body
+    return route
+
+
+def test_download_streams_body_to_file(tmp_path, http_server):
+    body = os.urandom(300_000)
+    http_server.routes["/big.pdf"] = ok(body)
+    path = tmp_path / "big.pdf"
+    resp, digest = fast().download(http_server.url("/big.pdf"), str(path))
+    assert resp.status_code == 200
+    assert digest == hashlib.sha256(body).hexdigest()
+    assert path.read_bytes() == body
+    # the body went to the file, not into the response
+    assert resp._content is False
+    assert os.listdir(tmp_path) == ["big.pdf"]
+
+
+def test_download_retries_cut_off_body(tmp_path, http_server):
+    body = os.urandom(200_000)
+    http_server.routes["/cut.pdf"] = cut_off_first(body)
+    path = tmp_path / "cut.pdf"
+    resp, digest = fast().download(http_server.url("/cut.pdf"), str(path))
+    assert digest == hashlib.sha256(body).hexdigest()
+    assert path.read_bytes() == body
+    assert http_server.hits["/cut.pdf"] == 2
+    assert os.listdir(tmp_path) == ["cut.pdf"]
+
+
+def test_download_writes_nothing_for_errors(tmp_path, http_server):
+    resp, digest = fast().download(http_server.url("/missing.pdf"), str(tmp_path / "m.pdf"))
+    assert (resp.status_code, digest) == (404, None)
+    assert os.listdir(tmp_path) == []
+
+
+def test_scrape_pdf_text_downloads_from_server(tmp_path, http_server):
+    class Reader:
+        def __init__(self, stream):
+            text = stream.read().decode()
+            self.pages = [mock.Mock(extract_text=lambda: text)] * 4
+
+    links = tmp_path / "extracted_links.jsonl"
+    for n in range(6):
+        http_server.routes[f"/{n}.pdf"] = ok(f"decision {n}".encode(), delay=0.05)
+    write_links(links, [(f"M.{n}", 2024, "Merger", http_server.url(f"/{n}.pdf")) for n in range(6)])
+    http_server.routes["/3.pdf"] = fails_first(1, 503)
+
+    with mock.patch("utils.pdf_backends.PdfReader", Reader):
+        counts = scrape_pdf_text.main(["-i", str(links), "--datadir", str(tmp_path),
+                                       "--concurrency", "6"])
+
+    assert counts == {"items": 6, "skipped": 0, "failed": 0}
+    assert http_server.max_active > 1
+    batches = sorted((tmp_path / "extracted_batches").glob("*.txt"),
+                     key=lambda p: int(p.stem.rsplit("_", 1)[1]))
+    # results are written in link order however the downloads finish
+    assert [b.read_text().split("\n", 1)[0] for b in batches] == [f"Case Number: M.{n}" for n in range(6)]
@@ -186,4 +186,21 @@ def test_main_runs_end_to_end(tmp_path):
     assert out_path.exists()
     report = json.loads(out_path.read_text())
     assert "validity_rate_pct" in report
-    assert report["total_definitions"] == 1
\ No newline at end of file
+    assert report["total_definitions"] == 1
+
+def test_evaluate_accepts_a_generator_without_keeping_scores():
+    predicted = [
+        {"case_number": "M.100", "topic": "Widgets", "year": "2020", "policy_area": "Merger",
+         "text": ("The Commission considers that the relevant product market for widgets "
+                  "is EEA-wide. The exact market definition can be left open since no "
+                  "serious doubts arise as to compatibility with the internal market.")},
+        {"case_number": "M.999", "topic": "Nonsense", "year": "2021", "policy_area": "Merger",
+         "text": "short irrelevant text"},
+    ]
+    full = evaluate(REFERENCE, predicted)
+    streamed = evaluate(REFERENCE, iter(predicted), per_definition=False)
+
+    assert len(full["per_definition"]) == 2
+    assert streamed["per_definition"] == []
+    full.pop("per_definition"), streamed.pop("per_definition")
+    assert streamed == full
@@ -247,4 +247,19 @@ def test_main_single_format(tmp_path):
     ex.main()
 
     assert (output_dir / "output.csv").exists()
-    assert not (output_dir / "output.jsonl").exists()
\ No newline at end of file
+    assert not (output_dir / "output.jsonl").exists()
+
+def test_main_max_memory_matches_loaded_export(tmp_path):
+    import export as ex
+    input_file = tmp_path / "output.json"
+    input_file.write_text(json.dumps(SAMPLE, indent=4))
+
+    for name, extra in (("full", []), ("stream", ["--max-memory", "1"])):
+        ex.main(["--format", "all", "--input", str(input_file),
+                 "--output", str(tmp_path / name)] + extra)
+
+    for fname in ("output.csv", "output.jsonl", "output.bib", "output.ris"):
+        assert (tmp_path / "full" / fname).read_text() == (tmp_path / "stream" / fname).read_text()
+    conn = sqlite3.connect(str(tmp_path / "stream" / "output.db"))
+    assert conn.execute("SELECT COUNT(*) FROM definitions").fetchone()[0] == len(SAMPLE)
+    conn.close()
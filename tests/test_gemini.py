@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import pytest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import gemini
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_spaces_requests_at_its_rate():
+    clock = FakeClock()
+    bucket = gemini.TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+    # the two saved-up tokens go at once, then one a second
+    assert [bucket.acquire() for _ in range(4)] == [0, 0, pytest.approx(1), pytest.approx(1)]
+    clock.now += 10
+    assert bucket.acquire(2) == 0
+
+
+def test_request_larger_than_the_bucket_leaves_it_in_debt():
+    clock = FakeClock()
+    bucket = gemini.TokenBucket(600, clock=clock, sleep=clock.sleep)    # 10 a second, capacity 60
+    assert bucket.acquire(120) == 0
+    # the next token is only free once the 60 borrowed ones are paid back
+    assert bucket.acquire(1) == pytest.approx(6.1)
+
+
+def test_rate_limiter_waits_for_both_quotas():
+    clock = FakeClock()
+    limiter = gemini.RateLimiter(rpm=600, tpm=6000, clock=clock, sleep=clock.sleep)
+    assert limiter.acquire(600) == 0
+    # a request is free again, but 600 more tokens take 6 seconds
+    assert limiter.acquire(600) == pytest.approx(6)
+
+
+def test_generate_retries_quota_and_unavailable_errors(fake_gemini, capsys):
+    model = fake_gemini(errors=[fake_gemini.error(429), fake_gemini.error(503)])
+    sleeps = []
+    response = gemini.generate(model, "batch 1", retries=3, backoff=1, sleep=sleeps.append)
+    assert response.text.startswith("section of")
+    assert model.calls == 3
+    assert len(sleeps) == 2 and all(0 <= s <= 2 for s in sleeps)
+    assert "[gemini] 429 from the API; retry 1/3" in capsys.readouterr().out
+
+
+def test_generate_gives_up_and_does_not_retry_other_errors(fake_gemini):
+    model = fake_gemini(errors=[fake_gemini.error(429)] * 3)
+    with pytest.raises(fake_gemini.error):
+        gemini.generate(model, "batch 1", retries=2, sleep=lambda s: None)
+    assert model.calls == 3
+
+    model = fake_gemini(errors=[fake_gemini.error(400)])
+    with pytest.raises(fake_gemini.error):
+        gemini.generate(model, "batch 1", sleep=lambda s: None)
+    assert model.calls == 1
+
+
+def test_generate_honours_a_server_retry_delay(fake_gemini):
+    error = fake_gemini.error(429)
+    error.details = [mock.Mock(retry_delay=mock.Mock(seconds=7, nanos=500_000_000))]
+    sleeps = []
+    gemini.generate(fake_gemini(errors=[error]), "batch 1", backoff=0.1, sleep=sleeps.append)
+    assert sleeps == [7.5]
+
+
+def test_run_concurrently_overlaps_calls_and_reports_errors(fake_gemini):
+    model = fake_gemini(latency=0.05, errors=[ValueError("bad batch")])
+
+    def work(n):
+        return model.generate_content([f"batch {n}"]).text
+
+    start = time.perf_counter()
+    results = list(gemini.run_concurrently(work, range(8), workers=4))
+    assert time.perf_counter() - start < 0.05 * 8    # one at a time would take this long
+    assert model.peak == 4
+    assert sorted(n for n, _, _ in results) == list(range(8))
+    assert [type(e) for _, _, e in results if e] == [ValueError]
+
+    model = fake_gemini()
+    assert [r for _, r, _ in gemini.run_concurrently(work, range(3), workers=1)] == \
+        ["section of batch 0", "section of batch 1", "section of batch 2"]
+    assert model.peak == 1
+
+
+def test_shared_limiter_is_one_per_model(capsys):
+    with mock.patch.dict(gemini._limiters, clear=True):
+        first = gemini.shared_limiter("model-a", rpm=30, tpm=5000)
+        assert gemini.shared_limiter("model-a", rpm=30, tpm=5000) is first
+        assert gemini.shared_limiter("model-b") is not first
+        # a second stage cannot split the quota by asking for other limits
+        assert gemini.shared_limiter("model-a", rpm=60, tpm=5000) is first
+    assert "keeping those" in capsys.readouterr().out
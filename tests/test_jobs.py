@@ -0,0 +1,202 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+import subprocess
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import jobs
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = jobs.connect(str(tmp_path / "jobs.sqlite"))
+    yield conn
+    conn.close()
+
+
+def items(*keys, input_hash="h"):
+    return [(k, input_hash, {"key": k}) for k in keys]
+
+
+def test_claim_finish_and_counts(conn):
+    assert jobs.enqueue(conn, "s", items("a", "b")) == 2
+
+    first = jobs.claim(conn, "s", "w1")
+    second = jobs.claim(conn, "s", "w2")
+    assert (first.key, first.payload, first.attempts) == ("a", {"key": "a"}, 1)
+    assert second.key == "b"
+    assert jobs.claim(conn, "s", "w3") is None
+
+    jobs.finish(conn, first.id, "done")
+    jobs.finish(conn, second.id, "excluded", error="Excluded by criteria")
+    assert jobs.counts(conn) == {"s": {"pending": 0, "running": 0, "done": 1, "excluded": 1, "failed": 0}}
+    assert jobs.rows(conn, "s")["b"] == ("excluded", {"key": "b"}, "Excluded by criteria")
+
+
+def test_enqueue_keeps_finished_jobs_unless_input_changes(conn, tmp_path):
+    out = tmp_path / "out.txt"
+    out.write_text("x")
+    jobs.enqueue(conn, "s", items("a"))
+    job = jobs.claim(conn, "s", "w")
+    jobs.finish(conn, job.id, "done", outputs=[str(out)])
+
+    assert jobs.enqueue(conn, "s", items("a")) == 0
+    assert jobs.claim(conn, "s", "w") is None
+
+    assert jobs.enqueue(conn, "s", items("a", input_hash="new")) == 1
+    again = jobs.claim(conn, "s", "w")
+    assert again.id == job.id
+
+
+def test_enqueue_requeues_done_jobs_with_missing_outputs(conn, tmp_path):
+    jobs.enqueue(conn, "s", items("a"))
+    job = jobs.claim(conn, "s", "w")
+    jobs.finish(conn, job.id, "done", outputs=[str(tmp_path / "gone.txt")])
+
+    assert jobs.enqueue(conn, "s", items("a")) == 1
+    assert jobs.claim(conn, "s", "w").key == "a"
+
+
+def test_fail_retries_until_max_attempts(conn):
+    jobs.enqueue(conn, "s", items("a"))
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        job = jobs.claim(conn, "s", "w")
+        assert job.attempts == attempt
+        jobs.fail(conn, job.id, "HTTP 500")
+
+    assert jobs.claim(conn, "s", "w") is None
+    assert jobs.rows(conn, "s")["a"] == ("failed", {"key": "a"}, "HTTP 500")
+
+    assert jobs.retry_failed(conn, "s") == 1
+    assert jobs.claim(conn, "s", "w").attempts == 1
+
+
+def test_failed_attempts_go_to_the_back_of_the_queue(conn):
+    jobs.enqueue(conn, "s", items("a", "b"))
+    jobs.fail(conn, jobs.claim(conn, "s", "w").id, "HTTP 503")
+    assert jobs.claim(conn, "s", "w").key == "b"
+
+
+def test_expired_lease_is_taken_over(conn):
+    jobs.enqueue(conn, "s", items("a"))
+    jobs.claim(conn, "s", "other-host:1", lease=-1)
+
+    job = jobs.claim(conn, "s", "w")
+    assert (job.key, job.attempts) == ("a", 2)
+
+
+def test_live_lease_is_not_taken_over(conn):
+    jobs.enqueue(conn, "s", items("a"))
+    jobs.claim(conn, "s", "other-host:1")
+    assert jobs.claim(conn, "s", "w") is None
+
+
+def test_renewed_lease_is_not_taken_over(conn):
+    jobs.enqueue(conn, "s", items("a", "b"))
+    held = jobs.claim(conn, "s", "other-host:1", lease=-1)
+    assert jobs.renew(conn, "s", "other-host:1") == 1
+    assert jobs.claim(conn, "s", "w").key == "b"
+
+    # a lease that was already taken over is not renewed for the old holder
+    jobs.release(conn, "s", "w")
+    jobs.claim(conn, "s", "other-host:2")
+    assert jobs.renew(conn, "s", "w") == 0
+    assert jobs.rows(conn, "s")[held.key][0] == "running"
+
+
+def test_heartbeat_keeps_a_long_job_leased(tmp_path, conn):
+    db = str(tmp_path / "jobs.sqlite")
+    jobs.enqueue(conn, "s", items("a"))
+    jobs.claim(conn, "s", "other-host:1", lease=0.2)
+
+    with jobs.Heartbeat(db, "s", "other-host:1", lease=0.2, every=0.05):
+        time.sleep(0.5)    # more than two leases
+        assert jobs.claim(conn, "s", "w") is None
+    time.sleep(0.3)
+    # once the heartbeat stops, the lease runs out and the job is taken over
+    assert jobs.claim(conn, "s", "w").key == "a"
+
+
+def test_job_of_dead_local_worker_is_taken_over(conn):
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    dead = f"{jobs.socket.gethostname()}:{proc.pid}"
+
+    jobs.enqueue(conn, "s", items("a"))
+    jobs.claim(conn, "s", dead)
+    assert jobs.claim(conn, "s", "w").key == "a"
+
+
+def test_released_jobs_are_claimed_again(conn):
+    jobs.enqueue(conn, "s", items("a", "b", "c"))
+    me = jobs.worker_id()
+    held = [jobs.claim(conn, "s", me), jobs.claim(conn, "s", me)]
+    jobs.finish(conn, held[0].id)
+
+    assert jobs.release(conn, "s", me) == 1
+    assert jobs.claim(conn, "s", me).key == "c"
+    resumed = jobs.claim(conn, "s", me)
+    assert (resumed.id, resumed.attempts) == (held[1].id, 2)
+
+
+def test_concurrent_workers_never_share_a_job(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    conn = jobs.connect(db)
+    jobs.enqueue(conn, "s", items(*(str(n) for n in range(60))))
+    conn.close()
+
+    worker = (
+        "import sys\n"
+        "from utils import jobs\n"
+        "conn = jobs.connect(sys.argv[1])\n"
+        "while True:\n"
+        "    job = jobs.claim(conn, 's', jobs.worker_id())\n"
+        "    if job is None:\n"
+        "        break\n"
+        "    print(job.key, flush=True)\n"
+        "    jobs.finish(conn, job.id)\n"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    procs = [subprocess.Popen([sys.executable, "-c", worker, db], cwd=root,
+                              stdout=subprocess.PIPE, text=True) for _ in range(4)]
+    claimed = [key for p in procs for key in p.communicate()[0].split()]
+
+    assert sorted(claimed, key=int) == [str(n) for n in range(60)]
+    conn = jobs.connect(db)
+    assert jobs.counts(conn, "s")["s"]["done"] == 60
+    conn.close()
+
+
+def test_main_prints_counts(tmp_path, capsys):
+    db = str(tmp_path / "jobs.sqlite")
+    conn = jobs.connect(db)
+    jobs.enqueue(conn, "scrape_pdf_text", items("a"))
+    conn.close()
+
+    table = jobs.main(["--jobs-db", db])
+    assert table["scrape_pdf_text"]["pending"] == 1
+    assert "scrape_pdf_text" in capsys.readouterr().out
@@ -114,9 +114,113 @@ def test_main_function_runs(tmp_path, monkeypatch):
     output_file = tmp_path / "data" / "output.json"
     output_file.parent.mkdir(parents=True)
 
-    monkeypatch.setattr(json_merge, "combine_json_files", lambda i, o: open(output_file, "w").write("[]"))
+    monkeypatch.setattr(json_merge, "combine_json_files", lambda i, o, d=None, keep=None: (open(output_file, "w").write("[]"), 0))
+    monkeypatch.setattr(sys, "argv", ["json_merge.py"])
 
     json_merge.main()
 
     assert output_file.exists()
-    assert json.loads(output_file.read_text()) == []
\ No newline at end of file
+    assert json.loads(output_file.read_text()) == []
+
+def test_append_json_items_keeps_valid_array(tmp_path):
+    output_file = tmp_path / "data" / "output.json"
+
+    json_merge.append_json_items(str(output_file), [])
+    assert json.loads(output_file.read_text()) == []
+
+    json_merge.append_json_items(str(output_file), [{"a": 1}])
+    assert json.loads(output_file.read_text()) == [{"a": 1}]
+
+    json_merge.append_json_items(str(output_file), [{"b": 2}, {"c": 3}])
+    assert json.loads(output_file.read_text()) == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+
+def test_append_json_items_rejects_non_array(tmp_path):
+    output_file = tmp_path / "output.json"
+    output_file.write_text('{"not": "a list"}')
+    with pytest.raises(ValueError):
+        json_merge.append_json_items(str(output_file), [{"a": 1}])
+
+
+def test_merge_shards_combines_in_shard_order(tmp_path, capsys):
+    shard_root = tmp_path / "shards"
+    for i, items in enumerate([[{"case_number": "A"}], [{"case_number": "B"}, {"case_number": "C"}]]):
+        d = shard_root / f"{i}-of-2"
+        d.mkdir(parents=True)
+        (d / "output.json").write_text(json.dumps(items))
+
+    output_file = tmp_path / "data" / "output.json"
+    assert json_merge.merge_shards(str(shard_root), str(output_file)) == 3
+    assert [d["case_number"] for d in json.loads(output_file.read_text())] == ["A", "B", "C"]
+
+
+def test_merge_shards_warns_about_missing_and_refuses_mixed_counts(tmp_path, capsys):
+    shard_root = tmp_path / "shards"
+    (shard_root / "0-of-3").mkdir(parents=True)
+    (shard_root / "0-of-3" / "output.json").write_text("[]")
+    output_file = tmp_path / "output.json"
+
+    json_merge.merge_shards(str(shard_root), str(output_file))
+    assert "missing output for shard(s) 1, 2 of 3" in capsys.readouterr().out
+
+    (shard_root / "1-of-2").mkdir()
+    (shard_root / "1-of-2" / "output.json").write_text("[]")
+    output_file.unlink()
+    assert json_merge.merge_shards(str(shard_root), str(output_file)) is None
+    assert "different counts" in capsys.readouterr().out
+    assert not output_file.exists()
+
+
+def test_merge_shards_without_outputs(tmp_path, capsys):
+    assert json_merge.merge_shards(str(tmp_path / "none"), str(tmp_path / "out.json")) is None
+    assert "No shard outputs found" in capsys.readouterr().out
+
+
+def test_duplicates_are_fanned_out(tmp_path):
+    input_dir = tmp_path / "json"
+    input_dir.mkdir()
+    a = {"case_number": "M.1", "year": "2024", "policy_area": "Merger",
+         "link": "https://x/a.pdf", "topic": "Cars", "text": "..."}
+    b = dict(a, case_number="M.4", link="https://x/b.pdf")
+    (input_dir / "file1.json").write_text(json.dumps([a, b]))
+    duplicates = tmp_path / "duplicate_cases.json"
+    duplicates.write_text(json.dumps({"https://x/a.pdf": [
+        {"case_number": "M.2", "year": "2023", "policy_area": "Merger", "link": "https://x/a.pdf"},
+        {"case_number": "M.3", "year": "2024", "policy_area": "Merger", "link": "https://x/copy.pdf"},
+    ]}))
+
+    output_file = tmp_path / "output.json"
+    counts = json_merge.main(["--indir", str(input_dir), "--output", str(output_file),
+                              "--duplicates", str(duplicates)])
+    data = json.loads(output_file.read_text())
+    assert counts["items"] == 4
+    assert [(d["case_number"], d["link"]) for d in data] == [
+        ("M.1", "https://x/a.pdf"), ("M.2", "https://x/a.pdf"),
+        ("M.3", "https://x/copy.pdf"), ("M.4", "https://x/b.pdf")]
+    assert data[1]["year"] == "2023" and data[2]["topic"] == "Cars"
+
+
+def test_links_merges_only_the_selected_cases(tmp_path):
+    from utils.artifact_store import ArtifactStore
+    from utils.links import write_links
+    batches, indir = tmp_path / "extracted_batches", tmp_path / "json"
+    batches.mkdir()
+    indir.mkdir()
+    store = str(tmp_path / "artifacts.sqlite")
+    with ArtifactStore(store) as artifacts:
+        for n in range(3):
+            (batches / f"pdf_texts_80_batch_{n}.txt").write_text(
+                f"Case Number: M.{n}\nYear: 2024\nPolicy Area: Merger\nLink: https://x/{n}.pdf\n\nText.\n")
+            definitions = json.dumps([{"case_number": f"M.{n}", "topic": "t"}])
+            (indir / f"extract-definitions_80_batch_{n}.json").write_text(definitions)
+            artifacts.put("definitions", f"M.{n}|https://x/{n}.pdf", definitions)
+    links = tmp_path / "links.jsonl"
+    write_links(links, [("M.1", 2024, "Merger", "https://x/1.pdf")])
+
+    output = tmp_path / "output.json"
+    argv = ["--output", str(output), "--duplicates", "", "--links", str(links)]
+    assert json_merge.main(argv + ["--indir", str(indir), "--batches", str(batches)])["items"] == 1
+    assert [d["case_number"] for d in json.loads(output.read_text())] == ["M.1"]
+
+    assert json_merge.main(argv + ["--store", store])["items"] == 1
+    assert [d["case_number"] for d in json.loads(output.read_text())] == ["M.1"]
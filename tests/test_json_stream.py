@@ -0,0 +1,160 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+from utils.json_stream import batched, iter_json_array, write_json_array
+from utils.links import write_links
+
+# Allowed peak-RSS growth between a 1k and a 100k corpus when streaming.
+# Loading the 100k corpus outright costs well over 100 MB.
+RSS_GROWTH_LIMIT_MB = 20
+
+# Links per hundred definitions given to scrape_pdf_text, and their text
+PDFS_PER_100 = 10
+PDF_TEXT = "Decision text. " * 800
+
+TEXT = ("The Commission considers that the relevant product market for widgets is "
+        "EEA-wide. The exact market definition can be left open since no serious "
+        "doubts arise as to its compatibility with the internal market. ") * 3
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    [1, 2.5, -1e-10, 12345678901234, True, None, "x]", {"a": [1, {"b": "],"}]}],
+    [{"text": "é" * 1000, "n": n} for n in range(50)],
+])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_array_round_trips(tmp_path, data, indent):
+    path = tmp_path / "a.json"
+    path.write_text(json.dumps(data, indent=indent), encoding="utf-8")
+    for chunk_size in (1, 3, 7, 1 << 16):
+        assert list(iter_json_array(str(path), chunk_size)) == data
+
+
+@pytest.mark.parametrize("text", ["{}", "[1 2]", "[1,", ""])
+def test_iter_json_array_rejects_non_arrays(tmp_path, text):
+    path = tmp_path / "a.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path)))
+
+
+def test_write_json_array_matches_json_dump(tmp_path):
+    path = str(tmp_path / "out" / "a.json")
+    for data in ([], [{"a": 1}], [{"a": [1, 2], "b": "c"}, {"d": None}]):
+        assert write_json_array(path, iter(data)) == len(data)
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == json.dumps(data, indent=4)
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 3)) == []
+
+
+def write_corpus(directory, n):
+    # two shards, so json_merge.merge_shards is exercised as well
+    for shard in range(2):
+        write_json_array(os.path.join(directory, "shards", f"{shard}-of-2", "output.json"), (
+            {"case_number": f"M.{i}", "year": str(2000 + i % 25), "policy_area": "Merger",
+             "link": f"https://ec.europa.eu/competition/{i}.pdf", "topic": f"Topic {i % 50}",
+             "text": TEXT}
+            for i in range(shard, n, 2)
+        ))
+    # and the per-batch files json_merge.combine_json_files reads, 100 a file
+    for start in range(0, n, 100):
+        write_json_array(os.path.join(directory, "json", f"extract-definitions_79_batch_{start}.json"), (
+            {"case_number": f"M.{i}", "topic": f"Topic {i % 50}", "text": TEXT}
+            for i in range(start, min(n, start + 100))
+        ))
+    # fewer links for scrape_pdf_text, whose texts are far longer: holding
+    # them all would cost about 120 MB at the larger size
+    write_links(os.path.join(directory, "links.jsonl"), (
+        (f"M.{i}", 2024, "Merger", f"https://ec.europa.eu/competition/{i}.pdf")
+        for i in range(n // 100 * PDFS_PER_100)
+    ))
+
+
+# Each step is run in a fresh interpreter; {d} is the corpus directory
+STEPS = {
+    "scrape_pdf_text": (
+        "from unittest import mock\n"
+        "from scripts import scrape_pdf_text\n"
+        "def download(url, *args):\n"
+        "    # a decision's (text, page count), as the PDF cache would hand it back\n"
+        f"    return (url + ' ' + {PDF_TEXT!r}, 40), None\n"
+        "with mock.patch.object(scrape_pdf_text, 'download_pdf', download):\n"
+        "    scrape_pdf_text.main(['-i', os.path.join(d, 'links.jsonl'), '--datadir', d,\n"
+        "                          '--no-cache', '--parse-workers', '0'])\n"
+    ),
+    "combine_json_files": (
+        "from scripts import json_merge\n"
+        "json_merge.combine_json_files(os.path.join(d, 'json'), os.path.join(d, 'combined.json'))\n"
+    ),
+    "merge_shards, analyze and export": (
+        "import analyze, export\n"
+        "from scripts import json_merge\n"
+        "out = os.path.join(d, 'output.json')\n"
+        "json_merge.merge_shards(os.path.join(d, 'shards'), out)\n"
+        "analyze.main(['--input', out, '--output', os.path.join(d, 'analysis.json'), '--stream'])\n"
+        "for fmt in ('jsonl', 'sqlite'):\n"
+        "    export.main(['--format', fmt, '--input', out, '--output', os.path.join(d, 'exports'),\n"
+        "                 '--max-memory', '100'])\n"
+    ),
+}
+
+
+def peak_rss_mb(directory, step):
+    code = (
+        "import contextlib, io, os, resource, sys\n"
+        "d = sys.argv[1]\n"
+        "with contextlib.redirect_stdout(io.StringIO()):\n"
+        + "".join("    " + line + "\n" for line in STEPS[step].splitlines()) +
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code, directory], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.split()[-1])
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="ru_maxrss is in KB only on Linux")
+def test_peak_rss_is_flat_when_streaming(tmp_path):
+    rss = {}
+    for n in (1_000, 100_000):
+        directory = str(tmp_path / str(n))
+        write_corpus(directory, n)
+        rss[n] = {step: peak_rss_mb(directory, step) for step in STEPS}
+
+    with open(os.path.join(directory, "analysis.json")) as f:
+        assert json.load(f)["summary"]["total_definitions"] == 100_000
+    assert len(os.listdir(os.path.join(directory, "extracted_batches"))) == 10_000
+    assert sum(1 for _ in iter_json_array(os.path.join(directory, "combined.json"))) == 100_000
+    for step in STEPS:
+        assert rss[100_000][step] - rss[1_000][step] < RSS_GROWTH_LIMIT_MB, (step, rss)
@@ -0,0 +1,116 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+import threading
+import time
+import pytest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils.links import Link, LinkWriter, read_links, write_links
+from scripts import scrape_pdf_text
+
+
+def test_links_round_trip_with_types(tmp_path):
+    path = tmp_path / "links.jsonl"
+    assert write_links(path, [("M.1", 2024, "Merger", "https://x/a.pdf"),
+                              (1234, None, "State Aid", "https://x/b.pdf")]) == 2
+    assert list(read_links(path)) == [Link("M.1", 2024, "Merger", "https://x/a.pdf"),
+                                      Link("1234", None, "State Aid", "https://x/b.pdf")]
+    assert list(scrape_pdf_text.read_links(path)) == [("M.1", "2024", "merger", "https://x/a.pdf"),
+                                                      ("1234", "Unknown", "state_aid", "https://x/b.pdf")]
+
+
+def test_unfinished_list_raises(tmp_path):
+    path = tmp_path / "links.jsonl"
+    with pytest.raises(RuntimeError):
+        with LinkWriter(path) as w:
+            w.write("M.1", 2024, "Merger", "https://x/a.pdf")
+            raise RuntimeError("register could not be read")
+    reader = read_links(path)
+    assert next(reader).case_number == "M.1"
+    with pytest.raises(ValueError, match="not finished"):
+        next(reader)
+
+
+def test_bad_line_names_its_number(tmp_path):
+    path = tmp_path / "links.jsonl"
+    path.write_text('{"case_number": "M.1", "year": 2024, "policy_area": "Merger", "link": "u"}\n'
+                    'Case Number: M.2\n')
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_links(path))
+
+
+def test_follow_yields_links_while_they_are_written(tmp_path):
+    path = tmp_path / "links.jsonl"
+    got = []
+    writer_done = threading.Event()
+
+    def follow():
+        for link in read_links(path, follow=True, poll=0.01, idle_timeout=5):
+            got.append((link.case_number, writer_done.is_set()))
+
+    reader = threading.Thread(target=follow)
+    reader.start()
+    time.sleep(0.05)    # the reader starts before the file exists
+    with LinkWriter(path) as w:
+        for n in range(3):
+            w.write(f"M.{n}", 2024, "Merger", f"https://x/{n}.pdf")
+            time.sleep(0.05)
+        while len(got) < 3 and reader.is_alive():
+            time.sleep(0.01)
+    writer_done.set()
+    reader.join(5)
+
+    assert not reader.is_alive()
+    # every link arrived before the writer had finished
+    assert got == [(f"M.{n}", False) for n in range(3)]
+
+
+def test_follow_gives_up_on_a_stalled_list(tmp_path):
+    path = tmp_path / "links.jsonl"
+    path.write_text("")
+    with pytest.raises(TimeoutError):
+        list(read_links(path, follow=True, poll=0.01, idle_timeout=0.05))
+
+
+def test_scrape_pdf_text_follows_a_growing_list(tmp_path, capsys):
+    path = tmp_path / "links.jsonl"
+
+    def write():
+        with LinkWriter(path) as w:
+            for n in range(3):
+                w.write(f"M.{n}", 2024, "Merger", f"https://ec.europa.eu/competition/mergers/{n}.pdf")
+                time.sleep(0.05)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    with mock.patch.object(scrape_pdf_text, "download_pdf", return_value=(None, "Error: HTTP 404")):
+        counts = scrape_pdf_text.main(["-i", str(path), "--datadir", str(tmp_path), "--no-cache",
+                                       "--follow", "--parse-workers", "0"])
+    writer.join()
+
+    assert counts == {"items": 3, "skipped": 0, "failed": 3}
+    assert (tmp_path / "excluded_cases.txt").read_text().count("Case Number:") == 3
@@ -0,0 +1,81 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import manifest as mf
+
+
+def test_hash_text_separates_parts():
+    assert mf.hash_text("ab", "c") != mf.hash_text("a", "bc")
+    assert mf.hash_text("a", "b") == mf.hash_text("a", "b")
+
+
+def test_file_hash_memoises_by_stat(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    manifest = mf.load_manifest(None)
+
+    first = mf.file_hash(str(path), manifest)
+    assert manifest["files"][str(path)][2] == first
+
+    path.write_text("hello world")
+    assert mf.file_hash(str(path), manifest) != first
+
+
+def test_lookup_requires_same_input_and_existing_outputs(tmp_path):
+    out = tmp_path / "out.txt"
+    out.write_text("result")
+    manifest = mf.load_manifest(None)
+
+    mf.record(manifest, "case-1", "hash-a", [str(out)])
+    assert mf.lookup(manifest, "case-1", "hash-a") is not None
+    assert mf.lookup(manifest, "case-1", "hash-b") is None
+    assert mf.lookup(manifest, "case-2", "hash-a") is None
+
+    out.unlink()
+    assert mf.lookup(manifest, "case-1", "hash-a") is None
+
+
+def test_lookup_without_manifest_is_always_stale():
+    assert mf.lookup(None, "case-1", "hash-a") is None
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "manifest" / "stage.json")
+    manifest = mf.load_manifest(path)
+    mf.record(manifest, "case-1", "hash-a", reason="Excluded by criteria")
+    mf.save_manifest(manifest, path)
+
+    loaded = mf.load_manifest(path)
+    assert loaded["items"]["case-1"]["reason"] == "Excluded by criteria"
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_load_manifest_ignores_corrupt_file(tmp_path, capsys):
+    path = tmp_path / "stage.json"
+    path.write_text("{not json")
+    assert mf.load_manifest(str(path)) == {"items": {}, "files": {}}
+    assert "Ignoring unreadable manifest" in capsys.readouterr().out
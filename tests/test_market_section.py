@@ -0,0 +1,133 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import os
+import sys
+from io import BytesIO
+from unittest import mock
+from PyPDF2 import PdfReader, PdfWriter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import market_section as ms
+from scripts import scrape_pdf_text
+
+FILLER = "The Commission notes that the parties overlap in several markets. " * 6
+
+
+def decision_pages(filler=FILLER):
+    return [
+        "I. INTRODUCTION",
+        filler,
+        "IV. MARKET DEFINITION",
+        "A. Product market definition",
+        filler,
+        "B. Geographic market definition",
+        filler,
+        "V. COMPETITIVE ASSESSMENT",
+        filler,
+        "VI. CONCLUSION",
+    ]
+
+
+def with_outline(pdf, entries):
+    writer = PdfWriter()
+    writer.append_pages_from_reader(PdfReader(BytesIO(pdf)))
+    parents = {}
+    for depth, title, page in entries:
+        parents[depth] = writer.add_outline_item(title, page, parent=parents.get(depth - 1))
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_next_labels():
+    assert ms.next_labels("IV") == {"V"}
+    assert ms.next_labels("IX") == {"X"}
+    assert ms.next_labels("B") == {"C"}
+    assert ms.next_labels("4.2") == {"4.3", "5"}
+    assert ms.next_labels("3") == {"4"}
+
+
+def test_scanner_stops_at_next_heading_of_the_same_level():
+    scanner = ms.SectionScanner()
+    for page in decision_pages():
+        scanner.feed(page)
+        if scanner.done:
+            break
+    assert scanner.done
+    text = scanner.text()
+    assert text.startswith("IV. MARKET DEFINITION")
+    assert "B. Geographic market definition" in text
+    assert "COMPETITIVE ASSESSMENT" not in text
+
+
+def test_scanner_skips_table_of_contents():
+    scanner = ms.SectionScanner()
+    scanner.feed("CONTENTS\nIV. Market definition\nV. Competitive assessment\nVI. Conclusion")
+    for page in decision_pages():
+        scanner.feed(page)
+    assert scanner.text().startswith("IV. MARKET DEFINITION")
+    assert len(scanner.text()) > ms.MIN_SECTION_CHARS
+
+
+def test_numbered_paragraphs_do_not_open_the_section():
+    scanner = ms.SectionScanner()
+    scanner.feed("12. market definition is a tool to identify and define the boundaries of "
+                 "competition between firms, as the Notice on market definition explains.")
+    assert scanner.text() is None
+
+
+def test_heading_scan_reads_no_pages_after_the_section(make_pdf):
+    pdf = make_pdf(decision_pages())
+    read = []
+    real = PdfReader
+    class CountingReader:
+        def __init__(self, stream):
+            self.reader = real(stream)
+            self.pages = [mock.Mock(extract_text=lambda p=p, n=n: read.append(n) or p.extract_text())
+                          for n, p in enumerate(self.reader.pages)]
+            self.outline = []
+    with mock.patch("utils.pdf_backends.PdfReader", CountingReader):
+        text, pages = scrape_pdf_text.extract_market_section(pdf)
+
+    assert pages == 10
+    assert text.startswith("IV. MARKET DEFINITION") and "COMPETITIVE" not in text
+    assert read == list(range(8))
+
+
+def test_outline_narrows_the_pages_read(make_pdf):
+    pdf = with_outline(make_pdf(decision_pages()), [
+        (0, "I. Introduction", 0),
+        (0, "IV. Market definition", 2),
+        (1, "A. Product market definition", 3),
+        (0, "V. Competitive assessment", 7),
+    ])
+    assert ms.outline_range(PdfReader(BytesIO(pdf))) == (2, 8)
+
+    text, _ = scrape_pdf_text.extract_market_section(pdf)
+    assert text.startswith("IV. MARKET DEFINITION") and "COMPETITIVE" not in text
+
+
+def test_falls_back_to_whole_document(make_pdf):
+    pages = ["Decision", FILLER, "Annex"]
+    pdf = make_pdf(pages + ["Signed"])
+    assert scrape_pdf_text.extract_market_section(pdf) == scrape_pdf_text.extract_text(pdf)
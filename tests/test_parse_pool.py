@@ -0,0 +1,143 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import os
+import signal
+import sys
+import time
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import parse_pool as pp
+from utils.parse_pool import ParsePool
+
+
+def square(n):
+    return n * n
+
+
+def spin(n):
+    # pure-Python busy work, like PyPDF2's parser
+    if n == "forever":
+        while True:
+            pass
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def explode(n):
+    if n == 2:
+        raise ValueError("bad pdf")
+    return n
+
+
+def die(n):
+    if n == 2:
+        os._exit(1)
+    return n
+
+
+def hang_uninterruptibly(n):
+    if n == 2:
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        time.sleep(30)
+    return n
+
+
+def items(values):
+    return ((v, v) for v in values)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_results_in_input_order(workers):
+    with ParsePool(workers=workers) as pool:
+        out = list(pool.map(square, items(range(20))))
+    assert out == [(n, n * n, None) for n in range(20)]
+
+
+def test_none_passes_through_without_a_worker():
+    with ParsePool(workers=2) as pool:
+        out = list(pool.map(square, [("a", 3), ("b", None), ("c", 4)]))
+    assert out == [("a", 9, None), ("b", None, None), ("c", 16, None)]
+
+
+def test_errors_are_returned_per_item():
+    with ParsePool(workers=2) as pool:
+        out = list(pool.map(explode, items(range(4))))
+    assert [r for _, r, _ in out] == [0, 1, None, 3]
+    assert isinstance(out[2][2], ValueError)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_slow_item_times_out_and_the_rest_finish(workers):
+    with ParsePool(workers=workers, timeout=0.3) as pool:
+        start = time.monotonic()
+        out = list(pool.map(spin, items([10, "forever", 20])))
+    assert out[0] == (10, 45, None) and out[2] == (20, 190, None)
+    assert isinstance(out[1][2], TimeoutError)
+    assert time.monotonic() - start < 5
+
+
+def test_crashed_worker_is_replaced():
+    with ParsePool(workers=2) as pool:
+        out = list(pool.map(die, items(range(5))))
+    # only the document that killed its worker is lost
+    assert [r for _, r, _ in out] == [0, 1, None, 3, 4]
+    assert isinstance(out[2][2], BrokenProcessPool)
+
+
+@pytest.mark.skipif(not hasattr(signal, "pthread_sigmask"), reason="POSIX only")
+def test_stuck_worker_is_killed(monkeypatch):
+    monkeypatch.setattr(pp, "GRACE", 0.3)
+    with ParsePool(workers=2, timeout=0.2) as pool:
+        start = time.monotonic()
+        out = list(pool.map(hang_uninterruptibly, items(range(5))))
+    assert isinstance(out[2][2], TimeoutError)
+    assert [r for _, r, _ in out if r is not None] == [0, 1, 3, 4]
+    assert time.monotonic() - start < 10
+
+
+def test_items_are_drawn_lazily():
+    drawn = []
+    def source():
+        for n in range(100):
+            drawn.append(n)
+            yield n, n
+    with ParsePool(workers=2, queue_size=4) as pool:
+        results = pool.map(square, source())
+        next(results)
+        assert len(drawn) <= 5
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="needs at least 4 cores")
+def test_throughput_scales_with_workers():
+    work = [2_000_000] * 8
+    elapsed = {}
+    for workers in (1, 4):
+        with ParsePool(workers=workers) as pool:
+            start = time.monotonic()
+            list(pool.map(spin, items(work)))
+            elapsed[workers] = time.monotonic() - start
+    assert elapsed[4] < elapsed[1] / 2, elapsed
@@ -0,0 +1,104 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import pdf_backends
+from scripts import scrape_pdf_text
+
+PAGES = ["Market definition of the relevant product market", "Geographic market is EEA-wide"]
+
+
+@pytest.fixture(params=list(pdf_backends.BACKENDS))
+def backend(request):
+    pytest.importorskip(pdf_backends.BACKENDS[request.param][1])
+    return request.param
+
+
+def test_every_backend_reads_the_same_pages(backend, make_pdf):
+    doc = pdf_backends.open_pdf(make_pdf(PAGES), backend)
+    assert len(doc.pages) == 2
+    assert [p.extract_text().strip() for p in doc.pages] == PAGES
+    assert doc.outline == [] or backend == "pypdf2"
+
+
+def test_leaving_a_document_closes_what_was_opened_for_it(backend, make_pdf, tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(make_pdf(PAGES))
+    with pdf_backends.open_pdf(str(path), backend) as doc:
+        assert doc.pages[0].extract_text().strip() == PAGES[0]
+    with pytest.raises(Exception):
+        doc.pages[1].extract_text()
+
+    # a file passed in is the caller's to close
+    with open(path, "rb") as f:
+        with pdf_backends.open_pdf(f, backend) as doc:
+            assert doc.pages[1].extract_text().strip() == PAGES[1]
+        assert not f.closed
+
+
+def test_extraction_through_a_backend(backend, make_pdf):
+    text, pages = scrape_pdf_text.extract_text(make_pdf(PAGES * 3), backend)
+    assert pages == 6
+    assert text.count("Geographic market is EEA-wide") == 3
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="unknown PDF backend"):
+        pdf_backends.open_pdf(b"%PDF", "nope")
+
+
+def test_agreement():
+    assert pdf_backends.agreement("the relevant market", "The  relevant\nmarket") == 1.0
+    assert pdf_backends.agreement("a b c d", "a b") == pytest.approx(2 * 2 / 6)
+    assert pdf_backends.agreement("", "") == 1.0
+
+
+def test_text_kind_names_the_backend():
+    assert scrape_pdf_text.text_kind("full") == "full"
+    assert scrape_pdf_text.text_kind("market", "pdfminer") == "market.pdfminer"
+    assert scrape_pdf_text.link_hash("M.1", "2024", "merger", "u") != \
+        scrape_pdf_text.link_hash("M.1", "2024", "merger", "u", "full.pdfminer")
+
+
+def test_bench_reports_each_backend(tmp_path, make_pdf, capsys):
+    for n in range(3):
+        (tmp_path / f"{n}.pdf").write_bytes(make_pdf(PAGES * (n + 1)))
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+
+    results = pdf_backends.main(["--corpus", str(tmp_path), "--backends", "pypdf2"])
+    assert capsys.readouterr().out.startswith(f"[bench] 4 PDFs from {tmp_path}")
+    (r,) = results
+    assert (r["backend"], r["docs"], r["failed"], r["pages"]) == ("pypdf2", 3, 1, 12)
+    assert r["pages_per_sec"] > 0 and r["agreement"] == 1.0
+    if sys.platform != "win32":
+        assert r["peak_mb"] > 0
+
+
+def test_bench_refuses_missing_backends(tmp_path, make_pdf, monkeypatch):
+    (tmp_path / "a.pdf").write_bytes(make_pdf(PAGES))
+    monkeypatch.setattr(pdf_backends, "available", lambda: ["pypdf2"])
+    with pytest.raises(SystemExit):
+        pdf_backends.main(["--corpus", str(tmp_path), "--backends", "pypdf2,pypdfium2"])
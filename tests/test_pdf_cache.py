@@ -0,0 +1,182 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import os
+import sys
+import requests
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils.downloader import Downloader
+from utils.pdf_cache import PdfCache
+from scripts import scrape_pdf_text
+from utils.links import write_links
+
+
+def validated(body, etag='"v1"', last_modified="Wed, 01 Jan 2025 00:00:00 GMT"):
+    """
+    A route that answers 304 when the client already has `etag`.
+    """
+    def route(handler, n):
+        if handler.headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Last-Modified": last_modified}, body
+    return route
+
+
+def fast():
+    return Downloader(backoff=0.01, retries=1)
+
+
+def test_unchanged_pdf_is_revalidated_not_downloaded(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    cache = PdfCache(str(tmp_path / "cache"))
+    url = http_server.url("/a.pdf")
+
+    assert cache.fetch(url, fast()) == 200
+    assert cache.content(url) == b"%PDF v1"
+    cache.store_text(url, "text of v1", 4)
+
+    seen = []
+    http_server.routes["/a.pdf"] = lambda h, n: (seen.append(dict(h.headers)),
+                                                 validated(b"%PDF v1")(h, n))[1]
+    assert cache.fetch(url, fast()) == 200
+    assert seen[0]["If-None-Match"] == '"v1"'
+    assert seen[0]["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert cache.load_text(url) == ("text of v1", 4)
+
+
+def test_changed_pdf_replaces_cached_text(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    cache = PdfCache(str(tmp_path / "cache"))
+    url = http_server.url("/a.pdf")
+    cache.fetch(url, fast())
+    cache.store_text(url, "text of v1", 4)
+
+    http_server.routes["/a.pdf"] = validated(b"%PDF v2", etag='"v2"')
+    assert cache.fetch(url, fast()) == 200
+    assert cache.content(url) == b"%PDF v2"
+    assert cache.load_text(url) is None
+
+
+def test_new_validator_for_same_bytes_keeps_text(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    cache = PdfCache(str(tmp_path / "cache"))
+    url = http_server.url("/a.pdf")
+    cache.fetch(url, fast())
+    cache.store_text(url, "text of v1", 4)
+
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1", etag='"rebuilt"')
+    cache.fetch(url, fast())
+    assert cache.load_text(url) == ("text of v1", 4)
+    assert cache.meta(url)["etag"] == '"rebuilt"'
+
+
+def test_offline_makes_no_requests(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    url = http_server.url("/a.pdf")
+    PdfCache(str(tmp_path / "cache")).fetch(url, fast())
+
+    offline = PdfCache(str(tmp_path / "cache"), offline=True)
+    assert offline.fetch(url, fast()) == 200
+    assert offline.fetch(http_server.url("/b.pdf"), fast()) is None
+    assert http_server.hits == {"/a.pdf": 1}
+
+
+def test_max_age_skips_revalidation(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    url = http_server.url("/a.pdf")
+    cache = PdfCache(str(tmp_path / "cache"), max_age=3600)
+    cache.fetch(url, fast())
+    cache.fetch(url, fast())
+    assert http_server.hits["/a.pdf"] == 1
+
+
+def test_unreachable_server_falls_back_to_cached_copy(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    url = http_server.url("/a.pdf")
+    cache = PdfCache(str(tmp_path / "cache"))
+    cache.fetch(url, fast())
+
+    broken = mock.Mock(download=mock.Mock(side_effect=requests.ConnectionError("down")))
+    assert cache.fetch(url, broken) == 200
+    assert cache.content(url) == b"%PDF v1"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), max_bytes=2500)
+    for n, t in enumerate((100, 300, 200)):
+        url = f"https://example.org/{n}.pdf"
+        cache._write(cache._path(url, ".pdf"), b"x" * 1000)
+        cache._write_json(url, {"url": url, "sha256": str(n), "checked": t})
+        os.utime(cache._path(url, ".json"), (t, t))
+
+    assert cache.evict() == 1
+    assert cache.meta("https://example.org/0.pdf") is None
+    assert cache.meta("https://example.org/1.pdf") is not None
+    assert cache.meta("https://example.org/2.pdf") is not None
+
+
+def test_rerun_downloads_and_parses_nothing(tmp_path, http_server):
+    links = tmp_path / "extracted_links.jsonl"
+    for n in range(3):
+        http_server.routes[f"/{n}.pdf"] = validated(f"decision {n}".encode())
+    write_links(links, [(f"M.{n}", 2024, "Merger", http_server.url(f"/{n}.pdf")) for n in range(3)])
+
+    parsed = []
+    class Reader:
+        def __init__(self, stream):
+            text = stream.read().decode()
+            parsed.append(text)
+            self.pages = [mock.Mock(extract_text=lambda: text)] * 4
+
+    argv = ["-i", str(links), "--datadir", str(tmp_path / "run1"),
+            "--cache-dir", str(tmp_path / "cache"), "--parse-workers", "0"]
+    with mock.patch("utils.pdf_backends.PdfReader", Reader):
+        assert scrape_pdf_text.main(argv)["items"] == 3
+        argv[3] = str(tmp_path / "run2")
+        assert scrape_pdf_text.main(argv)["items"] == 3
+        argv[3] = str(tmp_path / "run3")
+        assert scrape_pdf_text.main(argv + ["--offline"])["items"] == 3
+
+    assert len(parsed) == 3
+    # the second run only revalidated; the offline run sent nothing
+    assert all(n == 2 for n in http_server.hits.values())
+    assert (tmp_path / "run3" / "extracted_batches" / "pdf_texts_79_batch_1.txt").read_text() == \
+        (tmp_path / "run1" / "extracted_batches" / "pdf_texts_79_batch_1.txt").read_text()
+
+
+def test_each_kind_of_text_is_kept_separately(tmp_path, http_server):
+    http_server.routes["/a.pdf"] = validated(b"%PDF v1")
+    cache = PdfCache(str(tmp_path / "cache"))
+    url = http_server.url("/a.pdf")
+    cache.fetch(url, fast())
+    cache.store_text(url, "whole decision", 40)
+    assert cache.load_text(url, "market") is None
+
+    cache.store_text(url, "IV. Market definition", 40, kind="market")
+    assert cache.load_text(url) == ("whole decision", 40)
+    assert cache.load_text(url, "market") == ("IV. Market definition", 40)
+
+    # eviction removes every file of the entry
+    PdfCache(str(tmp_path / "cache"), max_bytes=0).evict()
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,152 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import pytest
+from PyPDF2 import PdfReader
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils.downloader import Downloader
+from utils.range_reader import open_ranged
+from scripts import scrape_pdf_text
+from utils.links import write_links
+
+
+def ranged(body, sent=None):
+    """
+    A route serving `body` that honours Range headers like a real server;
+    the number of body bytes sent is appended to `sent`.
+    """
+    def route(handler, n):
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", handler.headers.get("Range", ""))
+        if not m:
+            part, status, headers = body, 200, {}
+        else:
+            if m.group(1):
+                start = int(m.group(1))
+                stop = min(int(m.group(2)), len(body) - 1) if m.group(2) else len(body) - 1
+            else:
+                start, stop = max(0, len(body) - int(m.group(2))), len(body) - 1
+            part, status = body[start:stop + 1], 206
+            headers = {"Content-Range": f"bytes {start}-{stop}/{len(body)}"}
+        if sent is not None:
+            sent.append(len(part))
+        return status, {"Accept-Ranges": "bytes", **headers}, part
+    return route
+
+
+def test_reads_match_the_file(http_server):
+    body = os.urandom(100_000)
+    http_server.routes["/a.pdf"] = ranged(body)
+    f = open_ranged(http_server.url("/a.pdf"), Downloader(), block_size=4096, tail=10_000)
+    assert (f.size, f.fetched, f.requests) == (100_000, 10_000, 1)
+
+    for start, size in [(0, 10), (5000, 9000), (99_990, 50), (95_000, 1000), (0, -1)]:
+        f.seek(start)
+        assert f.read(size) == (body[start:start + size] if size >= 0 else body[start:])
+    f.seek(-5, os.SEEK_END)
+    assert f.read() == body[-5:] and f.tell() == 100_000
+    assert f.read(10) == b""
+
+
+def test_blocks_are_fetched_once(http_server):
+    body = os.urandom(50_000)
+    sent = []
+    http_server.routes["/a.pdf"] = ranged(body, sent)
+    f = open_ranged(http_server.url("/a.pdf"), Downloader(), block_size=1000, tail=1000)
+    f.seek(10_000)
+    f.read(2500)
+    f.seek(10_500)
+    f.read(1000)
+    # the tail, then blocks 10-12 in one request
+    assert sent == [1000, 3000]
+    assert f.requests == 2 and f.fetched == 4000
+
+
+def test_no_range_support(http_server):
+    http_server.routes["/a.pdf"] = lambda handler, n: (200, {}, b"%PDF whole file")
+    assert open_ranged(http_server.url("/a.pdf"), Downloader()) is None
+    assert open_ranged(http_server.url("/missing.pdf"), Downloader()) is None
+
+
+def test_page_count_without_the_whole_file(http_server, make_pdf):
+    pdf = make_pdf([f"page {n}" for n in range(3)], padding=1_000_000)
+    http_server.routes["/a.pdf"] = ranged(pdf)
+    f = open_ranged(http_server.url("/a.pdf"), Downloader())
+    reader = PdfReader(f)
+    assert len(reader.pages) == 3
+    assert reader.pages[2].extract_text() == "page 2"
+    assert f.fetched < len(pdf) / 5
+
+
+def test_range_refused_later(http_server):
+    body = os.urandom(10_000)
+    route = ranged(body)
+    http_server.routes["/a.pdf"] = lambda handler, n: route(handler, n) if n == 1 else (200, {}, body)
+    f = open_ranged(http_server.url("/a.pdf"), Downloader(), block_size=1000, tail=1000)
+    with pytest.raises(IOError):
+        f.read(10)
+
+
+def test_triage_excludes_short_decision_from_a_few_ranges(http_server, make_pdf):
+    pdf = make_pdf(["Decision", "The European Commission has decided not to oppose the "
+                    "notified operation", "signatures"], padding=1_000_000)
+    sent = []
+    http_server.routes["/a.pdf"] = ranged(pdf, sent)
+    url = http_server.url("/a.pdf")
+    assert scrape_pdf_text.download_pdf(url, triage=True) == ((None, 3), None)
+    assert sum(sent) < len(pdf) / 5
+
+
+def test_triage_downloads_longer_decisions_in_full(http_server, make_pdf):
+    pages = [f"page {n}" for n in range(4)]
+    pdf = make_pdf(pages)
+    sent = []
+    http_server.routes["/a.pdf"] = ranged(pdf, sent)
+    data, reason = scrape_pdf_text.download_pdf(http_server.url("/a.pdf"), triage=True)
+    assert data == pdf and reason is None
+    assert sent[-1] == len(pdf)
+
+
+def test_triage_falls_back_without_range_support(http_server, make_pdf):
+    pdf = make_pdf(["a", "b", "c"])
+    http_server.routes["/a.pdf"] = lambda handler, n: (200, {}, pdf)
+    assert scrape_pdf_text.download_pdf(http_server.url("/a.pdf"), triage=True) == (pdf, None)
+    assert http_server.hits["/a.pdf"] == 2
+
+
+def test_range_triage_in_main(tmp_path, http_server, make_pdf, capsys):
+    http_server.routes["/short.pdf"] = ranged(make_pdf(["one", "two", "three"]))
+    http_server.routes["/long.pdf"] = ranged(make_pdf(["one", "two", "three", "four"]))
+    links = tmp_path / "extracted_links.jsonl"
+    write_links(links, [(f"M.{n}", 2024, "Merger", http_server.url(f"/{n}.pdf")) for n in ("short", "long")])
+    counts = scrape_pdf_text.main(["-i", str(links), "--datadir", str(tmp_path), "--no-cache",
+                                   "--range-triage", "--parse-workers", "0"])
+    assert counts == {"items": 2, "skipped": 0, "failed": 0}
+    out = capsys.readouterr().out
+    # only the short decision was decided from ranges
+    assert out.count("[triage]") == 1 and "short.pdf" in out.split("[triage]")[1].split("\n")[0]
+    texts = [p.read_text() for p in (tmp_path / "extracted_batches").glob("*.txt")]
+    assert sorted(t.rsplit("\n", 1)[-1] for t in texts) == ["onetwothree", "onetwothreefour"]
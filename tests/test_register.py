@@ -0,0 +1,89 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import datetime
+import os
+import sys
+import pandas as pd
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import register
+
+
+def write_workbook(path, cases):
+    pd.DataFrame({
+        "Case number": [c for c, _ in cases],
+        " Decisions ": [f"Decision text: EN - https://ec.europa.eu/competition/mergers/{c}.pdf"
+                        for c, _ in cases],
+        "Title": ["unused"] * len(cases),
+        "Last decision date": [d for _, d in cases],
+    }).to_excel(path, index=False)
+
+
+def test_read_register_keeps_only_the_needed_columns(tmp_path):
+    path = tmp_path / "cases.xlsx"
+    write_workbook(path, [("M.1", "01.02.2020"), ("M.2", datetime.datetime(2021, 3, 4))])
+    df = register.read_register(path)
+    assert list(df.columns) == ["Decisions", "Case number", "Last decision date"]
+    assert df["Case number"].tolist() == ["M.1", "M.2"]
+    # a real date cell reads as the register's own DD.MM.YYYY text
+    assert df["Last decision date"].tolist() == ["01.02.2020", "04.03.2021"]
+
+
+def test_load_register_reuses_its_copy_until_the_workbook_changes(tmp_path, capsys):
+    path, cache = tmp_path / "cases.xlsx", tmp_path / "cache"
+    write_workbook(path, [("M.1", "01.02.2020")])
+    first = register.load_register(path, cache)
+    assert len(os.listdir(cache)) == 1
+
+    with mock.patch.object(register, "read_register") as read:
+        again = register.load_register(path, cache)
+    read.assert_not_called()
+    assert again.equals(first)
+    assert "unchanged; loaded 1 rows" in capsys.readouterr().out
+
+    write_workbook(path, [("M.1", "01.02.2020"), ("M.2", "05.06.2022")])
+    changed = register.load_register(path, cache)
+    assert changed["Case number"].tolist() == ["M.1", "M.2"]
+    # the copy of the old workbook was replaced
+    assert len(os.listdir(cache)) == 1
+
+
+def test_unreadable_copy_is_read_again(tmp_path, capsys):
+    path, cache = tmp_path / "cases.xlsx", tmp_path / "cache"
+    write_workbook(path, [("M.1", "01.02.2020")])
+    register.load_register(path, cache)
+    (copy,) = cache.iterdir()
+    copy.write_bytes(b"not a dataframe")
+
+    df = register.load_register(path, cache)
+    assert df["Case number"].tolist() == ["M.1"]
+    assert "Ignoring unreadable copy" in capsys.readouterr().out
+
+
+def test_no_cache_dir_always_reads_the_workbook(tmp_path):
+    path = tmp_path / "cases.xlsx"
+    write_workbook(path, [("M.1", "01.02.2020")])
+    assert register.load_register(path, None)["Case number"].tolist() == ["M.1"]
+    assert not (tmp_path / "data").exists()
@@ -28,91 +28,279 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
 
 import glob
-import subprocess
+import threading
 import pytest
 
 import run_pipeline
+from run_pipeline import Stage
 
 
-def test_safe_run_missing_paths(monkeypatch, capsys):
+def make_stage(name, func=lambda: None, inputs=(), deps=()):
+    return Stage(name, func, list(inputs), [], list(deps))
+
+
+def test_run_stage_missing_paths(monkeypatch, capsys):
 
     monkeypatch.setattr(os.path, "exists", lambda path: False)
-    run_pipeline.safe_run(
-        ["python", "script.py"],
-        description="step1",
-        input_paths=["foo.txt", "bar.txt"],
-    )
+    ran = run_pipeline.run_stage(make_stage("step1", inputs=["foo.txt", "bar.txt"]))
 
     captured = capsys.readouterr().out
     assert "Warning: missing foo.txt, bar.txt; skipping step1." in captured
+    assert ran is False
 
 
-def test_safe_run_missing_default_description(monkeypatch, capsys):
-    # If description is None, it should fall back to cmd[1]
-    monkeypatch.setattr(os.path, "exists", lambda path: False)
-    run_pipeline.safe_run(["python", "myscript.py"], input_paths=["x"])
+def test_run_stage_success(monkeypatch, capsys):
+    monkeypatch.setattr(os.path, "exists", lambda path: True)
+
+    calls = []
+    ran = run_pipeline.run_stage(make_stage("hello", func=lambda: calls.append("hello"), inputs=["x"]))
+    out = capsys.readouterr().out
+
+    assert out.startswith("Running: hello")
+    assert calls == ["hello"]
+    assert ran is True
+
+
+def test_run_stage_exception(capsys):
+    def boom():
+        raise FileNotFoundError("no_such_file.txt")
+
+    ran = run_pipeline.run_stage(make_stage("fetch", func=boom))
     captured = capsys.readouterr().out
-    assert "Warning: missing x; skipping myscript.py." in captured
+    assert "Warning: step fetch failed (no_such_file.txt); continuing." in captured
+    assert ran is False
 
 
-def test_safe_run_success(monkeypatch, capsys):
-    # Simulate all inputs exist and subprocess.run succeeds
-    monkeypatch.setattr(os.path, "exists", lambda path: True)
+def test_run_stage_system_exit(capsys):
+    def bad_args():
+        raise SystemExit(2)
+
+    ran = run_pipeline.run_stage(make_stage("desc2", func=bad_args))
+    captured = capsys.readouterr().out
+    assert "Warning: step desc2 failed (exit 2); continuing." in captured
+    assert ran is False
+
 
+def test_run_stage_appends_report_record(tmp_path):
+    out = tmp_path / "out.txt"
+
+    def work():
+        out.write_text("12345")
+        return {"items": 4, "skipped": 1, "failed": 0}
+
+    report = []
+    stage = Stage("work", work, [], [str(out)], [])
+    assert run_pipeline.run_stage(stage, report) is True
+
+    assert report[0]["stage"] == "work"
+    assert report[0]["status"] == "ok"
+    assert report[0]["items"] == 4
+    assert report[0]["skipped"] == 1
+    assert report[0]["bytes_out"] == 5
+
+
+def test_run_stage_reports_store_bytes_per_kind(tmp_path):
+    from utils.artifact_store import ArtifactStore
+    store = str(tmp_path / "artifacts.sqlite")
+    with ArtifactStore(store) as artifacts:
+        artifacts.put("batches", "M.1|a", "batch text " * 100)
+
+    def work():
+        with ArtifactStore(store) as artifacts:
+            artifacts.put("sections", "M.1|a", "section")
+
+    report = []
+    stage = Stage("chunks", work, [store], [store], [],
+                  sizes_in=[(store, "batches")], sizes_out=[(store, "sections")])
+    assert run_pipeline.run_stage(stage, report) is True
+    with ArtifactStore(store) as artifacts:
+        stats = artifacts.stats()
+    assert report[0]["bytes_in"] == stats["batches"][2]
+    assert report[0]["bytes_out"] == stats["sections"][2]
+    assert report[0]["bytes_out"] < report[0]["bytes_in"] < os.path.getsize(store)
+
+
+def test_run_stage_reports_skips_and_failures():
+    def boom():
+        raise RuntimeError("bad")
+
+    report = []
+    run_pipeline.run_stage(make_stage("missing", inputs=["nope.txt"]), report)
+    run_pipeline.run_stage(make_stage("broken", func=boom), report)
+    assert [r["status"] for r in report] == ["skipped", "failed"]
+
+
+def test_stage_entry_calls_module_main_in_process(monkeypatch):
     calls = []
-    def fake_run(cmd, check):
-        calls.append((cmd, check))
+    from scripts import clean_json
+    monkeypatch.setattr(clean_json, "main", lambda argv: calls.append(argv))
 
-    monkeypatch.setattr(subprocess, "run", fake_run)
+    run_pipeline.stage_entry("scripts.clean_json", ["--indir", "json"])()
+    assert calls == [["--indir", "json"]]
 
-    run_pipeline.safe_run([sys.executable, "hello.py", "--opt"], description=None)
-    out = capsys.readouterr().out
 
-    assert out.startswith("Running: ")
-    assert calls == [([sys.executable, "hello.py", "--opt"], True)]
+def test_build_stages_declares_chunk_sizes():
+    both = {s.name: s for s in run_pipeline.build_stages("both")}
+    assert both["scrape_individual"].deps == ["scrape_chunks_79", "scrape_chunks_80"]
+    assert both["scrape_chunks_79"].deps == ["scrape_pdf_text"]
 
+    only_80 = {s.name for s in run_pipeline.build_stages("80")}
+    assert "scrape_chunks_80" in only_80
+    assert "scrape_chunks_79" not in only_80
 
-def test_safe_run_file_not_found(monkeypatch, capsys):
-    monkeypatch.setattr(os.path, "exists", lambda path: True)
 
-    def fake_run(cmd, check):
-        e = FileNotFoundError()
-        e.filename = cmd[1]
-        raise e
+def test_build_stages_stream_mode():
+    stages = run_pipeline.build_stages(stream=True)
+    assert [s.name for s in stages] == ["scrape_links", "stream_pipeline"]
+    assert stages[1].deps == ["scrape_links"]
 
-    monkeypatch.setattr(subprocess, "run", fake_run)
 
-    run_pipeline.safe_run(
-        ["python", "no_such_script.py"],
-        description="fetch"
-    )
-    captured = capsys.readouterr().out
-    assert "Warning: file or script not found (no_such_script.py); skipping fetch." in captured
+def test_build_stages_shard_mode_uses_shard_directory():
+    stages = {s.name: s for s in run_pipeline.build_stages(shard=(1, 4))}
+    shard = os.path.join("data", "shards", "1-of-4")
 
+    # the register is read once for all shards
+    assert stages["scrape_links"].outputs == [os.path.join("data", "extracted_links.jsonl")]
+    assert stages["scrape_pdf_text"].outputs == [os.path.join(shard, "extracted_batches")]
+    assert stages["scrape_individual"].outputs == [os.path.join(shard, "json")]
+    assert stages["json_merge"].outputs == [os.path.join(shard, "output.json")]
 
-def test_safe_run_called_process_error(monkeypatch, capsys):
-    monkeypatch.setattr(os.path, "exists", lambda path: True)
 
-    def fake_run(cmd, check):
-        raise subprocess.CalledProcessError(returncode=5, cmd=cmd)
+def test_build_stages_passes_jobs_db(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(jobs_db="data/jobs.sqlite")
 
-    monkeypatch.setattr(subprocess, "run", fake_run)
+    for module in ("scripts.scrape_pdf_text", "scripts.scrape_individual"):
+        assert calls[module][-2:] == ["--jobs-db", "data/jobs.sqlite"]
+    assert "--jobs-db" not in calls["scripts.scrape_chunks"]
 
-    run_pipeline.safe_run(["cmd"], description="desc2")
-    captured = capsys.readouterr().out
-    assert "Warning: step desc2 failed (exit 5); continuing." in captured
+
+def test_build_stages_passes_max_memory_to_stream(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(stream=True, max_memory=50)
+    assert calls["scripts.stream_pipeline"][-2:] == ["--max-memory", "50"]
+    assert os.path.join("data", "manifest", "stream_pipeline.json") in calls["scripts.stream_pipeline"]
+
+
+def test_build_stages_passes_market_definition_only(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(market_only=True)
+    assert calls["scripts.scrape_pdf_text"][-1] == "--market-definition-only"
+
+
+def test_build_stages_with_store():
+    stages = {s.name: s for s in run_pipeline.build_stages(store="data/artifacts.sqlite")}
+    assert stages["scrape_pdf_text"].outputs == ["data/artifacts.sqlite"]
+    assert stages["scrape_chunks_80"].inputs == stages["scrape_chunks_80"].outputs == ["data/artifacts.sqlite"]
+    assert stages["json_merge"].inputs == ["data/artifacts.sqlite"]
+    # the report measures each stage's own kind of document, not the whole file
+    assert stages["scrape_chunks_80"].sizes_in == [("data/artifacts.sqlite", "batches")]
+    assert stages["scrape_chunks_80"].sizes_out == [("data/artifacts.sqlite", "sections")]
+    assert stages["json_merge"].sizes_in == [("data/artifacts.sqlite", "definitions")]
+    assert run_pipeline.build_stages()[1].sizes_in is None
+
+    shard = run_pipeline.build_stages(shard=(1, 4), store="data/artifacts.sqlite")
+    assert {s.name: s for s in shard}["clean_json"].inputs == [
+        os.path.join("data", "shards", "1-of-4", "artifacts.sqlite")]
+
+
+def test_build_stages_passes_store(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(store="s.sqlite")
+    for module in ("scripts.scrape_pdf_text", "scripts.scrape_chunks", "scripts.scrape_individual",
+                   "scripts.clean_json", "scripts.json_merge"):
+        assert calls[module][-2:] == ["--store", "s.sqlite"], module
+    assert "--store" not in calls["scripts.scrape_links"]
+
+
+def test_build_stages_since_previous(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(since_previous=True)
+    assert calls["scripts.scrape_links"][-1] == "--since-previous"
+    assert calls["scripts.scrape_pdf_text"][-1] == "--delta"
+
+
+def test_since_previous_refuses_stream():
+    with pytest.raises(SystemExit):
+        run_pipeline.main(["--stream", "--since-previous"])
+
+
+def test_max_memory_refuses_the_stage_pipeline():
+    with pytest.raises(SystemExit):
+        run_pipeline.main(["--max-memory", "50"])
+
+
+def test_main_merge_shards(monkeypatch):
+    from scripts import json_merge
+    calls = []
+    monkeypatch.setattr(json_merge, "merge_shards", lambda root, out: calls.append((root, out)))
+    monkeypatch.setattr(run_pipeline, "run_graph", lambda *a, **k: pytest.fail("pipeline should not run"))
+
+    run_pipeline.main(["--merge-shards"])
+    assert calls == [(os.path.join("data", "shards"), os.path.join("data", "output.json"))]
+
+
+def test_run_graph_respects_dependency_order():
+    order = []
+    stages = [
+        make_stage("c", func=lambda: order.append("c"), deps=["b"]),
+        make_stage("a", func=lambda: order.append("a")),
+        make_stage("b", func=lambda: order.append("b"), deps=["a"]),
+    ]
+    results = run_pipeline.run_graph(stages)
+
+    assert order == ["a", "b", "c"]
+    assert results == {"a": True, "b": True, "c": True}
+
+
+def test_run_graph_runs_independent_stages_concurrently():
+    # Both stages wait on the barrier, so this only finishes if they overlap
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [
+        make_stage("root"),
+        make_stage("left", func=barrier.wait, deps=["root"]),
+        make_stage("right", func=barrier.wait, deps=["root"]),
+    ]
+    results = run_pipeline.run_graph(stages, max_workers=2)
+    assert results == {"root": True, "left": True, "right": True}
+
+
+def test_run_graph_continues_after_failure():
+    def boom():
+        raise RuntimeError("bad")
+
+    ran = []
+    stages = [
+        make_stage("a", func=boom),
+        make_stage("b", func=lambda: ran.append("b"), deps=["a"]),
+    ]
+    results = run_pipeline.run_graph(stages)
+    assert results == {"a": False, "b": True}
+    assert ran == ["b"]
+
+
+def test_run_graph_rejects_unknown_and_cyclic_deps():
+    with pytest.raises(ValueError, match="unknown"):
+        run_pipeline.run_graph([make_stage("a", deps=["missing"])])
+    with pytest.raises(ValueError, match="cycle"):
+        run_pipeline.run_graph([make_stage("a", deps=["b"]), make_stage("b", deps=["a"])])
 
 
 def test_main_counts(monkeypatch, capsys):
 
-    monkeypatch.setattr(run_pipeline, "safe_run", lambda *a, **k: None)
+    monkeypatch.setattr(run_pipeline, "run_graph", lambda *a, **k: {})
 
     def fake_glob(pattern):
         if "pdf_texts_79_batch_" in pattern:
             return ["b79_1.txt", "b79_2.txt", "b79_3.txt"]
         if "pdf_texts_80_batch_" in pattern:
             return ["b80_1.txt", "b80_2.txt"]
-        if "extract-sections_batch_" in pattern:
+        if "extract-sections_*_batch_" in pattern:
             return ["s1.txt", "s2.txt", "s3.txt", "s4.txt", "s5.txt"]
         if pattern.endswith(os.path.join("json", "*.json")):
             return ["j1.json", "j2.json", "j3.json", "j4.json"]
@@ -122,7 +310,7 @@ def test_main_counts(monkeypatch, capsys):
 
     monkeypatch.setattr(os.path, "exists", lambda path: path.endswith(os.path.join("data", "output.json")))
 
-    run_pipeline.main()
+    run_pipeline.main([])
     out = capsys.readouterr().out
 
     assert "- 3 x 79 batches" in out
@@ -130,3 +318,36 @@ def test_main_counts(monkeypatch, capsys):
     assert "- 5 section files" in out
     assert "- 4 JSON files" in out
     assert "- 1 merged file" in out
+    assert "STAGE REPORT" in out
+    assert "run_report.json" in out
+
+
+def test_build_stages_passes_selection_to_scrape_links(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    select = ["--years", "2015-2020", "--sample", "2%", "--seed", "0"]
+    run_pipeline.build_stages(select_args=select)
+    assert calls["scripts.scrape_links"][-len(select):] == select
+    assert "--years" not in calls["scripts.scrape_pdf_text"]
+
+
+def test_build_stages_limits_gemini_stages_to_the_selection(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(run_pipeline, "stage_entry", lambda module, argv: calls.setdefault(module, argv))
+    run_pipeline.build_stages(chunks_size="79", select_args=["--sample", "2%", "--seed", "0"])
+    assert calls["scripts.scrape_chunks"][-2:] == ["--links", run_pipeline.LINKS]
+    assert calls["scripts.scrape_individual"][-4:] == ["--links", run_pipeline.LINKS,
+                                                       "--batches", os.path.join("data", "extracted_batches")]
+
+    assert calls["scripts.json_merge"][-4:] == calls["scripts.scrape_individual"][-4:]
+
+    calls.clear()
+    run_pipeline.build_stages(chunks_size="79")
+    assert "--links" not in calls["scripts.scrape_chunks"] + calls["scripts.scrape_individual"]
+    assert "--links" not in calls["scripts.json_merge"]
+
+    # a --since-previous list is only the delta; the merge keeps earlier cases
+    calls.clear()
+    run_pipeline.build_stages(chunks_size="79", since_previous=True, select_args=["--years", "2020"])
+    assert "--links" in calls["scripts.scrape_individual"]
+    assert "--links" not in calls["scripts.json_merge"]
@@ -0,0 +1,95 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import run_report
+
+
+def test_path_bytes_walks_directories(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"x" * 10)
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / "b.txt").write_bytes(b"y" * 5)
+
+    assert run_report.path_bytes([str(tmp_path / "a.txt")]) == 10
+    assert run_report.path_bytes([str(tmp_path)]) == 15
+    assert run_report.path_bytes([str(tmp_path / "missing")]) == 0
+
+
+def test_artifact_bytes_counts_one_kind_of_a_store(tmp_path):
+    from utils.artifact_store import ArtifactStore
+    store = str(tmp_path / "artifacts.sqlite")
+    with ArtifactStore(store) as artifacts:
+        artifacts.put("batches", "a", "x" * 1000)
+        artifacts.put("sections", "a", "y")
+        stats = artifacts.stats()
+    (tmp_path / "links.txt").write_bytes(b"z" * 7)
+
+    assert run_report.store_bytes(store, "batches") == stats["batches"][2]
+    assert run_report.store_bytes(store, "definitions") == 0
+    assert run_report.store_bytes(str(tmp_path / "missing.sqlite"), "batches") == 0
+    assert not (tmp_path / "missing.sqlite").exists()
+    assert run_report.artifact_bytes([str(tmp_path / "links.txt"), (store, "sections")]) == \
+        7 + stats["sections"][2]
+
+
+def test_stage_record_computes_throughput():
+    record = run_report.stage_record(
+        "scrape_pdf_text", "ok", 2.0,
+        counts={"items": 10, "skipped": 3, "failed": 1},
+        bytes_in=100, bytes_out=2048,
+    )
+    assert record["items_per_s"] == 5.0
+    assert record["skipped"] == 3
+    assert record["failed"] == 1
+    assert record["bytes_out"] == 2048
+    # memory is the process's (and its children's) so far, not the stage's own
+    assert "peak_rss_mb" not in record
+    assert {"peak_rss_so_far_mb", "children_peak_rss_so_far_mb"} <= set(record)
+
+
+def test_stage_record_without_counts():
+    record = run_report.stage_record("clean_json", "skipped", 0.0)
+    assert record["items"] == 0
+    assert record["items_per_s"] == 0.0
+
+
+def test_write_and_print_report(tmp_path, capsys):
+    path = tmp_path / "data" / "run_report.json"
+    records = [run_report.stage_record("json_merge", "ok", 1.0, {"items": 4}, 10, 20)]
+
+    report = run_report.write_report(records, 1.5, str(path))
+    saved = json.loads(path.read_text())
+    assert saved["wall_time_s"] == 1.5
+    assert saved["stages"][0]["stage"] == "json_merge"
+
+    run_report.print_report(report)
+    out = capsys.readouterr().out
+    assert "STAGE REPORT" in out
+    assert "json_merge" in out
+    assert "largest child process" in out
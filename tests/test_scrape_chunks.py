@@ -23,6 +23,7 @@
 
 import os
 import sys
+import threading
 import pytest
 from unittest import mock
 from pathlib import Path
@@ -50,7 +51,7 @@ def test_scrape_chunks_main_with_mock(tmp_path):
         "Extracted Market Definition section goes here."
     )
 
-    with mock.patch("scripts.scrape_chunks.genai.GenerativeModel", return_value=mock_model):
+    with mock.patch("google.generativeai.GenerativeModel", return_value=mock_model):
         sys.argv = [
             "scrape_chunks.py",
             "--indir", str(indir),
@@ -67,3 +68,104 @@ def test_scrape_chunks_main_with_mock(tmp_path):
     content = expected_output.read_text()
     assert "Case Number: M.5678" in content
     assert "Extracted Market Definition section" in content
+
+
+def test_scrape_chunks_manifest_skips_unchanged_batches(tmp_path):
+    indir = tmp_path / "extracted_batches"
+    outdir = tmp_path / "extracted_sections"
+    indir.mkdir()
+    batch = indir / "pdf_texts_79_batch_1.txt"
+    batch.write_text("Case Number: M.1\n\nMarket definition text.\n")
+    manifest_file = tmp_path / "manifest.json"
+
+    mock_model = mock.Mock()
+    mock_model.generate_content.return_value.text = "Extracted section."
+    argv = ["--indir", str(indir), "--outdir", str(outdir), "--size", "79",
+            "--manifest", str(manifest_file)]
+
+    with mock.patch.object(scrape_chunks, "model", mock_model):
+        scrape_chunks.main(argv)
+        scrape_chunks.main(argv)
+        assert mock_model.generate_content.call_count == 1
+
+        # changed text or a different model means the batch is sent again
+        batch.write_text("Case Number: M.1\n\nA revised market definition.\n")
+        scrape_chunks.main(argv)
+        assert mock_model.generate_content.call_count == 2
+
+        with mock.patch("google.generativeai.GenerativeModel", return_value=mock_model):
+            scrape_chunks.main(argv + ["--model", "other-model"])
+        assert mock_model.generate_content.call_count == 3
+
+
+def test_batches_are_sent_concurrently_and_failures_counted(tmp_path, capsys, fake_gemini):
+    indir = tmp_path / "extracted_batches"
+    outdir = tmp_path / "extracted_sections"
+    indir.mkdir()
+    for n in range(6):
+        (indir / f"pdf_texts_80_batch_{n}.txt").write_text(f"Case Number: M.{n}\n\nText {n}.\n")
+
+    # batch 0's first call hits the quota and is retried; another fails outright
+    model = fake_gemini(latency=0.05, errors=[fake_gemini.error(429), fake_gemini.error(400)])
+    argv = ["--indir", str(indir), "--outdir", str(outdir), "--size", "80",
+            "--manifest", str(tmp_path / "manifest.json"), "--llm-workers", "3"]
+    with mock.patch.object(scrape_chunks, "model", model), \
+            mock.patch.dict(scrape_chunks.gemini._limiters, clear=True), \
+            mock.patch.object(scrape_chunks.gemini, "delay", return_value=0):
+        assert scrape_chunks.main(argv) == {"items": 5, "skipped": 0, "failed": 1}
+        assert model.peak == 3
+        assert "[chunks] Failed pdf_texts_80_batch_" in capsys.readouterr().out
+
+        # only the failed batch is sent again
+        assert scrape_chunks.main(argv) == {"items": 1, "skipped": 5, "failed": 0}
+    assert len(list(outdir.iterdir())) == 6
+
+
+def test_both_sizes_share_one_rate_limiter(tmp_path):
+    indir = tmp_path / "extracted_batches"
+    indir.mkdir()
+    for size in ("79", "80"):
+        for n in range(3):
+            (indir / f"pdf_texts_{size}_batch_{n}.txt").write_text(f"Case Number: M.{size}{n}\n")
+
+    model = mock.Mock()
+    model.generate_content.return_value.text = "Extracted section."
+    used = []
+    with mock.patch.object(scrape_chunks, "model", model), \
+            mock.patch.dict(scrape_chunks.gemini._limiters, clear=True), \
+            mock.patch.object(scrape_chunks.gemini.RateLimiter, "acquire", autospec=True,
+                              side_effect=lambda limiter, tokens: used.append(limiter) or 0):
+        # run_pipeline runs the two sizes side by side in one interpreter
+        runs = [threading.Thread(target=scrape_chunks.main, args=(
+                    ["--indir", str(indir), "--outdir", str(tmp_path / "out"), "--size", size,
+                     "--rpm", "30", "--tpm", "5000"],)) for size in ("79", "80")]
+        for run in runs:
+            run.start()
+        for run in runs:
+            run.join()
+        limiter = scrape_chunks.gemini.shared_limiter(scrape_chunks.DEFAULT_MODEL)
+
+    assert len(used) == 6 and all(u is limiter for u in used)
+    assert limiter.requests.rate == 0.5
+    assert limiter.tokens.rate * 60 == 5000
+
+
+def test_links_limits_batches_to_the_selected_cases(tmp_path, capsys):
+    from utils.links import write_links
+    indir = tmp_path / "extracted_batches"
+    indir.mkdir()
+    for n in range(4):
+        (indir / f"pdf_texts_79_batch_{n}.txt").write_text(
+            f"Case Number: M.{n}\nYear: 2024\nPolicy Area: Merger\nLink: https://x/{n}.pdf\n\nText.\n")
+    links = tmp_path / "links.jsonl"
+    write_links(links, [("M.1", 2024, "Merger", "https://x/1.pdf"), ("M.3", 2024, "Merger", "https://x/3.pdf")])
+
+    model = mock.Mock()
+    model.generate_content.return_value.text = "Extracted section."
+    with mock.patch.object(scrape_chunks, "model", model):
+        counts = scrape_chunks.main(["--indir", str(indir), "--outdir", str(tmp_path / "out"),
+                                     "--links", str(links)])
+    assert counts == {"items": 2, "skipped": 0, "failed": 0}
+    assert sorted(os.listdir(tmp_path / "out")) == ["extract-sections_79_batch_1.txt",
+                                                    "extract-sections_79_batch_3.txt"]
+    assert "[select] 2 batches" in capsys.readouterr().out
@@ -74,3 +74,44 @@ def test_scrape_individual_main(tmp_path):
     content = output_file.read_text()
     assert '"case_number": "M.1234"' in content
     assert '"topic": "Mock Topic"' in content
+
+
+def test_links_limits_sections_to_the_selected_cases(tmp_path):
+    from utils.links import write_links
+    batches, sections = tmp_path / "extracted_batches", tmp_path / "extracted_sections"
+    batches.mkdir()
+    sections.mkdir()
+    for n in range(3):
+        (batches / f"pdf_texts_80_batch_{n}.txt").write_text(
+            f"Case Number: M.{n}\nYear: 2024\nPolicy Area: Merger\nLink: https://x/{n}.pdf\n\nText.\n")
+        # Gemini's copy of the header is not relied on
+        (sections / f"extract-sections_80_batch_{n}.txt").write_text(f"Market definition {n}.\n")
+    links = tmp_path / "links.jsonl"
+    write_links(links, [("M.2", 2024, "Merger", "https://x/2.pdf")])
+
+    model = mock.Mock()
+    model.generate_content.return_value.text = "[]"
+    with mock.patch.object(scrape_individual, "load_model", return_value=model):
+        counts = scrape_individual.main(["--indir", str(sections), "--outdir", str(tmp_path / "json"),
+                                         "--links", str(links), "--batches", str(batches)])
+    assert counts["items"] == 1
+    assert os.listdir(tmp_path / "json") == ["extract-definitions_80_batch_2.json"]
+
+
+def test_model_is_built_per_run_and_only_when_needed(tmp_path):
+    sections = tmp_path / "extracted_sections"
+    sections.mkdir()
+    (sections / "extract-sections_80_batch_1.txt").write_text("Market definition.\n")
+    argv = ["--indir", str(sections), "--outdir", str(tmp_path / "json"),
+            "--manifest", str(tmp_path / "manifest.json")]
+
+    with mock.patch.object(scrape_individual, "load_model") as load:
+        load.return_value.generate_content.return_value.text = "[]"
+        assert scrape_individual.main(argv + ["--model", "gemini-1.5-pro"])["items"] == 1
+        # nothing to send, so the SDK is not configured at all
+        assert scrape_individual.main(argv + ["--model", "gemini-1.5-pro"])["skipped"] == 1
+        assert load.call_args_list == [mock.call("gemini-1.5-pro")]
+
+        # a later run with the default model does not reuse the earlier one
+        assert scrape_individual.main(argv)["items"] == 1
+        assert load.call_args_list[-1] == mock.call(scrape_individual.DEFAULT_MODEL)
@@ -29,7 +29,9 @@ import pytest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
 
+from scripts import scrape_links
 from scripts.scrape_links import get_policy_area, main as scrape_links_main
+from utils.links import read_links
 
 def test_get_policy_area():
     assert get_policy_area("https://ec.europa.eu/competition/mergers/abc.pdf") == "Merger"
@@ -51,7 +53,7 @@ def test_scrape_links_main(tmp_path, capsys):
     })
 
     input_path = tmp_path / "cases.xlsx"
-    output_path = tmp_path / "extracted_links.txt"
+    output_path = tmp_path / "extracted_links.jsonl"
 
     df.to_excel(input_path, index=False)
 
@@ -67,10 +69,9 @@ def test_scrape_links_main(tmp_path, capsys):
     assert "Extracted 1 links" in captured.out
 
     # Check file content
-    output_text = output_path.read_text()
-    assert "Case Number: M.10000" in output_text
-    assert "Policy Area: Merger" in output_text
-    assert "Link: https://ec.europa.eu/competition/mergers/example.pdf" in output_text
+    assert list(read_links(output_path)) == [
+        ("M.10000", 2024, "Merger", "https://ec.europa.eu/competition/mergers/example.pdf")
+    ]
 
 def test_missing_required_columns(tmp_path, capsys):
     df = pd.DataFrame({
@@ -93,3 +94,145 @@ def test_missing_required_columns(tmp_path, capsys):
     captured = capsys.readouterr()
     assert "Missing required columns" in captured.out
     assert not output_path.exists()
+
+
+def test_manifest_skips_unchanged_register(tmp_path, capsys):
+    df = pd.DataFrame({
+        "Decisions": ["Decision text: EN - https://ec.europa.eu/competition/mergers/example.pdf"],
+        "Case number": ["M.10000"],
+        "Last decision date": ["01.01.2024"]
+    })
+    input_path = tmp_path / "cases.xlsx"
+    output_path = tmp_path / "extracted_links.jsonl"
+    df.to_excel(input_path, index=False)
+    argv = ["-i", str(input_path), "-o", str(output_path),
+            "--manifest", str(tmp_path / "manifest.json")]
+
+    scrape_links_main(argv)
+    assert "Extracted 1 links" in capsys.readouterr().out
+
+    scrape_links_main(argv)
+    assert "unchanged; keeping" in capsys.readouterr().out
+
+
+def test_extract_links_matches_the_row_by_row_loop():
+    df = scrape_links.synthetic_register(500, seed=3)
+    links, without = scrape_links.extract_links(df)
+    expected, expected_without = scrape_links._extract_rowwise(df)
+    assert [(c, y if isinstance(y, str) else None, a, l)
+            for c, y, a, l in links.itertuples(index=False)] == expected
+    assert without == expected_without
+    assert set(links["policy_area"]) == {area for _, area in scrape_links.POLICY_AREAS} | {"Unknown"}
+
+
+def test_extract_links_keeps_order_and_skips_empty_cells():
+    df = pd.DataFrame({
+        "Decisions": [
+            "Decision text: EN - https://ec.europa.eu/competition/antitrust/b.pdf\n"
+            "Decision text: EN published on 02.03.2021 - https://ec.europa.eu/competition/mergers/a.pdf",
+            None,
+        ],
+        "Case number": ["M.1", "M.2"],
+        "Last decision date": ["02.03.2021", "unknown"],
+    }, index=[7, 3])
+    links, without = scrape_links.extract_links(df)
+    # dated links come first, as they always have
+    assert links.values.tolist() == [
+        ["M.1", "2021", "Merger", "https://ec.europa.eu/competition/mergers/a.pdf"],
+        ["M.1", "2021", "Antitrust & Cartels", "https://ec.europa.eu/competition/antitrust/b.pdf"],
+    ]
+    assert without == ["M.2"]
+
+
+def test_bench_reports_both_timings(capsys):
+    result = scrape_links_main(["--bench", "200"])
+    assert result["rows"] == 200 and result["same"]
+    assert "[bench] 200 rows" in capsys.readouterr().out
+
+
+def write_register(path, rows):
+    pd.DataFrame({
+        "Decisions": [f"Decision text: EN - https://ec.europa.eu/competition/mergers/{c}.pdf" for c, _ in rows],
+        "Case number": [c for c, _ in rows],
+        "Last decision date": [d for _, d in rows],
+    }).to_excel(path, index=False)
+
+
+def test_since_previous_writes_only_new_and_changed_links(tmp_path, capsys):
+    register, output = tmp_path / "cases.xlsx", tmp_path / "links.jsonl"
+    argv = ["-i", str(register), "-o", str(output), "--since-previous", str(tmp_path / "snapshot.jsonl")]
+
+    write_register(register, [("M.1", "01.01.2020"), ("M.2", "01.01.2021"), ("M.3", "01.01.2022")])
+    assert scrape_links_main(argv)["items"] == 3
+    assert "[delta] 3 added, 0 changed, 0 removed" in capsys.readouterr().out
+
+    # M.2 is gone, M.3 has a new decision date and M.4 is new
+    write_register(register, [("M.1", "01.01.2020"), ("M.3", "05.05.2023"), ("M.4", "01.01.2024")])
+    assert scrape_links_main(argv)["items"] == 2
+    assert "[delta] 1 added, 1 changed, 1 removed" in capsys.readouterr().out
+    assert [(l.case_number, l.year) for l in read_links(output)] == [("M.3", 2023), ("M.4", 2024)]
+    # the snapshot holds the whole register for the next diff
+    assert [l.case_number for l in read_links(tmp_path / "snapshot.jsonl")] == ["M.1", "M.3", "M.4"]
+
+
+def test_since_previous_with_an_unchanged_register_writes_an_empty_delta(tmp_path, capsys):
+    register, output = tmp_path / "cases.xlsx", tmp_path / "links.jsonl"
+    argv = ["-i", str(register), "-o", str(output), "--since-previous", str(tmp_path / "snapshot.jsonl"),
+            "--manifest", str(tmp_path / "manifest.json")]
+
+    write_register(register, [("M.1", "01.01.2020"), ("M.2", "01.01.2021")])
+    assert scrape_links_main(argv)["items"] == 2
+
+    # the workbook is the same, but the snapshot now holds it: nothing is new
+    assert scrape_links_main(argv)["items"] == 0
+    assert "[delta] 0 added, 0 changed, 0 removed" in capsys.readouterr().out
+    assert list(read_links(output)) == []
+
+    assert scrape_links_main(argv)["skipped"] == 1
+    assert list(read_links(output)) == []
+
+
+def test_diff_links_keys_on_case_and_link():
+    previous = [("M.1", 2020, "Merger", "a"), ("M.1", 2020, "Merger", "b")]
+    current = [("M.1", 2021, "Merger", "a"), ("M.2", 2020, "Merger", "b")]
+    added, changed, removed = scrape_links.diff_links(previous, current)
+    assert added == [("M.2", 2020, "Merger", "b")]
+    assert changed == [("M.1", 2021, "Merger", "a")]
+    assert removed == [("M.1", 2020, "Merger", "b")]
+
+
+def test_selection_narrows_the_link_list(tmp_path, capsys):
+    register, output = tmp_path / "cases.xlsx", tmp_path / "links.jsonl"
+    write_register(register, [("M.1", "01.01.2014"), ("M.2", "01.01.2016"), ("M.3", "01.01.2021")])
+    argv = ["-i", str(register), "-o", str(output)]
+
+    assert scrape_links_main(argv + ["--years", "2015-2020"])["items"] == 1
+    assert "[select] 1 cases, 1 links (years 2015-2020)" in capsys.readouterr().out
+    assert [l.case_number for l in read_links(output)] == ["M.2"]
+
+    # another selection of the same workbook is not skipped as unchanged
+    assert scrape_links_main(argv + ["--cases", "M.1,M.3"])["items"] == 2
+    assert [l.case_number for l in read_links(output)] == ["M.1", "M.3"]
+
+
+def test_since_previous_with_a_selection_keeps_the_whole_register(tmp_path, capsys):
+    register, output = tmp_path / "cases.xlsx", tmp_path / "links.jsonl"
+    snapshot = tmp_path / "snapshot.jsonl"
+    argv = ["-i", str(register), "-o", str(output), "--since-previous", str(snapshot)]
+
+    write_register(register, [("M.1", "01.01.2014"), ("M.2", "01.01.2016"), ("M.3", "01.01.2021")])
+    assert scrape_links_main(argv)["items"] == 3
+
+    # M.4 is new and M.3 changed, but only 2015-2020 is selected
+    write_register(register, [("M.1", "01.01.2014"), ("M.2", "01.01.2016"),
+                              ("M.3", "05.05.2020"), ("M.4", "01.01.2022")])
+    assert scrape_links_main(argv + ["--years", "2015-2020"])["items"] == 1
+    assert "[delta] 1 added, 1 changed, 0 removed" in capsys.readouterr().out
+    assert [l.case_number for l in read_links(output)] == ["M.3"]
+    # the register outside the selection is not lost from the snapshot, and M.4 is still new
+    assert [(l.case_number, l.year) for l in read_links(snapshot)] == [("M.1", 2014), ("M.2", 2016),
+                                                                       ("M.3", 2020)]
+
+    assert scrape_links_main(argv)["items"] == 1
+    assert "[delta] 1 added, 0 changed, 0 removed" in capsys.readouterr().out
+    assert [l.case_number for l in read_links(output)] == ["M.4"]
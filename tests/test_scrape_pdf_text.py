@@ -21,9 +21,11 @@
 #
 # ------------------------------------------------------------------------------------------
 
+import json
 import os
 import sys
 import tempfile
+import time
 import builtins
 import pytest
 from unittest import mock
@@ -32,14 +34,20 @@ from pathlib import Path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
 
 from scripts import scrape_pdf_text
+from utils.parse_pool import ParsePool
+from utils.links import write_links
 
 class MockPage:
+    def __init__(self, source=""):
+        self.source = source
     def extract_text(self):
-        return "This is a mock PDF content with market definitions."
+        return "This is a mock PDF content with market definitions." + self.source
 
 class MockPdfReader:
     def __init__(self, stream):
-        self.pages = [MockPage(), MockPage(), MockPage()]  # simulate 3 pages
+        # each page names the PDF it came from, so different PDFs differ
+        source = stream.read().decode("latin-1")
+        self.pages = [MockPage(source), MockPage(), MockPage()]  # simulate 3 pages
 
 @pytest.fixture
 def fake_pdf():
@@ -47,24 +55,23 @@ def fake_pdf():
 
 @pytest.fixture
 def input_links(tmp_path):
-    input_file = tmp_path / "extracted_links.txt"
-    input_file.write_text(
-        "Case Number: M.1234\n"
-        "Year: 2024\n"
-        "Policy Area: merger\n"
-        "Link: https://ec.europa.eu/competition/mergers/fake.pdf\n\n"
-    )
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [("M.1234", 2024, "Merger", "https://ec.europa.eu/competition/mergers/fake.pdf")])
     return input_file
 
 @pytest.fixture
 def setup_mock_requests_and_pypdf2(fake_pdf):
-    with mock.patch("requests.get") as mock_get, \
-         mock.patch("scripts.scrape_pdf_text.PdfReader", MockPdfReader):
+    with mock.patch("requests.Session.get") as mock_get, \
+         mock.patch("utils.pdf_backends.PdfReader", MockPdfReader):
 
-        mock_resp = mock.Mock()
-        mock_resp.status_code = 200
-        mock_resp.content = fake_pdf
-        mock_get.return_value = mock_resp
+        def get(url, **kwargs):
+            mock_resp = mock.Mock()
+            mock_resp.status_code = 200
+            mock_resp.content = fake_pdf + url.encode()
+            mock_resp.iter_content = lambda size: [mock_resp.content]
+            mock_resp.headers = {}
+            return mock_resp
+        mock_get.side_effect = get
         yield
 
 def test_scrape_pdf_text_main(tmp_path, input_links, setup_mock_requests_and_pypdf2, capsys):
@@ -95,13 +102,8 @@ def test_scrape_pdf_text_main(tmp_path, input_links, setup_mock_requests_and_pyp
     assert "This is a mock PDF content" in content
 
 def test_exclusion_phrase_causes_exclusion(tmp_path, fake_pdf, capsys):
-    input_file = tmp_path / "extracted_links.txt"
-    input_file.write_text(
-        "Case Number: M.5678\n"
-        "Year: 2023\n"
-        "Policy Area: merger\n"
-        "Link: https://ec.europa.eu/competition/mergers/exclude.pdf\n\n"
-    )
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [("M.5678", 2023, "Merger", "https://ec.europa.eu/competition/mergers/exclude.pdf")])
 
     class ExclusionPage:
         def extract_text(self):
@@ -111,12 +113,14 @@ def test_exclusion_phrase_causes_exclusion(tmp_path, fake_pdf, capsys):
         def __init__(self, stream):
             self.pages = [ExclusionPage(), ExclusionPage(), ExclusionPage()]
 
-    with mock.patch("requests.get") as mock_get, \
-         mock.patch("scripts.scrape_pdf_text.PdfReader", ExclusionReader):
+    with mock.patch("requests.Session.get") as mock_get, \
+         mock.patch("utils.pdf_backends.PdfReader", ExclusionReader):
 
         mock_resp = mock.Mock()
         mock_resp.status_code = 200
         mock_resp.content = fake_pdf
+        mock_resp.iter_content = lambda size: [fake_pdf]
+        mock_resp.headers = {}
         mock_get.return_value = mock_resp
 
         sys.argv = [
@@ -138,4 +142,343 @@ def test_exclusion_phrase_causes_exclusion(tmp_path, fake_pdf, capsys):
     assert excluded_path.exists()
     assert "Excluded by criteria" in excluded_path.read_text()
     assert included_path.read_text().strip() == ""
-    assert not batch_dir.exists() or not any(batch_dir.iterdir())
\ No newline at end of file
+    assert not batch_dir.exists() or not any(batch_dir.iterdir())
+
+def test_manifest_skips_unchanged_cases(tmp_path, input_links, setup_mock_requests_and_pypdf2, capsys):
+    manifest_file = tmp_path / "manifest" / "scrape_pdf_text.json"
+    argv = ["-i", str(input_links), "--datadir", str(tmp_path), "--manifest", str(manifest_file)]
+
+    scrape_pdf_text.main(argv)
+    assert "[fetch] Case M.1234" in capsys.readouterr().out
+    assert manifest_file.exists()
+
+    with mock.patch("scripts.scrape_pdf_text.get_pdf_text") as fetch:
+        scrape_pdf_text.main(argv)
+    out = capsys.readouterr().out
+    fetch.assert_not_called()
+    assert "[unchanged] Case M.1234" in out
+    assert "M.1234" in (tmp_path / "included_cases.txt").read_text()
+
+    # a new link is fetched and numbered after the batch already on disk
+    write_links(input_links, [
+        ("M.1234", 2024, "Merger", "https://ec.europa.eu/competition/mergers/fake.pdf"),
+        ("M.9999", 2024, "Merger", "https://ec.europa.eu/competition/mergers/new.pdf"),
+    ])
+    scrape_pdf_text.main(argv)
+    out = capsys.readouterr().out
+    assert "[fetch] Case M.9999" in out
+    assert "[fetch] Case M.1234" not in out
+    batches = sorted(p.name for p in (tmp_path / "extracted_batches").glob("*.txt"))
+    assert batches == ["pdf_texts_79_batch_1.txt", "pdf_texts_79_batch_2.txt"]
+
+
+def test_batch_numbers_do_not_collide_across_areas(tmp_path, setup_mock_requests_and_pypdf2):
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [
+        ("M.1", 2024, "Merger", "https://ec.europa.eu/competition/mergers/a.pdf"),
+        ("AT.2", 2024, "Antitrust", "https://ec.europa.eu/competition/antitrust/b.pdf"),
+    ])
+    scrape_pdf_text.main(["-i", str(input_file), "--datadir", str(tmp_path)])
+
+    batches = sorted((tmp_path / "extracted_batches").glob("*.txt"))
+    assert len(batches) == 2
+    assert "M.1" in batches[0].read_text()
+    assert "AT.2" in batches[1].read_text()
+
+
+def test_shard_only_fetches_its_cases(tmp_path, setup_mock_requests_and_pypdf2, capsys):
+    from utils.sharding import in_shard
+    cases = [f"M.{n}" for n in range(20)]
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [(c, 2024, "Merger", f"https://ec.europa.eu/competition/mergers/{c}.pdf")
+                             for c in cases])
+
+    scrape_pdf_text.main(["-i", str(input_file), "--datadir", str(tmp_path), "--shard", "1/3"])
+    out = capsys.readouterr().out
+
+    expected = [c for c in cases if in_shard(c, (1, 3))]
+    assert 0 < len(expected) < len(cases)
+    fetched = [c for c in cases if f"[fetch] Case {c} " in out]
+    assert fetched == expected
+
+
+def test_jobs_db_resumes_after_a_crash(tmp_path, setup_mock_requests_and_pypdf2, capsys):
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [(f"M.{n}", 2024, "Merger", f"https://ec.europa.eu/competition/mergers/{n}.pdf")
+                             for n in range(3)])
+    # parse in this process, so the first case is finished before the crash
+    argv = ["-i", str(input_file), "--datadir", str(tmp_path), "--parse-workers", "0",
+            "--jobs-db", str(tmp_path / "jobs.sqlite")]
+
+    # the process dies while fetching the second case
+    real = scrape_pdf_text.download_pdf
+    calls = []
+    def crash_on_second(url, *args):
+        calls.append(url)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return real(url, *args)
+    with mock.patch("scripts.scrape_pdf_text.download_pdf", crash_on_second):
+        with pytest.raises(KeyboardInterrupt):
+            scrape_pdf_text.main(argv)
+    capsys.readouterr()
+
+    counts = scrape_pdf_text.main(argv)
+    out = capsys.readouterr().out
+    assert "[fetch] Case M.0 " not in out
+    assert "[fetch] Case M.1 " in out and "(attempt 2)" in out
+    assert counts == {"items": 2, "skipped": 1, "failed": 0}
+
+    batches = sorted(p.name for p in (tmp_path / "extracted_batches").glob("*.txt"))
+    assert batches == ["pdf_texts_79_batch_1.txt", "pdf_texts_79_batch_2.txt", "pdf_texts_79_batch_3.txt"]
+    included = (tmp_path / "included_cases.txt").read_text()
+    assert all(f"M.{n}" in included for n in range(3))
+
+
+def test_jobs_db_lists_failed_cases_as_excluded(tmp_path, input_links, capsys):
+    argv = ["-i", str(input_links), "--datadir", str(tmp_path),
+            "--jobs-db", str(tmp_path / "jobs.sqlite")]
+    with mock.patch("scripts.scrape_pdf_text.download_pdf", return_value=(None, "HTTP 503")) as fetch:
+        counts = scrape_pdf_text.main(argv)
+
+    assert fetch.call_count == 3
+    assert counts == {"items": 0, "skipped": 0, "failed": 1}
+    assert "Reason: HTTP 503" in (tmp_path / "excluded_cases.txt").read_text()
+
+
+def test_jobs_db_renews_the_lease_of_a_slow_case(tmp_path, input_links):
+    from utils import jobs
+    db = str(tmp_path / "jobs.sqlite")
+    argv = ["-i", str(input_links), "--datadir", str(tmp_path), "--jobs-db", db]
+    real = jobs.Heartbeat
+    leases = []
+
+    def slow(url, *args):
+        conn = jobs.connect(db)
+        for _ in range(2):
+            leases.append(conn.execute("SELECT lease_until FROM jobs WHERE state = 'running'").fetchone()[0])
+            time.sleep(0.2)
+        conn.close()
+        return None, "Excluded by criteria"
+
+    with mock.patch("utils.jobs.Heartbeat", lambda *args: real(*args, every=0.05)), \
+         mock.patch("scripts.scrape_pdf_text.download_pdf", slow):
+        scrape_pdf_text.main(argv)
+    assert leases[1] > leases[0]
+
+
+def test_page_ranges():
+    assert scrape_pdf_text.page_ranges(99, 8, fan_out=100) == [(0, None)]
+    assert scrape_pdf_text.page_ranges(500, 1, fan_out=100) == [(0, None)]
+    assert scrape_pdf_text.page_ranges(400, 4, fan_out=100) == [(0, 100), (100, 200), (200, 300), (300, 400)]
+    # ranges never get shorter than MIN_RANGE_PAGES
+    ranges = scrape_pdf_text.page_ranges(100, 16, fan_out=100)
+    assert ranges[0] == (0, scrape_pdf_text.MIN_RANGE_PAGES) and ranges[-1][1] == 100
+
+
+def test_large_pdf_is_split_and_reassembled_in_page_order(make_pdf):
+    pages = [f"page {n}" for n in range(120)]
+    pdf = make_pdf(pages)
+    parts = scrape_pdf_text.split_pdf(pdf, workers=4, fan_out=100)
+    assert [(start, stop) for _, start, stop in parts] == [(0, 30), (30, 60), (60, 90), (90, 120)]
+    assert scrape_pdf_text.split_pdf(make_pdf(pages[:50]), workers=4, fan_out=100) == \
+        (make_pdf(pages[:50]), 0, None)
+
+    fetched = [(n, "https://ec.europa.eu/x.pdf", pdf, None) for n in range(3)]
+    with ParsePool(workers=4) as pool:
+        out = list(scrape_pdf_text.extract_all(iter(fetched), pool, fan_out=100))
+    assert [ctx for ctx, _, _ in out] == [0, 1, 2]
+    assert all(text == "".join(pages) and reason is None for _, text, reason in out)
+
+
+def test_exclusion_check_stops_at_the_first_matching_page():
+    extracted = []
+    class Page:
+        def __init__(self, n, text):
+            self.n, self.text = n, text
+        def extract_text(self):
+            extracted.append(self.n)
+            return self.text
+    class Reader:
+        def __init__(self, stream):
+            self.pages = [Page(0, "Decision of the Commission"),
+                          Page(1, "the European Commission HAS DECIDED NOT TO OPPOSE the notified operation"),
+                          Page(2, "signatures")]
+
+    with mock.patch("utils.pdf_backends.PdfReader", Reader):
+        assert scrape_pdf_text.extract_text(b"%PDF") == (None, 3)
+    assert extracted == [0, 1]
+    assert scrape_pdf_text.classify(None, 3) == (None, "Excluded by criteria")
+
+
+def test_exclusion_phrase_across_a_page_break(make_pdf):
+    pdf = make_pdf(["... This decision is adopted in ", "application of Article 6(1)(b) ...", "end"])
+    assert scrape_pdf_text.extract_text(pdf) == (None, 3)
+    # only 3-page documents are ever excluded
+    pdf = make_pdf(["... This decision is adopted in application of Article 6(1)(b) ..."] * 4)
+    text, pages = scrape_pdf_text.extract_text(pdf)
+    assert pages == 4 and scrape_pdf_text.classify(text, pages) == (text, None)
+
+
+def test_exclusion_is_cached(tmp_path):
+    from utils.pdf_cache import PdfCache
+    cache = PdfCache(str(tmp_path / "cache"))
+    url = "https://ec.europa.eu/competition/mergers/short.pdf"
+    cache._write(cache._path(url, ".pdf"), b"%PDF")
+    cache._write_json(url, {"url": url, "sha256": "x", "checked": 0})
+    cache.store_text(url, None, 3)
+    assert cache.load_text(url) == (None, 3)
+
+
+def test_large_pdf_is_parsed_from_disk(tmp_path, monkeypatch, http_server, make_pdf):
+    pages = [f"page {n}" for n in range(5)]
+    http_server.routes["/big.pdf"] = lambda handler, n: (200, {}, make_pdf(pages))
+    url = http_server.url("/big.pdf")
+    temp = tmp_path / "tmp"
+    temp.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp))
+
+    # small enough to read into memory: the temporary file is gone at once
+    data, reason = scrape_pdf_text.download_pdf(url)
+    assert isinstance(data, bytes) and reason is None
+    assert os.listdir(temp) == []
+
+    # too large: parsed by path, and the file is removed once parsed
+    data, reason = scrape_pdf_text.download_pdf(url, max_in_memory=0)
+    assert os.listdir(temp) == [os.path.basename(data)]
+    with ParsePool(workers=1) as pool:
+        out = list(scrape_pdf_text.extract_all(iter([(0, url, data, reason)]), pool))
+    assert out == [(0, "".join(pages), None)]
+    assert os.listdir(temp) == []
+
+
+def test_get_pdf_text_removes_a_spilled_pdf(tmp_path, monkeypatch, http_server, make_pdf):
+    http_server.routes["/big.pdf"] = lambda handler, n: (200, {}, make_pdf(["market definition"] * 4))
+    temp = tmp_path / "tmp"
+    temp.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp))
+    monkeypatch.setattr(scrape_pdf_text, "download_pdf",
+                        lambda url, downloader, cache, _real=scrape_pdf_text.download_pdf:
+                        _real(url, downloader, cache, max_in_memory=0))
+    text, _ = scrape_pdf_text.get_pdf_text(http_server.url("/big.pdf"))
+    assert "market definition" in text
+    assert os.listdir(temp) == []
+
+
+def test_failed_download_leaves_no_temporary_file(tmp_path, monkeypatch, http_server):
+    temp = tmp_path / "tmp"
+    temp.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp))
+    assert scrape_pdf_text.download_pdf(http_server.url("/missing.pdf")) == (None, "HTTP 404")
+    assert os.listdir(temp) == []
+
+
+def test_cached_pdf_is_parsed_in_place(tmp_path, http_server, make_pdf):
+    from utils.pdf_cache import PdfCache
+    http_server.routes["/a.pdf"] = lambda handler, n: (200, {}, make_pdf(["cached"] * 4))
+    url = http_server.url("/a.pdf")
+    cache = PdfCache(str(tmp_path / "cache"))
+    data, _ = scrape_pdf_text.download_pdf(url, cache=cache, max_in_memory=0)
+    assert data == cache.pdf_path(url)
+    assert scrape_pdf_text.extract_text(data) == ("cached" * 4, 4)
+
+
+def duplicate_links(tmp_path):
+    # M.2 lists M.1's PDF again; M.3's PDF is a copy of M.1's under another URL
+    input_file = tmp_path / "extracted_links.jsonl"
+    write_links(input_file, [
+        (case, 2024, "Merger", f"https://ec.europa.eu/competition/mergers/{name}.pdf")
+        for case, name in [("M.1", "a"), ("M.2", "a"), ("M.3", "copy"), ("M.4", "b")]])
+    return input_file
+
+
+@pytest.fixture
+def copy_is_same_pdf(fake_pdf):
+    def get(url, **kwargs):
+        if (kwargs.get("headers") or {}).get("If-None-Match") == '"v1"':
+            return mock.Mock(status_code=304, headers={})
+        resp = mock.Mock(status_code=200, headers={"ETag": '"v1"'})
+        resp.content = fake_pdf + url.replace("copy", "a").encode()
+        resp.iter_content = lambda size: [resp.content]
+        return resp
+    with mock.patch("requests.Session.get", side_effect=get) as session_get, \
+         mock.patch("utils.pdf_backends.PdfReader", MockPdfReader):
+        yield session_get
+
+
+@pytest.mark.parametrize("jobs_db", [False, True])
+def test_duplicates_are_written_once(tmp_path, copy_is_same_pdf, jobs_db):
+    argv = ["-i", str(duplicate_links(tmp_path)), "--datadir", str(tmp_path), "--parse-workers", "0"]
+    if jobs_db:
+        argv += ["--jobs-db", str(tmp_path / "jobs.sqlite")]
+    scrape_pdf_text.main(argv)
+
+    fetched = [c.args[0].rsplit("/", 1)[1] for c in copy_is_same_pdf.call_args_list]
+    assert sorted(fetched) == ["a.pdf", "b.pdf", "copy.pdf"]
+    batches = [p.read_text() for p in (tmp_path / "extracted_batches").glob("*.txt")]
+    assert sorted(b.split("\n", 1)[0] for b in batches) == ["Case Number: M.1", "Case Number: M.4"]
+
+    duplicates = json.loads((tmp_path / "duplicate_cases.json").read_text())
+    canon = "https://ec.europa.eu/competition/mergers/a.pdf"
+    assert list(duplicates) == [canon]
+    assert sorted(d["case_number"] for d in duplicates[canon]) == ["M.2", "M.3"]
+    assert {"case_number": "M.3", "year": "2024", "policy_area": "Merger",
+            "link": "https://ec.europa.eu/competition/mergers/copy.pdf"} in duplicates[canon]
+    # every case still counts as included
+    assert (tmp_path / "included_cases.txt").read_text().count("Case Number:") == 4
+
+
+def test_duplicates_survive_an_unchanged_rerun(tmp_path, copy_is_same_pdf):
+    argv = ["-i", str(duplicate_links(tmp_path)), "--datadir", str(tmp_path), "--parse-workers", "0",
+            "--manifest", str(tmp_path / "manifest.json")]
+    scrape_pdf_text.main(argv)
+    first = (tmp_path / "duplicate_cases.json").read_text()
+    copy_is_same_pdf.reset_mock()
+
+    counts = scrape_pdf_text.main(argv)
+    # each cached PDF is only revalidated, and is unchanged
+    assert [c.kwargs["headers"] for c in copy_is_same_pdf.call_args_list] == [{"If-None-Match": '"v1"'}] * 3
+    assert counts["skipped"] == 3
+    assert (tmp_path / "duplicate_cases.json").read_text() == first
+
+
+def test_republished_pdf_is_extracted_again(tmp_path, copy_is_same_pdf):
+    argv = ["-i", str(duplicate_links(tmp_path)), "--datadir", str(tmp_path), "--parse-workers", "0",
+            "--manifest", str(tmp_path / "manifest.json")]
+    scrape_pdf_text.main(argv)
+
+    # b.pdf is replaced under the same URL, with a new ETag
+    get = copy_is_same_pdf.side_effect
+
+    def republished(url, **kwargs):
+        if not url.endswith("/b.pdf"):
+            return get(url, **kwargs)
+        resp = get(url.replace("b.pdf", "b2.pdf"))
+        resp.headers = {"ETag": '"v2"'}
+        return resp
+
+    copy_is_same_pdf.side_effect = republished
+    counts = scrape_pdf_text.main(argv)
+    assert counts["skipped"] == 2
+    batches = [p.read_text() for p in (tmp_path / "extracted_batches").glob("*.txt")]
+    assert len(batches) == 3
+    assert sum("b2.pdf" in b for b in batches) == 1
+
+
+def test_delta_keeps_what_earlier_runs_found(tmp_path, copy_is_same_pdf):
+    argv = ["-i", str(duplicate_links(tmp_path)), "--datadir", str(tmp_path), "--parse-workers", "0",
+            "--manifest", str(tmp_path / "manifest.json")]
+    scrape_pdf_text.main(argv)
+
+    # the next list only has a new case, whose PDF is another copy of M.1's
+    delta = tmp_path / "delta.jsonl"
+    write_links(delta, [("M.5", 2025, "Merger", "https://ec.europa.eu/competition/mergers/copy2.pdf")])
+    get = copy_is_same_pdf.side_effect
+    copy_is_same_pdf.side_effect = lambda url, **kwargs: get(url.replace("copy2", "copy"), **kwargs)
+    scrape_pdf_text.main(["-i", str(delta)] + argv[2:] + ["--delta"])
+
+    batches = list((tmp_path / "extracted_batches").glob("*.txt"))
+    assert len(batches) == 2
+    duplicates = json.loads((tmp_path / "duplicate_cases.json").read_text())
+    assert sorted(d["case_number"] for d in duplicates["https://ec.europa.eu/competition/mergers/a.pdf"]) \
+        == ["M.2", "M.3", "M.5"]
@@ -0,0 +1,125 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+from collections import Counter
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import selection as sel
+
+
+def parse(argv):
+    p = argparse.ArgumentParser()
+    sel.add_arguments(p)
+    return p.parse_args(argv)
+
+
+def test_parse_years():
+    assert sel.parse_years("2015-2020") == (2015, 2020)
+    assert sel.parse_years("2015-") == (2015, None)
+    assert sel.parse_years("-2010") == (None, 2010)
+    assert sel.parse_years("2018") == (2018, 2018)
+    for bad in ("", "-", "2020-2015", "recent"):
+        with pytest.raises(ValueError):
+            sel.parse_years(bad)
+
+
+def test_sample_arg():
+    assert sel.sample_arg("500") == 500
+    assert sel.sample_arg("2%") == pytest.approx(0.02)
+    for bad in ("0", "100%", "-3", "some"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            sel.sample_arg(bad)
+
+
+def test_nothing_selected_is_none():
+    assert sel.from_args(parse([])) is None
+    assert sel.to_argv(parse([])) == []
+
+
+def test_filters(tmp_path):
+    listed = tmp_path / "cases.txt"
+    listed.write_text("M.1\nAT.2\n\n")
+    s = sel.from_args(parse(["--years", "2015-2020", "--areas", "Merger,antitrust", "--cases", str(listed)]))
+    assert sel.matches(s, "M.1", 2016, "Merger")
+    assert sel.matches(s, "AT.2", "2020", "antitrust_&_cartels")
+    assert not sel.matches(s, "M.1", 2021, "Merger")
+    assert not sel.matches(s, "M.1", "Unknown", "Merger")
+    assert not sel.matches(s, "M.1", 2016, "State Aid")
+    assert not sel.matches(s, "M.3", 2016, "Merger")
+
+
+def test_to_argv_round_trips():
+    args = parse(["--years", "2015-", "--areas", "merger", "--cases", "M.1,M.2", "--sample", "2%", "--seed", "7"])
+    again = parse(sel.to_argv(args))
+    assert sel.from_args(again) == sel.from_args(args)
+
+
+def test_stratified_sample_keeps_each_stratum_share():
+    links = []
+    for n, (year, area) in enumerate([(2019, "Merger")] * 600 + [(2020, "Merger")] * 300 +
+                                     [(2020, "State Aid")] * 100):
+        links.append((f"C.{n}", year, area, f"https://x/{n}.pdf"))
+        if n % 3 == 0:
+            links.append((f"C.{n}", year, area, f"https://x/{n}b.pdf"))
+
+    sample = sel.stratified_sample(links, 0.1, seed=1)
+    cases = {l[0]: (l[1], l[2]) for l in sample}
+    assert Counter(cases.values()) == {(2019, "Merger"): 60, (2020, "Merger"): 30, (2020, "State Aid"): 10}
+    # every link of a chosen case comes along, in the original order
+    assert sample == [l for l in links if l[0] in cases]
+    assert sel.stratified_sample(links, 0.1, seed=1) == sample
+    assert sel.stratified_sample(links, 0.1, seed=2) != sample
+
+
+def test_small_strata_still_get_cases():
+    links = [(f"M.{n}", 2020, "Merger", str(n)) for n in range(97)]
+    links += [("SA.1", 2020, "State Aid", "a"), ("AT.1", 2019, "Antitrust", "b"), ("F.1", None, "Unknown", "c")]
+    # merger's share is 4.85 cases; the fifth goes to a stratum that has none
+    cases = {l[0] for l in sel.stratified_sample(links, 5)}
+    assert len(cases) == 5
+    assert len(cases & {"SA.1", "AT.1", "F.1"}) == 1
+
+
+def test_sample_larger_than_the_list_keeps_everything():
+    links = [("M.1", 2020, "Merger", "a")]
+    assert sel.stratified_sample(links, 10) == links
+
+
+def test_header_key_reads_the_batch_header(tmp_path):
+    batch = tmp_path / "pdf_texts_79_batch_1.txt"
+    batch.write_text("Case Number: M.1\nYear: 2024\nPolicy Area: Merger\nLink: https://x/a.pdf\n\nText.\n")
+    assert sel.header_key(batch) == "M.1|https://x/a.pdf"
+    batch.write_text("No header here.\n")
+    assert sel.header_key(batch) is None
+
+
+def test_batch_key_follows_the_batch_number(tmp_path):
+    (tmp_path / "pdf_texts_80_batch_3.txt").write_text(
+        "Case Number: M.3\nYear: 2024\nPolicy Area: Merger\nLink: https://x/3.pdf\n\nText.\n")
+    assert sel.batch_key("json/extract-definitions_80_batch_3.json", tmp_path) == "M.3|https://x/3.pdf"
+    assert sel.batch_key("extract-sections_80_batch_3.txt", tmp_path) == "M.3|https://x/3.pdf"
+    assert sel.batch_key("extract-sections_79_batch_3.txt", tmp_path) is None
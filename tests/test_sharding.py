@@ -0,0 +1,67 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from utils import sharding
+
+
+def test_parse_shard():
+    assert sharding.parse_shard("0/4") == (0, 4)
+    assert sharding.parse_shard("3/4") == (3, 4)
+    for bad in ["4/4", "-1/4", "1/0", "a/b", "1", None]:
+        with pytest.raises(ValueError):
+            sharding.parse_shard(bad)
+
+
+def test_shard_arg_raises_argparse_error():
+    with pytest.raises(argparse.ArgumentTypeError):
+        sharding.shard_arg("5/2")
+
+
+def test_shard_of_is_stable_and_ignores_whitespace():
+    # fixed value so a change in hashing (which would reshuffle every
+    # existing shard directory) is caught
+    assert sharding.shard_of("M.10000", 16) == sharding.shard_of(" M.10000 ", 16)
+    assert sharding.shard_of("M.10000", 16) == 2
+
+
+def test_every_case_lands_in_exactly_one_shard():
+    cases = [f"M.{n}" for n in range(1000)]
+    shards = [(i, 4) for i in range(4)]
+    for case in cases:
+        assert sum(sharding.in_shard(case, s) for s in shards) == 1
+    sizes = [sum(sharding.in_shard(c, s) for c in cases) for s in shards]
+    assert all(150 < size < 350 for size in sizes)
+
+
+def test_in_shard_none_keeps_everything():
+    assert sharding.in_shard("M.1", None)
+
+
+def test_shard_dir():
+    assert sharding.shard_dir((1, 4), root="data/shards") == os.path.join("data/shards", "1-of-4")
@@ -0,0 +1,215 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import threading
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from scripts import stream_pipeline, scrape_pdf_text
+from utils.links import write_links
+
+
+LINKS = [
+    ("M.1", "2024", "merger", "https://ec.europa.eu/competition/mergers/one.pdf"),
+    ("M.2", "2023", "merger", "https://ec.europa.eu/competition/mergers/two.pdf"),
+    ("M.3", "2022", "merger", "https://ec.europa.eu/competition/mergers/excluded.pdf"),
+]
+
+
+def fake_get_pdf_text(url, *args):
+    if "excluded" in url:
+        return None, "Excluded by criteria"
+    return f"Full decision text of {url} with a market definition.", None
+
+
+class FakeSectionModel:
+    def generate_content(self, parts):
+        text = parts[0]
+        case = text.split("Case Number: ", 1)[1].split("\n", 1)[0]
+        return mock.Mock(text=f"Case Number: {case}\nSection for {case}")
+
+
+class FakeDefinitionModel:
+    def generate_content(self, parts):
+        case = parts[0].split("Case Number: ", 1)[1].split("\n", 1)[0]
+        payload = [{"case_number": case, "topic": "Widgets", "text": "Definition."}]
+        return mock.Mock(text="```json\n" + json.dumps(payload) + "\n```")
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        with self.lock:
+            self.requests += 1
+
+
+def test_run_stream_writes_each_case(tmp_path):
+    output = tmp_path / "data" / "output.json"
+    limiter = CountingLimiter()
+    with mock.patch.object(scrape_pdf_text, "get_pdf_text", fake_get_pdf_text):
+        result = stream_pipeline.run_stream(
+            LINKS, str(output),
+            chunk_model=FakeSectionModel(), definition_model=FakeDefinitionModel(),
+            fetch_workers=2, llm_workers=2, queue_size=1, limiter=limiter,
+        )
+
+    data = json.loads(output.read_text())
+    assert sorted(d["case_number"] for d in data) == ["M.1", "M.2"]
+    assert result["definitions"] == 2
+    assert result["included"] == 2
+    assert result["excluded"] == [("M.3", "Excluded by criteria")]
+    assert result["failed"] == 0
+    assert result["time_to_first_result"] is not None
+    # both Gemini steps wait for the limiter
+    assert limiter.requests == 4
+
+
+def test_run_stream_output_is_valid_while_growing(tmp_path):
+    # the first case is released before the second is even downloaded,
+    # and the output must already hold it at that point
+    output = tmp_path / "output.json"
+    first_written = threading.Event()
+    seen = []
+
+    def gated_fetch(url, *args):
+        if "two" in url:
+            assert first_written.wait(timeout=5)
+            seen.append(json.loads(output.read_text()))
+        return fake_get_pdf_text(url)
+
+    real_append = stream_pipeline.json_merge.append_json_items
+
+    def append_and_signal(path, items):
+        real_append(path, items)
+        first_written.set()
+
+    with mock.patch.object(scrape_pdf_text, "get_pdf_text", gated_fetch), \
+         mock.patch.object(stream_pipeline.json_merge, "append_json_items", append_and_signal):
+        stream_pipeline.run_stream(
+            LINKS[:2], str(output),
+            chunk_model=FakeSectionModel(), definition_model=FakeDefinitionModel(),
+            fetch_workers=2, llm_workers=1,
+        )
+
+    assert [d["case_number"] for d in seen[0]] == ["M.1"]
+    assert len(json.loads(output.read_text())) == 2
+
+
+def test_run_stream_counts_failures(tmp_path, capsys):
+    class BrokenModel:
+        def generate_content(self, parts):
+            return mock.Mock(text="not json")
+
+    output = tmp_path / "output.json"
+    with mock.patch.object(scrape_pdf_text, "get_pdf_text", fake_get_pdf_text):
+        result = stream_pipeline.run_stream(
+            LINKS[:1], str(output),
+            chunk_model=FakeSectionModel(), definition_model=BrokenModel(),
+        )
+
+    assert result["failed"] == 1
+    assert json.loads(output.read_text()) == []
+    assert "JSONDecodeError" in capsys.readouterr().out
+
+
+def test_main_reads_links_file(tmp_path, capsys):
+    links = tmp_path / "extracted_links.jsonl"
+    write_links(links, [("M.1", 2024, "Merger", "https://ec.europa.eu/competition/mergers/one.pdf")])
+    output = tmp_path / "output.json"
+
+    class FakeModel:
+        # the default model serves both steps, told apart by their prompt
+        def generate_content(self, parts):
+            if parts[0].startswith(stream_pipeline.scrape_chunks.SECTIONS_PROMPT):
+                return FakeSectionModel().generate_content(parts)
+            return FakeDefinitionModel().generate_content(parts)
+
+    with mock.patch.object(scrape_pdf_text, "get_pdf_text", fake_get_pdf_text), \
+         mock.patch.object(stream_pipeline.scrape_chunks, "model", FakeModel()):
+        stream_pipeline.main(["-i", str(links), "--output", str(output), "--no-cache"])
+
+    assert json.loads(output.read_text())[0]["case_number"] == "M.1"
+    assert "Definitions written  : 1" in capsys.readouterr().out
+
+
+def test_repeated_and_unchanged_cases_are_not_sent_again(tmp_path, http_server, make_pdf):
+    pdf = make_pdf(["Decision text with a market definition."] * 4)
+
+    def serve(handler, n):
+        if handler.headers.get("If-None-Match") == '"v1"':
+            return 304, {}, b""
+        return 200, {"ETag": '"v1"'}, pdf
+
+    http_server.routes["/a.pdf"] = http_server.routes["/b.pdf"] = serve
+    a, b = http_server.url("/a.pdf"), http_server.url("/b.pdf")
+    links = tmp_path / "extracted_links.jsonl"
+    # M.2 repeats M.1's link, M.3 publishes the same PDF under another one
+    write_links(links, [("M.1", 2024, "Merger", a), ("M.2", 2023, "Merger", a),
+                        ("M.3", 2024, "Merger", b)])
+    output = tmp_path / "output.json"
+    argv = ["-i", str(links), "--output", str(output), "--cache-dir", str(tmp_path / "cache"),
+            "--manifest", str(tmp_path / "manifest" / "stream_pipeline.json")]
+
+    class FakeModel:
+        calls = 0
+
+        def generate_content(self, parts):
+            FakeModel.calls += 1
+            if parts[0].startswith(stream_pipeline.scrape_chunks.SECTIONS_PROMPT):
+                return FakeSectionModel().generate_content(parts)
+            return FakeDefinitionModel().generate_content(parts)
+
+    with mock.patch.object(stream_pipeline.scrape_chunks, "model", FakeModel()):
+        first = stream_pipeline.main(argv)
+        assert FakeModel.calls == 2
+        assert http_server.hits == {"/a.pdf": 1, "/b.pdf": 1}
+
+        second = stream_pipeline.main(argv)
+        assert FakeModel.calls == 2
+        # revalidated, not downloaded again
+        assert http_server.hits == {"/a.pdf": 2, "/b.pdf": 2}
+
+    data = json.loads(output.read_text())
+    assert sorted(d["case_number"] for d in data) == ["M.1", "M.2", "M.3"]
+    # a copy carries its own case's details
+    assert [(d["year"], d["link"]) for d in data if d["case_number"] == "M.2"] == [("2023", a)]
+    assert first == {"items": 3, "skipped": 0, "failed": 0}
+    assert second == {"items": 3, "skipped": 2, "failed": 0}
+
+
+def test_memory_budget_caps_items_in_flight():
+    fetch, llm, queue_size = stream_pipeline.memory_budget(100, 4, 4)
+    assert (fetch, llm) == (4, 4)
+    assert fetch + 2 * llm + 4 * queue_size <= 100
+
+    fetch, llm, queue_size = stream_pipeline.memory_budget(12, 4, 4)
+    assert fetch + 2 * llm + 4 * queue_size <= 12
+
+    # every step keeps at least one worker and one queue slot
+    assert stream_pipeline.memory_budget(1, 4, 4) == (1, 1, 1)
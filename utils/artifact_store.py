@@ -0,0 +1,206 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+# Default location of the store shared by every stage
+STORE = os.path.join("data", "artifacts.sqlite")
+
+# What each stage writes, keyed by "<case>|<link>" of the case it belongs to
+BATCHES = "batches"             # scrape_pdf_text: case header + PDF text
+SECTIONS = "sections"           # scrape_chunks: market definition sections
+DEFINITIONS = "definitions"     # scrape_individual: JSON definitions
+
+# zlib level; 6 is where extra effort stops paying off on decision text
+LEVEL = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest      TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    data        BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    stage       TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    digest      TEXT NOT NULL REFERENCES blobs (digest),
+    meta        TEXT NOT NULL DEFAULT '{}',
+    updated     REAL NOT NULL,
+    PRIMARY KEY (stage, key)
+);
+"""
+
+
+class ArtifactStore:
+    """
+    One SQLite file holding every intermediate document of the pipeline,
+    in place of a directory of small files per stage. Each (stage, key)
+    names a zlib-compressed blob addressed by the SHA-256 of its
+    uncompressed bytes, so identical documents are stored once and a
+    key's digest doubles as its content hash. `meta` holds small JSON
+    fields such as a batch's size label.
+    """
+
+    def __init__(self, path=STORE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def put(self, stage, key, text, **meta):
+        """
+        Store `text` (str or bytes) under (stage, key), replacing what was
+        there. Returns its digest.
+        """
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        digest = hashlib.sha256(data).hexdigest()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (digest, size, data) VALUES (?, ?, ?)",
+                (digest, len(data), zlib.compress(data, LEVEL)))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artifacts (stage, key, digest, meta, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stage, key, digest, json.dumps(meta), time.time()))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return digest
+
+    def get(self, stage, key):
+        """
+        The text stored under (stage, key), or None.
+        """
+        row = self.conn.execute(
+            "SELECT b.data FROM artifacts a JOIN blobs b ON a.digest = b.digest "
+            "WHERE a.stage = ? AND a.key = ?", (stage, key)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def digest(self, stage, key):
+        """
+        The SHA-256 of what is stored under (stage, key), or None.
+        """
+        row = self.conn.execute(
+            "SELECT digest FROM artifacts WHERE stage = ? AND key = ?", (stage, key)).fetchone()
+        return row[0] if row else None
+
+    def items(self, stage):
+        """
+        [(key, meta)] of `stage`, in key order.
+        """
+        return [(key, json.loads(meta)) for key, meta in self.conn.execute(
+            "SELECT key, meta FROM artifacts WHERE stage = ? ORDER BY key", (stage,))]
+
+    def delete(self, stage, key):
+        self.conn.execute("DELETE FROM artifacts WHERE stage = ? AND key = ?", (stage, key))
+
+    def gc(self):
+        """
+        Drop blobs no key refers to any more. Returns how many were dropped.
+        """
+        cur = self.conn.execute(
+            "DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM artifacts)")
+        return cur.rowcount
+
+    def stats(self):
+        """
+        {stage: (documents, bytes uncompressed, bytes stored)}; a blob
+        shared by several keys is counted for each of them.
+        """
+        return {stage: (n, raw, stored) for stage, n, raw, stored in self.conn.execute(
+            "SELECT a.stage, COUNT(*), SUM(b.size), SUM(LENGTH(b.data)) "
+            "FROM artifacts a JOIN blobs b ON a.digest = b.digest GROUP BY a.stage")}
+
+    def export(self, stage, outdir):
+        """
+        Write every document of `stage` to its own file in `outdir`, for
+        reading by eye. Returns the number of files written.
+        """
+        os.makedirs(outdir, exist_ok=True)
+        count = 0
+        for key, _ in self.items(stage):
+            name = "".join(c if c.isalnum() or c in "._-" else "_" for c in key)
+            with open(os.path.join(outdir, name + ".txt"), "w", encoding="utf-8") as f:
+                f.write(self.get(stage, key))
+            count += 1
+        return count
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Show how many documents each stage keeps in an artifact store, and their size"
+    )
+    p.add_argument(
+        "--store", default=STORE,
+        help="Artifact store to inspect (default: %(default)s)"
+    )
+    p.add_argument(
+        "--export", nargs=2, metavar=("STAGE", "DIR"), default=None,
+        help="Write every document of STAGE to its own file in DIR"
+    )
+    p.add_argument(
+        "--gc", action="store_true",
+        help="Drop stored documents no stage refers to any more"
+    )
+    args = p.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        print(f"No artifact store at {args.store}")
+        return
+
+    with ArtifactStore(args.store) as store:
+        if args.gc:
+            print(f"[store] dropped {store.gc()} unreferenced document(s)")
+        if args.export:
+            stage, outdir = args.export
+            print(f"[store] exported {store.export(stage, outdir)} {stage} → {outdir}")
+
+        table = store.stats()
+        print(f"{'stage':<20}{'documents':>10}{'MB':>10}{'stored MB':>12}")
+        for stage in sorted(table):
+            n, raw, stored = table[stage]
+            print(f"{stage:<20}{n:>10}{raw / (1 << 20):>10.1f}{stored / (1 << 20):>12.1f}")
+    return table
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Downloads in flight at once, across all hosts
+CONCURRENCY = 8
+
+# Downloads in flight at once against any single host
+PER_HOST = 4
+
+# (connect, read) timeouts in seconds; the read timeout applies to every
+# socket read, so a server that stops sending cannot hang a worker
+TIMEOUT = (10, 60)
+
+# Retries after the first attempt for 429/5xx responses and network errors
+RETRIES = 4
+
+# First backoff delay in seconds; doubles on each retry, capped at MAX_BACKOFF
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Bytes read from the network at a time when streaming a body to a file
+CHUNK_SIZE = 1 << 16
+
+
+class Downloader:
+    """
+    A connection-pooled requests.Session shared by a pool of worker
+    threads, with a cap on concurrent requests per host, timeouts, and
+    exponential backoff with full jitter on 429/5xx and network errors.
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, per_host=PER_HOST, timeout=TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF, session=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = session or make_session(concurrency)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number `attempt` (0-based): a random
+        point in [0, backoff * 2**attempt], but never less than a
+        server-sent Retry-After, and never more than max_backoff.
+        """
+        wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            wait = max(wait, retry_after)
+        return min(wait, self.max_backoff)
+
+    def get(self, url, **kwargs):
+        """
+        GET `url`, retrying 429/5xx responses and connection errors or
+        timeouts. Returns the last response (which may still be a 429/5xx
+        once retries run out) or raises the last requests exception.
+        With stream=True the body has not been read yet, so the response
+        keeps its host slot until it is closed; the caller must close it.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        slot = self._host_slot(url)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            slot.acquire()
+            try:
+                resp = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                slot.release()
+                if last:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+            except BaseException:
+                slot.release()
+                raise
+            if kwargs.get("stream"):
+                _release_on_close(resp, slot)
+            else:
+                slot.release()
+            if resp.status_code not in RETRY_STATUS or last:
+                return resp
+            resp.close()
+            time.sleep(self.delay(attempt, _retry_after(resp)))
+
+    def download(self, url, path, **kwargs):
+        """
+        GET `url` and, for a 200, stream the body into `path` CHUNK_SIZE
+        bytes at a time, so it is never held in memory whole. The file is
+        written under a temporary name and renamed once complete; a body
+        cut off part-way is retried like a failed request.
+        Returns (response, SHA-256 hex digest of the body, or None if
+        nothing was written).
+        """
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        for attempt in range(self.retries + 1):
+            resp = self.get(url, stream=True, **kwargs)
+            if resp.status_code != 200:
+                resp.close()
+                return resp, None
+            digest = hashlib.sha256()
+            try:
+                with open(tmp, "wb") as f:
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                _remove(tmp)
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+            except BaseException:
+                _remove(tmp)
+                raise
+            finally:
+                resp.close()
+            os.replace(tmp, path)
+            return resp, digest.hexdigest()
+
+    def map(self, func, items):
+        """
+        Like map(func, items), but up to `concurrency` calls run at once in
+        worker threads. Results come back in input order; items are drawn
+        from `items` in the calling thread and at most twice `concurrency`
+        are in flight, so `items` may be a lazy generator.
+        """
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for item in items:
+                window.append(pool.submit(func, item))
+                if len(window) >= 2 * self.concurrency:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+    def close(self):
+        self.session.close()
+
+
+def make_session(pool_size=CONCURRENCY):
+    """
+    A requests.Session whose connection pool keeps up to `pool_size`
+    connections per host alive between requests.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_downloader():
+    """
+    The process-wide Downloader used when a caller does not pass its own.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Downloader()
+        return _shared
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _release_on_close(resp, slot):
+    # the host slot is released once, when the body is done with
+    close = resp.close
+    released = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if released.acquire(blocking=False):
+                slot.release()
+
+    resp.close = close_and_release
+
+
+def _retry_after(resp):
+    # only the delta-seconds form; an HTTP date falls back to plain backoff
+    value = resp.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,216 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Gemini calls in flight at once
+CONCURRENCY = 8
+
+# Quotas the limiter keeps under; set them to your project's limits for the model
+RPM = 150
+TPM = 1_000_000
+
+# Retries after the first attempt for 429/5xx errors
+RETRIES = 5
+
+# First backoff delay in seconds; doubles on each retry, capped at MAX_BACKOFF
+BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Rough characters per token of English text, for the tokens-per-minute quota
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """
+    Hands out `rate` tokens per minute. Up to `capacity` (default a tenth
+    of a minute's worth, at least 1) can be saved up for a burst. A request
+    for more than `capacity` waits for a full bucket and leaves it in debt,
+    so later requests wait until the rate has caught up.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate / 60.0
+        self.capacity = capacity or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """
+        Block until `n` tokens can be taken and take them. Callers queue
+        on a lock, so they are served in turn. Returns the seconds waited.
+        """
+        waited = 0.0
+        with self._lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                need = min(n, self.capacity)
+                if self.tokens >= need:
+                    self.tokens -= n
+                    return waited
+                pause = (need - self.tokens) / self.rate
+                self.sleep(pause)
+                waited += pause
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by all
+    threads calling one model.
+    """
+
+    def __init__(self, rpm=RPM, tpm=TPM, clock=time.monotonic, sleep=time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, clock=clock, sleep=sleep)
+        self.tokens = TokenBucket(tpm, clock=clock, sleep=sleep)
+
+    def acquire(self, tokens):
+        """
+        Wait until one more request of `tokens` tokens fits both quotas.
+        Returns the seconds waited.
+        """
+        return self.requests.acquire(1) + self.tokens.acquire(tokens)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_limiter(key, rpm=RPM, tpm=TPM):
+    """
+    The process-wide RateLimiter for `key` (the model name), made with
+    `rpm` and `tpm` on first use. Stages calling one model at the same time,
+    such as run_pipeline's scrape_chunks_79 and scrape_chunks_80, then
+    draw on a single quota. A later caller cannot change its limits.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(rpm, tpm)
+        elif (limiter.rpm, limiter.tpm) != (rpm, tpm):
+            print(f"[gemini] {key} already limited to {limiter.rpm} requests and "
+                  f"{limiter.tpm} tokens per minute in this process; keeping those")
+        return limiter
+
+
+def estimate_tokens(text):
+    """
+    Tokens `text` will count for, estimated from its length; asking the
+    API to count them would cost a request of its own.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def is_retryable(error):
+    """
+    True for 429 (quota) and 5xx errors. google.api_core exceptions
+    carry their HTTP status as `code`.
+    """
+    return getattr(error, "code", None) in RETRY_STATUS
+
+
+def delay(attempt, backoff=BACKOFF, max_backoff=MAX_BACKOFF, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based): a random
+    point in [0, backoff * 2**attempt], but never less than a server-sent
+    retry delay, and never more than max_backoff.
+    """
+    pause = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+    if retry_after is not None:
+        pause = max(pause, retry_after)
+    return min(pause, max_backoff)
+
+
+def generate(model, text, limiter=None, retries=RETRIES, backoff=BACKOFF,
+             max_backoff=MAX_BACKOFF, sleep=time.sleep):
+    """
+    model.generate_content([text]). It first waits for `limiter` (if any)
+    to allow the request. 429/5xx errors are retried with exponential
+    backoff and full jitter. Each retry counts against the limiter again.
+    Returns the response or raises the last error.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire(estimate_tokens(text))
+        try:
+            return model.generate_content([text])
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            pause = delay(attempt, backoff, max_backoff, _retry_after(e))
+            print(f"[gemini] {e.code} from the API; retry {attempt + 1}/{retries} in {pause:.1f}s")
+            sleep(pause)
+
+
+def run_concurrently(func, items, workers=CONCURRENCY):
+    """
+    Call func(item) for each of `items` in up to `workers` threads and
+    yield (item, result, error) as each call finishes, with error None on
+    success. Items are drawn in the calling thread, and at most twice
+    `workers` are in flight, so `items` may be a lazy generator. With
+    workers <= 1 the calls run in turn in the calling thread.
+    """
+    if workers <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    def finished(futures):
+        for future in futures:
+            item = running.pop(future)
+            error = future.exception()
+            yield item, None if error else future.result(), error
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            running[pool.submit(func, item)] = item
+            if len(running) >= 2 * workers:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+
+
+def _retry_after(error):
+    # a 429 from Gemini may carry a google.rpc.RetryInfo with the delay it wants
+    for detail in getattr(error, "details", None) or ():
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    return None
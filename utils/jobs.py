@@ -0,0 +1,345 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Default location of the job table shared by every worker on this host
+JOBS_DB = os.path.join("data", "jobs.sqlite")
+
+# How long a worker may hold a job before another worker may take it over;
+# a Heartbeat renews it while the worker is alive
+LEASE_SECONDS = 600
+
+# Attempts (including the first) before a job is marked failed for good
+MAX_ATTEMPTS = 3
+
+STATES = ("pending", "running", "done", "excluded", "failed")
+
+# id:       row id; never reused, so it doubles as a unique batch number
+# key:      the job's key within its stage (e.g. "<case>|<url>")
+# payload:  the dict given to enqueue
+# attempts: how many times the job has been claimed, this time included
+Job = namedtuple("Job", ["id", "key", "payload", "attempts"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage       TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    input       TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    outputs     TEXT NOT NULL DEFAULT '[]',
+    error       TEXT,
+    updated     REAL NOT NULL,
+    UNIQUE (stage, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_stage_state ON jobs (stage, state);
+"""
+
+
+def connect(path=JOBS_DB):
+    """
+    Open (and create if needed) the job table. Connections are in
+    autocommit mode; claim() takes the write lock itself.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(conn, stage, items):
+    """
+    Add (key, input_hash, payload) items to `stage`. Known keys keep their
+    state unless their input hash changed, or they are done but one of
+    their outputs has gone missing; those go back to pending.
+    Returns the number of jobs that are new or were reset.
+    """
+    now = time.time()
+    changed = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for key, input_hash, payload in items:
+            cur = conn.execute(
+                "INSERT INTO jobs (stage, key, input, payload, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (stage, key) DO UPDATE SET "
+                "input = excluded.input, payload = excluded.payload, state = 'pending', "
+                "attempts = 0, worker = NULL, lease_until = NULL, outputs = '[]', "
+                "error = NULL, updated = excluded.updated "
+                "WHERE jobs.input != excluded.input",
+                (stage, key, input_hash, json.dumps(payload), now),
+            )
+            changed += cur.rowcount
+
+        done = conn.execute(
+            "SELECT id, outputs FROM jobs WHERE stage = ? AND state = 'done'", (stage,)
+        ).fetchall()
+        for job_id, outputs in done:
+            if not all(os.path.exists(p) for p in json.loads(outputs)):
+                _set(conn, job_id, "pending", attempts=0, outputs=[])
+                changed += 1
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return changed
+
+
+def claim(conn, stage, worker, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """
+    Take the next job of `stage` for `worker`, or return None when there
+    is nothing left to do. Jobs that already failed an attempt go to the
+    back of the queue. A running job is taken over if its lease has
+    expired or its worker was a process on this host that no longer
+    exists. Jobs that have used up max_attempts this way are marked failed.
+    A worker may hold several jobs at once.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        for job_id, holder, lease_until, attempts in conn.execute(
+            "SELECT id, worker, lease_until, attempts FROM jobs "
+            "WHERE stage = ? AND state = 'running'", (stage,)
+        ).fetchall():
+            if lease_until < now or not _alive(holder):
+                if attempts >= max_attempts:
+                    _set(conn, job_id, "failed", error="lease lost too many times")
+                else:
+                    _set(conn, job_id, "pending")
+
+        row = conn.execute(
+            "SELECT id, key, payload, attempts FROM jobs "
+            "WHERE stage = ? AND state = 'pending' ORDER BY attempts, id LIMIT 1", (stage,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        job_id, key, payload, attempts = row
+        conn.execute(
+            "UPDATE jobs SET state = 'running', attempts = ?, worker = ?, "
+            "lease_until = ?, updated = ? WHERE id = ?",
+            (attempts + 1, worker, now + lease, now, job_id),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return Job(job_id, key, json.loads(payload), attempts + 1)
+
+
+def finish(conn, job_id, state="done", outputs=(), error=None):
+    """
+    Mark a claimed job done (with the files it wrote) or excluded (with the reason).
+    """
+    if state not in ("done", "excluded"):
+        raise ValueError(f"finish() cannot set state {state!r}")
+    _set(conn, job_id, state, outputs=list(outputs), error=error)
+
+
+def fail(conn, job_id, error, max_attempts=MAX_ATTEMPTS):
+    """
+    Record a failed attempt. The job goes back to pending until it has
+    been tried max_attempts times; then it is marked failed.
+    """
+    (attempts,) = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    _set(conn, job_id, "failed" if attempts >= max_attempts else "pending", error=error)
+
+
+def renew(conn, stage, worker, lease=LEASE_SECONDS):
+    """
+    Extend the lease on every job of `stage` that `worker` still holds to
+    `lease` seconds from now. Jobs another worker has taken over are left
+    alone. Returns the number of jobs renewed.
+    """
+    now = time.time()
+    cur = conn.execute(
+        "UPDATE jobs SET lease_until = ?, updated = ? "
+        "WHERE stage = ? AND state = 'running' AND worker = ?", (now + lease, now, stage, worker))
+    return cur.rowcount
+
+
+class Heartbeat:
+    """
+    Renews `worker`'s leases on `stage` every `every` seconds (a third of
+    the lease by default) from a background thread, for as long as the
+    with block runs. A job that outlasts one lease, such as a large PDF
+    or a Gemini call stuck in retries, is then only taken over once this
+    worker has stopped. The thread opens its own connection to `path`.
+    """
+
+    def __init__(self, path, stage, worker, lease=LEASE_SECONDS, every=None):
+        self.path = path
+        self.stage = stage
+        self.worker = worker
+        self.lease = lease
+        self.every = every or lease / 3
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while not self._stop.wait(self.every):
+                try:
+                    renew(conn, self.stage, self.worker, self.lease)
+                except sqlite3.Error as e:
+                    # the next beat tries again, well before the lease runs out
+                    print(f"[jobs] Could not renew the leases of {self.worker}: {e}")
+        finally:
+            conn.close()
+
+
+def release(conn, stage, worker):
+    """
+    Put every job `worker` still holds back to pending, e.g. after it was
+    interrupted. Attempts are kept. Returns the number of jobs released.
+    """
+    cur = conn.execute(
+        "UPDATE jobs SET state = 'pending', worker = NULL, lease_until = NULL, updated = ? "
+        "WHERE stage = ? AND state = 'running' AND worker = ?", (time.time(), stage, worker))
+    return cur.rowcount
+
+
+def retry_failed(conn, stage):
+    """
+    Put every failed job of `stage` back to pending with a fresh attempt count.
+    """
+    cur = conn.execute(
+        "UPDATE jobs SET state = 'pending', attempts = 0, updated = ? "
+        "WHERE stage = ? AND state = 'failed'", (time.time(), stage))
+    return cur.rowcount
+
+
+def rows(conn, stage):
+    """
+    {key: (state, payload, error)} for every job of `stage`.
+    """
+    return {
+        key: (state, json.loads(payload), error)
+        for key, state, payload, error in conn.execute(
+            "SELECT key, state, payload, error FROM jobs WHERE stage = ? ORDER BY id", (stage,))
+    }
+
+
+def counts(conn, stage=None):
+    """
+    {stage: {state: number of jobs}}, for one stage or all of them.
+    """
+    query = "SELECT stage, state, COUNT(*) FROM jobs"
+    params = ()
+    if stage is not None:
+        query += " WHERE stage = ?"
+        params = (stage,)
+    result = {}
+    for name, state, n in conn.execute(query + " GROUP BY stage, state", params):
+        result.setdefault(name, dict.fromkeys(STATES, 0))[state] = n
+    return result
+
+
+def _set(conn, job_id, state, attempts=None, outputs=None, error=None):
+    fields = {"state": state, "worker": None, "lease_until": None,
+              "error": error, "updated": time.time()}
+    if attempts is not None:
+        fields["attempts"] = attempts
+    if outputs is not None:
+        fields["outputs"] = json.dumps(outputs)
+    conn.execute(
+        f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+        (*fields.values(), job_id),
+    )
+
+
+def _alive(worker):
+    """
+    False only if `worker` was a process on this host that has exited.
+    Workers on other hosts are assumed alive until their lease runs out.
+    """
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Show how many jobs of each stage are pending, running, done, excluded or failed"
+    )
+    p.add_argument(
+        "--jobs-db", default=JOBS_DB,
+        help="Job table to inspect (default: %(default)s)"
+    )
+    p.add_argument(
+        "--retry-failed", metavar="STAGE", default=None,
+        help="Put the failed jobs of STAGE back to pending"
+    )
+    args = p.parse_args(argv)
+
+    if not os.path.exists(args.jobs_db):
+        print(f"No job table at {args.jobs_db}")
+        return
+
+    conn = connect(args.jobs_db)
+    if args.retry_failed:
+        print(f"[jobs] {retry_failed(conn, args.retry_failed)} failed job(s) of {args.retry_failed} reset to pending")
+
+    table = counts(conn)
+    print(f"{'stage':<20}" + "".join(f"{s:>10}" for s in STATES))
+    for stage in sorted(table):
+        print(f"{stage:<20}" + "".join(f"{table[stage][s]:>10}" for s in STATES))
+    conn.close()
+    return table
+
+
+if __name__ == "__main__":
+    main()
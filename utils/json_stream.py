@@ -0,0 +1,129 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+
+# How much of the file is read at a time while looking for the next item
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of the JSON array in `path` one at a time, so only the
+    current item (plus one read chunk) is ever held in memory.
+    Raises ValueError if the file does not hold a JSON array.
+    """
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # read at least as much as is already buffered, so an item much
+            # larger than chunk_size is re-parsed O(log n) times, not O(n)
+            nonlocal buf, pos, eof
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+        def skip_space():
+            # move pos to the next non-whitespace character, reading more as needed
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        fill()
+        skip_space()
+        if buf[pos:pos + 1] != "[":
+            raise ValueError(f"{path} does not hold a JSON array")
+        pos += 1
+        skip_space()
+        if buf[pos:pos + 1] == "]":
+            return
+
+        while True:
+            while True:
+                try:
+                    item, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()
+                    continue
+                # a number cut off by the end of the buffer (e.g. "2." of "2.5")
+                # may continue in the next chunk
+                if (isinstance(item, (int, float)) and not eof
+                        and (end == len(buf) or buf[end] in "0123456789.eE+-")):
+                    fill()
+                    continue
+                break
+            pos = end
+            yield item
+
+            skip_space()
+            sep = buf[pos:pos + 1]
+            pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"{path}: expected ',' or ']' between array items")
+            skip_space()
+
+
+def write_json_array(path, items):
+    """
+    Write `items` (any iterable) to `path` as a JSON array, one item at a
+    time. The result is byte-for-byte what json.dump(list(items), f,
+    indent=4) would write. Returns the number of items written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write("[\n    " if count == 0 else ",\n    ")
+            f.write(json.dumps(item, indent=4).replace("\n", "\n    "))
+            count += 1
+        f.write("\n]" if count else "[]")
+    return count
+
+
+def batched(items, size):
+    """
+    Group an iterable into lists of at most `size` items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,138 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+import time
+from collections import namedtuple
+
+# Default location of the link list written by scrape_links
+LINKS = os.path.join("data", "extracted_links.jsonl")
+
+# Seconds between looks at a followed file that has no new lines yet
+POLL = 0.5
+
+# Seconds a follower waits for a file to appear or grow before giving up
+IDLE_TIMEOUT = 600
+
+# case_number: e.g. "M.1234"
+# year:        year of the last decision as an int, or None if unknown
+# policy_area: e.g. "Merger" or "Antitrust & Cartels"
+# link:        URL of the decision PDF
+Link = namedtuple("Link", ["case_number", "year", "policy_area", "link"])
+
+
+class LinkWriter:
+    """
+    Writes a link list as JSON Lines, one object per link, flushing each
+    line as it is written so a reader following the file sees the link at
+    once. Closing the writer appends an end record with the number of
+    links and whether the list is complete; followers stop there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(complete=exc_type is None)
+
+    def write(self, case_number, year, policy_area, link):
+        self._f.write(json.dumps(Link(str(case_number), year, policy_area, link)._asdict()) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def close(self, complete=True):
+        if self._f.closed:
+            return
+        self._f.write(json.dumps({"end": True, "count": self.count, "complete": complete}) + "\n")
+        self._f.close()
+
+
+def write_links(path, links):
+    """
+    Write (case_number, year, policy_area, link) tuples to `path`.
+    Returns the number written.
+    """
+    with LinkWriter(path) as w:
+        for link in links:
+            w.write(*link)
+    return w.count
+
+
+def read_links(path, follow=False, poll=POLL, idle_timeout=IDLE_TIMEOUT):
+    """
+    Yield the Links in `path` one at a time as they are read.
+
+    Without follow, reading stops at the end of the file. With follow,
+    the reader keeps waiting for new lines until the writer's end record,
+    so it can start on the first links while scrape_links is still
+    writing the rest; TimeoutError is raised if the file does not appear
+    or grow for idle_timeout seconds. Either way a list whose writer
+    failed part-way raises ValueError at its end record, as does a line
+    that is not a link.
+    """
+    waited = 0.0
+    while not os.path.exists(path):
+        if not follow:
+            raise FileNotFoundError(path)
+        if waited >= idle_timeout:
+            raise TimeoutError(f"{path} did not appear within {idle_timeout}s")
+        time.sleep(poll)
+        waited += poll
+
+    with open(path, encoding="utf-8") as f:
+        number, partial, waited = 0, "", 0.0
+        while True:
+            line = f.readline()
+            if not line.endswith("\n"):
+                # end of the file so far; a line without its newline is still being written
+                partial += line
+                if not follow:
+                    return
+                if waited >= idle_timeout:
+                    raise TimeoutError(f"{path} has not grown for {idle_timeout}s")
+                time.sleep(poll)
+                waited += poll
+                continue
+            line, partial, waited = partial + line, "", 0.0
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                end = record.get("end")
+                link = None if end else Link(record["case_number"], record["year"],
+                                             record["policy_area"], record["link"])
+            except (ValueError, KeyError, AttributeError) as e:
+                raise ValueError(f"{path}, line {number}: not a link ({e})") from None
+            if end:
+                if not record.get("complete"):
+                    raise ValueError(f"{path}: the link list was not finished")
+                return
+            yield link
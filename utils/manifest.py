@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+
+# One manifest file per stage lives in this directory
+MANIFEST_DIR = os.path.join("data", "manifest")
+
+
+def manifest_path(stage, root=MANIFEST_DIR):
+    return os.path.join(root, f"{stage}.json")
+
+
+def hash_text(*parts):
+    """
+    SHA-256 over the given strings, separated so ("ab", "c") != ("a", "bc").
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_hash(path, manifest=None):
+    """
+    SHA-256 of a file's contents. If a manifest is given, the hash is
+    memoised under its (size, mtime) so unchanged files are not re-read.
+    """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    files = manifest.setdefault("files", {}) if manifest is not None else None
+    if files is not None:
+        cached = files.get(path)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if files is not None:
+        files[path] = stamp + [digest]
+    return digest
+
+
+def load_manifest(path):
+    """
+    Load a manifest, or return an empty one if it does not exist or is unreadable.
+    """
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data.setdefault("items", {})
+                data.setdefault("files", {})
+                return data
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[manifest] Ignoring unreadable manifest {path}: {e}")
+    return {"items": {}, "files": {}}
+
+
+def save_manifest(manifest, path):
+    """
+    Write the manifest atomically so an interrupted run never leaves it half-written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def lookup(manifest, key, input_hash):
+    """
+    Return the recorded entry for `key` if it was produced from `input_hash`
+    and every output it recorded still exists; otherwise None.
+    """
+    if manifest is None:
+        return None
+    entry = manifest["items"].get(key)
+    if not entry or entry.get("input") != input_hash:
+        return None
+    if not all(os.path.exists(p) for p in entry.get("outputs", {})):
+        return None
+    return entry
+
+
+def record(manifest, key, input_hash, outputs=(), **extra):
+    """
+    Remember that `key` was processed from `input_hash` into `outputs`.
+    Extra keyword arguments (e.g. an exclusion reason) are stored alongside.
+    """
+    if manifest is None:
+        return
+    entry = {
+        "input": input_hash,
+        "outputs": {p: file_hash(p, manifest) for p in outputs},
+    }
+    entry.update(extra)
+    manifest["items"][key] = entry
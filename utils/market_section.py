@@ -0,0 +1,167 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import re
+
+# Heading titles that open the market definition section
+TITLE = (
+    r"(?:the\s+)?(?:relevant\s+)?markets?\s+definitions?"
+    r"|definitions?\s+of\s+(?:the\s+)?relevant\s+(?:product\s+and\s+geographic\s+)?markets?"
+    r"|(?:the\s+)?relevant\s+markets?\s*$"
+)
+TITLE_RE = re.compile(TITLE, re.IGNORECASE)
+
+# "IV.", "B)", "5", "5.2." at the start of a heading line; letters need the dot
+LABEL = r"(?P<label>(?:[IVXLC]+|[A-Z])[.)]|\d+(?:\.\d+)*[.)]?)"
+
+START_RE = re.compile(rf"^{LABEL}\s+(?:{TITLE})", re.IGNORECASE)
+
+# any numbered heading: a label, then a title starting with a capital letter
+HEADING_RE = re.compile(rf"^{LABEL}\s+[A-Z]")
+
+# headings are short lines; a longer line is a numbered paragraph
+MAX_HEADING_CHARS = 100
+
+# table of contents entries end in dot leaders or a page number
+TOC_RE = re.compile(r"\.{4,}|\s\d+\s*$")
+
+# a "section" shorter than this is a table of contents entry
+MIN_SECTION_CHARS = 300
+
+_ROMAN = [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+          (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+
+
+def _from_roman(label):
+    value, rest = 0, label
+    for n, numeral in _ROMAN:
+        while rest.startswith(numeral):
+            value += n
+            rest = rest[len(numeral):]
+    return value if not rest and value else None
+
+
+def _to_roman(value):
+    out = ""
+    for n, numeral in _ROMAN:
+        while value >= n:
+            out += numeral
+            value -= n
+    return out
+
+
+def next_labels(label):
+    """
+    Labels of the headings that close a section headed `label`: the next
+    heading at the same level, or at any higher level for "4.2"-style
+    numbering. Single letters other than I, V and X count as letters.
+    """
+    label = label.upper()
+    if label[0].isdigit():
+        parts = [int(p) for p in label.split(".")]
+        return {".".join(map(str, parts[:i] + [parts[i] + 1])) for i in range(len(parts))}
+    if len(label) == 1 and label not in "IVX":
+        return {chr(ord(label) + 1)}
+    value = _from_roman(label)
+    return {_to_roman(value + 1)} if value else set()
+
+
+def _heading(line, pattern):
+    line = line.strip()
+    if len(line) > MAX_HEADING_CHARS or TOC_RE.search(line):
+        return None
+    m = pattern.match(line)
+    return m.group("label").rstrip(".)").upper() if m else None
+
+
+class SectionScanner:
+    """
+    Fed the text of a document page by page, keeps the lines from the
+    market definition heading up to (not including) the next heading at
+    its level. `done` turns true once that heading has been seen, so the
+    remaining pages need not be extracted at all.
+    """
+
+    def __init__(self):
+        self.label = None
+        self.closing = set()
+        self.lines = []
+        self.done = False
+
+    def feed(self, text):
+        for line in text.split("\n"):
+            if self.done:
+                return
+            if self.label is None:
+                self._start(line)
+            elif _heading(line, HEADING_RE) in self.closing:
+                if sum(map(len, self.lines)) >= MIN_SECTION_CHARS:
+                    self.done = True
+                else:
+                    # only a table of contents entry; keep looking
+                    self.label, self.lines = None, []
+            else:
+                self.lines.append(line)
+
+    def _start(self, line):
+        label = _heading(line, START_RE)
+        if label:
+            self.label, self.closing, self.lines = label, next_labels(label), [line]
+
+    def text(self):
+        """
+        The section found so far, or None if no heading was found.
+        """
+        return "\n".join(self.lines) if self.label else None
+
+
+def outline_range(reader):
+    """
+    (first page, end page) of the market definition section according to
+    the PDF outline (bookmarks), or None if the outline has no such entry.
+    The end page is that of the next entry at the same or a higher level,
+    and is included, since the section usually ends part-way down it.
+    """
+    try:
+        entries = list(_flatten(reader, reader.outline, 0))
+    except Exception:
+        # a malformed outline is no worse than none
+        return None
+    for i, (depth, title, page) in enumerate(entries):
+        if page is not None and TITLE_RE.search(title):
+            end = next((p for d, _, p in entries[i + 1:] if d <= depth and p is not None),
+                       len(reader.pages) - 1)
+            return page, max(page, end) + 1
+    return None
+
+
+def _flatten(reader, outline, depth):
+    # yields (depth, title, page number) in document order
+    for item in outline:
+        if isinstance(item, list):
+            yield from _flatten(reader, item, depth + 1)
+        else:
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                page = None
+            yield depth, str(item.title or ""), page
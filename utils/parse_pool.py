@@ -0,0 +1,194 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes; PDF text extraction is CPU-bound pure Python, so one per core
+WORKERS = os.cpu_count() or 1
+
+# Seconds one call (a document, or one part of a split one) may take before
+# it is abandoned
+TIMEOUT = 120.0
+
+# Extra seconds the parent waits past TIMEOUT before it assumes a worker is
+# stuck somewhere the in-worker alarm cannot interrupt, and restarts the pool
+GRACE = 10.0
+
+
+class ParsePool:
+    """
+    Runs a CPU-bound function over a stream of items in worker processes,
+    so parsing uses every core while downloads carry on in threads.
+
+    At most `queue_size` items are handed to the workers at once, and
+    results come back in input order. Each call is interrupted after
+    `timeout` seconds inside the worker; a worker that still does not
+    answer, or dies, is killed and the pool restarted, so one
+    pathological document cannot stall the rest. With workers=0 the
+    function runs in the calling process instead.
+    """
+
+    def __init__(self, workers=WORKERS, timeout=TIMEOUT, queue_size=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_size = queue_size or 2 * max(workers, 1)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self):
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            # with the fork start method all workers are forked on the first
+            # submit; do that now, before the caller starts download threads
+            self._executor.submit(int).result()
+        return self._executor
+
+    def _restart(self):
+        executor, self._executor = self._executor, None
+        for proc in list((getattr(executor, "_processes", None) or {}).values()):
+            proc.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return self._start()
+
+    def _submit(self, func, arg):
+        try:
+            return self._executor.submit(_call_with_alarm, func, arg, self.timeout)
+        except BrokenProcessPool as e:
+            # a worker died since the last result; the item is submitted
+            # again once _next gets to the broken futures
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def map(self, func, items):
+        """
+        For each (ctx, arg) in `items`, yield (ctx, result, error) in input
+        order: result is func(arg) and error is None, or result is None and
+        error the exception raised (TimeoutError once the timeout passes).
+        An arg that is a list is fanned out: func runs on each element in
+        parallel and result is the list of their results, in order.
+        Items whose arg is None skip the workers and come back as
+        (ctx, None, None). `items` may be a lazy generator; it is drawn in
+        the calling thread.
+        """
+        if not self._start():
+            for ctx, arg in items:
+                yield self._run_here(func, ctx, arg)
+            return
+
+        window = deque()
+        inflight = 0
+        for ctx, arg in items:
+            args = _as_list(arg)
+            window.append([ctx, arg, args, [self._submit(func, a) for a in args]])
+            # a fanned-out document counts once per part against the queue
+            inflight += max(len(args), 1)
+            while window and inflight >= self.queue_size:
+                inflight -= max(len(window[0][2]), 1)
+                yield self._next(func, window)
+        while window:
+            yield self._next(func, window)
+
+    def _run_here(self, func, ctx, arg):
+        try:
+            results = [_call_with_alarm(func, a, self.timeout) for a in _as_list(arg)]
+        except Exception as e:
+            return ctx, None, e
+        return ctx, _unwrap(arg, results), None
+
+    def _next(self, func, window, isolated=False):
+        ctx, arg, args, futures = window.popleft()
+        try:
+            results = [future.result(timeout=self.timeout + GRACE) for future in futures]
+            return ctx, _unwrap(arg, results), None
+        except FutureTimeout:
+            error = TimeoutError(f"no result after {self.timeout + GRACE:g}s")
+        except BrokenProcessPool as e:
+            error = e
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            return ctx, None, e
+
+        # the worker is stuck or dead: start fresh processes
+        self._restart()
+        if isinstance(error, BrokenProcessPool) and not isolated:
+            # any of the workers may have died; run this item on its own to
+            # find out whether it was the one
+            print("[parse] a worker process died; retrying the oldest document on its own")
+            window.appendleft([ctx, arg, args, [self._submit(func, a) for a in args]])
+            result = self._next(func, window, isolated=True)
+        else:
+            print(f"[parse] restarting worker processes ({error})")
+            result = ctx, None, error
+        if not isolated:
+            # hand the rest of the window to the new processes
+            for entry in window:
+                entry[3] = [self._submit(func, a) for a in entry[2]]
+        return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+def _call_with_alarm(func, arg, timeout):
+    # SIGALRM interrupts pure-Python code such as PyPDF2's parser; it is
+    # only available on POSIX and only in a process's main thread
+    if (not timeout or not hasattr(signal, "setitimer")
+            or threading.current_thread() is not threading.main_thread()):
+        return func(arg)
+
+    def expired(signum, frame):
+        raise TimeoutError(f"took longer than {timeout:g}s")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(arg)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _as_list(arg):
+    if arg is None:
+        return []
+    return arg if isinstance(arg, list) else [arg]
+
+
+def _unwrap(arg, results):
+    if arg is None:
+        return None
+    return results if isinstance(arg, list) else results[0]
@@ -0,0 +1,326 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+import argparse
+import glob
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from multiprocessing import get_context
+
+from PyPDF2 import PdfReader
+
+# PyPDF2 is always installed; the others are optional and faster:
+#   pip install pypdfium2       (PDFium, C++; the fastest)
+#   pip install pdfminer.six    (pure Python; best at reading order)
+DEFAULT_BACKEND = "pypdf2"
+
+# Where the PDFs downloaded by scrape_pdf_text are kept; a ready-made corpus
+CORPUS_DIR = os.path.join("data", "cache", "pdf")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class _Page:
+    def __init__(self, extract):
+        self.extract_text = extract
+
+
+class _Document:
+    """
+    What every backend returns: `pages`, a list of objects with an
+    extract_text() method, and `outline`, PyPDF2-style bookmarks (empty
+    for backends that do not read them). Close it, or use it as a context
+    manager, once its pages have been read.
+    """
+    outline = []
+
+    def __init__(self, pages, close=None):
+        self.pages = pages
+        self._close = close
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Reader(_Document):
+    """
+    A PyPDF2 PdfReader that closes like a _Document; anything else is
+    looked up on the reader itself.
+    """
+    def __init__(self, reader, close=None):
+        super().__init__(reader.pages, close)
+        self._reader = reader
+
+    @property
+    def outline(self):
+        return self._reader.outline
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+def _stream(source):
+    """
+    A seekable stream over `source`: bytes, the path of a PDF, which is
+    mapped into memory so pages are read from disk as they are needed, or
+    an open binary file, used as it is.
+    """
+    if hasattr(source, "read"):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    with open(source, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _open_pypdf2(source):
+    stream = _stream(source)
+    close = stream.close if stream is not source else None
+    try:
+        return _Reader(PdfReader(stream), close)
+    except BaseException:
+        if close:
+            close()
+        raise
+
+
+def _open_pypdfium2(source):
+    import pypdfium2 as pdfium
+
+    # PDFium takes bytes, a path or a binary file and reads it itself
+    pdf = pdfium.PdfDocument(source)
+    try:
+        count = len(pdf)
+    except BaseException:
+        pdf.close()
+        raise
+
+    def extract(i):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        try:
+            # PDFium ends lines with \r\n; the other backends use \n
+            return textpage.get_text_range().replace("\r\n", "\n")
+        finally:
+            textpage.close()
+            page.close()
+
+    return _Document([_Page(lambda i=i: extract(i)) for i in range(count)], pdf.close)
+
+
+def _open_pdfminer(source):
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    # one interpreter for the whole document, so fonts are parsed once
+    manager = PDFResourceManager()
+    out = StringIO()
+    interpreter = PDFPageInterpreter(manager, TextConverter(manager, out, laparams=LAParams()))
+
+    def extract(page):
+        out.seek(0)
+        out.truncate()
+        interpreter.process_page(page)
+        # drop the form feed pdfminer ends every page with
+        return out.getvalue().replace("\f", "")
+
+    stream = _stream(source)
+    close = stream.close if stream is not source else None
+    try:
+        pages = [_Page(lambda p=p: extract(p)) for p in PDFPage.get_pages(stream)]
+    except BaseException:
+        if close:
+            close()
+        raise
+    return _Document(pages, close)
+
+
+# name → (opener, module that must be importable, package to pip install)
+BACKENDS = {
+    "pypdf2":    (_open_pypdf2, "PyPDF2", "PyPDF2"),
+    "pypdfium2": (_open_pypdfium2, "pypdfium2", "pypdfium2"),
+    "pdfminer":  (_open_pdfminer, "pdfminer", "pdfminer.six"),
+}
+
+
+def available():
+    """
+    Names of the backends whose library is installed.
+    """
+    found = []
+    for name, (_, module, _) in BACKENDS.items():
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        found.append(name)
+    return found
+
+
+def open_pdf(source, backend=DEFAULT_BACKEND):
+    """
+    Open the PDF given as bytes, a path or a binary file with `backend`. The result has
+    `pages` (each with extract_text()) and `outline`, like PyPDF2's PdfReader, and
+    is a context manager: leaving it closes what was opened for it (a binary file
+    passed in is left open).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown PDF backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[backend][0](source)
+
+
+def agreement(text, baseline):
+    """
+    How much of two texts' words agree, from 0 to 1: twice the shared
+    word count over the total, ignoring order and whitespace.
+    """
+    a, b = Counter(_WORD_RE.findall(text.lower())), Counter(_WORD_RE.findall(baseline.lower()))
+    total = sum(a.values()) + sum(b.values())
+    return 2 * sum((a & b).values()) / total if total else 1.0
+
+
+def _bench_one(backend, paths, text_dir, baseline_dir):
+    # runs in a fresh process, so its peak RSS belongs to this backend alone
+    pages = failed = 0
+    scores = []
+    start = time.perf_counter()
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            with open_pdf(path, backend) as doc:
+                text = "".join(p.extract_text() or "" for p in doc.pages)
+                pages += len(doc.pages)
+        except Exception:
+            failed += 1
+            continue
+        if text_dir:
+            with open(os.path.join(text_dir, name + ".txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+        if baseline_dir and os.path.exists(os.path.join(baseline_dir, name + ".txt")):
+            with open(os.path.join(baseline_dir, name + ".txt"), encoding="utf-8") as f:
+                scores.append(agreement(text, f.read()))
+    seconds = time.perf_counter() - start
+    try:
+        import resource
+        # kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_mb = peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        peak_mb = None
+    return {
+        "backend": backend,
+        "docs": len(paths) - failed,
+        "failed": failed,
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(pages / seconds, 1) if seconds else None,
+        "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "agreement": round(sum(scores) / len(scores), 4) if scores else None,
+    }
+
+
+def bench(paths, backends, baseline=DEFAULT_BACKEND):
+    """
+    Extract every PDF in `paths` with each backend, each in its own fresh
+    process, and return one result dict per backend: documents, pages,
+    seconds, pages/sec, peak resident memory (MB) and mean word agreement
+    with the `baseline` backend's text.
+    """
+    order = [baseline] + [b for b in backends if b != baseline]
+    results = []
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        for backend in order:
+            is_baseline = backend == baseline
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(_bench_one, backend, paths,
+                                     baseline_dir if is_baseline else None,
+                                     None if is_baseline else baseline_dir).result()
+            if is_baseline:
+                result["agreement"] = 1.0
+            if backend in backends:
+                results.append(result)
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Compare the PDF text backends on a folder of decision PDFs: "
+                    "pages/sec, peak memory and agreement with a baseline backend"
+    )
+    p.add_argument(
+        "--corpus", default=CORPUS_DIR,
+        help="Folder of PDFs (default: %(default)s, the download cache)"
+    )
+    p.add_argument(
+        "--backends", default=None,
+        help=f"Comma-separated backends to compare (default: every installed one of {', '.join(BACKENDS)})"
+    )
+    p.add_argument(
+        "--baseline", default=DEFAULT_BACKEND, choices=BACKENDS,
+        help="Backend whose text the others are compared with (default: %(default)s)"
+    )
+    p.add_argument(
+        "--limit", type=int, default=None,
+        help="Only use the first N PDFs"
+    )
+    args = p.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))[:args.limit]
+    if not paths:
+        print(f"No PDFs in {args.corpus}")
+        return
+
+    backends = args.backends.split(",") if args.backends else available()
+    missing = [b for b in backends + [args.baseline] if b not in available()]
+    if missing:
+        p.error(f"not installed or unknown: {', '.join(missing)} "
+                f"(pip install {' '.join(BACKENDS.get(b, (None, None, b))[2] for b in missing)})")
+
+    print(f"[bench] {len(paths)} PDFs from {args.corpus}; baseline {args.baseline}")
+    results = bench(paths, backends, args.baseline)
+    print(f"{'backend':<12}{'docs':>6}{'pages':>8}{'seconds':>10}{'pages/s':>10}{'peak MB':>10}{'agree':>8}")
+    for r in results:
+        print(f"{r['backend']:<12}{r['docs']:>6}{r['pages']:>8}{r['seconds']:>10.2f}"
+              f"{r['pages_per_sec'] or 0:>10.1f}{r['peak_mb'] or 0:>10.1f}"
+              f"{r['agreement'] or 0:>8.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
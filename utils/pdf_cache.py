@@ -0,0 +1,225 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+# Shared by every stage and shard, so a PDF is downloaded once per machine
+CACHE_DIR = os.path.join("data", "cache", "pdf")
+
+# Least recently used entries are evicted once the cache grows past this
+MAX_BYTES = 2 << 30
+
+
+class PdfCache:
+    """
+    URL-keyed on-disk cache of downloaded PDFs and the text extracted from
+    them. Every URL has files named after the SHA-1 of the URL:
+    <key>.pdf (raw bytes), <key>.txt (extracted text; <key>.<kind>.txt for
+    other kinds of extraction) and <key>.json (URL, ETag, Last-Modified,
+    content hash, page counts). The .json file's mtime records when the
+    entry was last used, for eviction.
+
+    Cached copies are revalidated with If-None-Match / If-Modified-Since,
+    unless they were checked less than `max_age` seconds ago or the cache
+    is `offline`, in which case no request is made at all.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, offline=False, max_age=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, url, ext):
+        return os.path.join(self.root, hashlib.sha1(url.encode("utf-8")).hexdigest() + ext)
+
+    def meta(self, url):
+        """
+        The stored metadata for `url`, or None if it has no usable entry.
+        """
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.exists(self._path(url, ".pdf")):
+            return None
+        return meta
+
+    def fetch(self, url, downloader):
+        """
+        Make sure the cache holds the current PDF for `url`.
+        Returns the HTTP status that applies: 200 when the cached copy is
+        current (possibly after a 304), another status if the server
+        refused, or None when offline and `url` is not cached.
+        A cached copy is also served when the server cannot be reached.
+        """
+        meta = self.meta(url)
+        now = time.time()
+        if meta and (self.offline or (self.max_age is not None
+                                      and now - meta["checked"] < self.max_age)):
+            self._touch(url)
+            return 200
+        if self.offline:
+            return None
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            # streamed straight into the cache; the bytes are never all in memory
+            resp, digest = downloader.download(url, self.pdf_path(url), headers=headers)
+        except requests.RequestException as e:
+            if meta:
+                print(f"[cache] {url} unreachable ({type(e).__name__}); using cached copy")
+                self._touch(url)
+                return 200
+            raise
+
+        if resp.status_code == 304 and meta:
+            meta["checked"] = now
+            self._write_json(url, meta)
+            return 200
+        if resp.status_code != 200:
+            return resp.status_code
+
+        if meta and meta.get("sha256") == digest:
+            # same bytes under a new validator: the extracted text still applies
+            meta.update(etag=resp.headers.get("ETag"),
+                        last_modified=resp.headers.get("Last-Modified"), checked=now)
+        else:
+            meta = {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "sha256": digest,
+                "size": os.path.getsize(self.pdf_path(url)),
+                "checked": now,
+            }
+        self._write_json(url, meta)
+        return 200
+
+    def pdf_path(self, url):
+        return self._path(url, ".pdf")
+
+    def content(self, url):
+        with open(self.pdf_path(url), "rb") as f:
+            return f.read()
+
+    def load_text(self, url, kind="full"):
+        """
+        (text, page count) of the given kind extracted from the cached PDF,
+        or None if it has not been extracted from the current bytes yet.
+        The text is None if extraction stopped early because the PDF is
+        excluded.
+        """
+        meta = self.meta(url)
+        entry = (meta or {}).get("texts", {}).get(kind)
+        if not entry or entry["of"] != meta["sha256"]:
+            return None
+        if entry["excluded"]:
+            return None, entry["pages"]
+        try:
+            with open(self._text_path(url, kind), encoding="utf-8") as f:
+                return f.read(), entry["pages"]
+        except OSError:
+            return None
+
+    def store_text(self, url, text, pages, kind="full"):
+        """
+        Keep text extracted from the cached PDF. Each kind of extraction
+        (e.g. "full", or "market" for only the market definition section)
+        is stored separately.
+        """
+        meta = self.meta(url)
+        if meta is None:
+            return
+        if text is not None:
+            self._write(self._text_path(url, kind), text.encode("utf-8"))
+        meta.setdefault("texts", {})[kind] = {
+            "of": meta["sha256"], "pages": pages, "excluded": text is None,
+        }
+        self._write_json(url, meta)
+
+    def _text_path(self, url, kind):
+        return self._path(url, ".txt" if kind == "full" else f".{kind}.txt")
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in
+        max_bytes. Returns the number of entries removed.
+        """
+        files = {}
+        for name in os.listdir(self.root):
+            # every file of an entry starts with the entry's key
+            files.setdefault(name.split(".", 1)[0], []).append(os.path.join(self.root, name))
+
+        entries = []
+        total = 0
+        for key, paths in files.items():
+            meta = os.path.join(self.root, key + ".json")
+            if meta not in paths:
+                continue
+            size = sum(os.path.getsize(p) for p in paths)
+            entries.append((os.path.getmtime(meta), size, paths))
+            total += size
+
+        removed = 0
+        for _, size, paths in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        if removed:
+            print(f"[cache] evicted {removed} entries; {total // (1 << 20)} MB left in {self.root}")
+        return removed
+
+    def _touch(self, url):
+        try:
+            os.utime(self._path(url, ".json"))
+        except OSError:
+            pass
+
+    def _write_json(self, url, meta):
+        self._write(self._path(url, ".json"), json.dumps(meta).encode("utf-8"))
+
+    def _write(self, path, data):
+        # unique temp name, so two threads writing one entry never collide
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
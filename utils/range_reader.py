@@ -0,0 +1,144 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import io
+import re
+
+# Bytes fetched per Range request at least; PDF parsers read in many tiny
+# pieces, so neighbouring reads are served from the same block
+BLOCK_SIZE = 1 << 16
+
+# Bytes at the end of the file asked for first: the trailer and, for most
+# PDFs, the cross-reference table
+TAIL_SIZE = 1 << 16
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class RangeFile(io.RawIOBase):
+    """
+    A read-only, seekable file over the resource at `url` that fetches
+    only the blocks that are read, with HTTP Range requests through
+    `downloader`. Blocks are kept once fetched; `fetched` counts the
+    bytes transferred and `requests` the requests made.
+    Open one with open_ranged().
+    """
+
+    def __init__(self, url, downloader, size, block_size=BLOCK_SIZE):
+        self.url = url
+        self.downloader = downloader
+        self.size = size
+        self.block_size = block_size
+        self.fetched = 0
+        self.requests = 0
+        self._blocks = {}
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self._pos + size)
+        if self._pos >= end:
+            return b""
+        first, last = self._pos // self.block_size, (end - 1) // self.block_size
+        self._fetch(first, last)
+        data = b"".join(self._blocks[n] for n in range(first, last + 1))
+        offset = first * self.block_size
+        data = data[self._pos - offset:end - offset]
+        self._pos = end
+        return data
+
+    def _fetch(self, first, last):
+        # one request for each run of blocks not fetched yet
+        n = first
+        while n <= last:
+            if n in self._blocks:
+                n += 1
+                continue
+            start = n
+            while n <= last and n not in self._blocks:
+                n += 1
+            self._get(start * self.block_size, min(n * self.block_size, self.size) - 1)
+
+    def _get(self, start, stop):
+        resp = self.downloader.get(self.url, headers={"Range": f"bytes={start}-{stop}"})
+        self.requests += 1
+        if resp.status_code != 206:
+            raise IOError(f"{self.url}: Range request answered with HTTP {resp.status_code}")
+        self.fetched += len(resp.content)
+        self._add(start, resp.content)
+
+    def _add(self, start, data):
+        # keep the whole blocks in `data`, and the last one if the file ends there
+        end = start + len(data)
+        n = -(-start // self.block_size)
+        while (n + 1) * self.block_size <= end or (n * self.block_size < end == self.size):
+            offset = n * self.block_size - start
+            self._blocks[n] = data[offset:offset + self.block_size]
+            n += 1
+
+
+def open_ranged(url, downloader, block_size=BLOCK_SIZE, tail=TAIL_SIZE):
+    """
+    A RangeFile over `url` with the last `tail` bytes already fetched, or
+    None if the server does not answer Range requests with 206 Partial
+    Content (or refuses the request); the caller should then download the
+    file in full. Network errors are raised.
+    """
+    resp = downloader.get(url, headers={"Range": f"bytes=-{tail}"}, stream=True)
+    try:
+        match = _CONTENT_RANGE_RE.fullmatch(resp.headers.get("Content-Range", ""))
+        if resp.status_code != 206 or not match:
+            return None
+        start, size = int(match.group(1)), int(match.group(3))
+        data = resp.content
+    finally:
+        resp.close()
+
+    f = RangeFile(url, downloader, size, block_size)
+    f.requests = 1
+    f.fetched = len(data)
+    f._add(start, data)
+    return f
@@ -0,0 +1,125 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import datetime
+import glob
+import os
+import time
+
+from utils import manifest as mf
+
+# Columnar copies of the register, named after the workbook's hash
+CACHE_DIR = os.path.join("data", "cache", "register")
+
+# The columns scrape_links uses; every other column is skipped while reading
+COLUMNS = ("Decisions", "Case number", "Last decision date")
+
+
+def cache_format():
+    """
+    "feather" when pyarrow is installed (pip install lextract[parquet]),
+    otherwise "pickle", which needs nothing beyond pandas.
+    """
+    try:
+        import pyarrow  # noqa: F401
+        return "feather"
+    except ImportError:
+        return "pickle"
+
+
+def read_register(path, columns=COLUMNS):
+    """
+    Read the first sheet of the workbook at `path` into a DataFrame of
+    those of `columns` it has (header names are stripped), streaming the
+    rows with openpyxl in read-only mode so no other cell is kept. Date
+    cells become DD.MM.YYYY strings, as the register writes them.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+        wanted = [(header.index(name), name) for name in columns if name in header]
+        data = {name: [] for _, name in wanted}
+        for row in rows:
+            if not any(c is not None for c in row):
+                continue
+            for i, name in wanted:
+                value = row[i] if i < len(row) else None
+                if isinstance(value, (datetime.datetime, datetime.date)):
+                    value = value.strftime("%d.%m.%Y")
+                data[name].append(value)
+    finally:
+        wb.close()
+    return pd.DataFrame(data, dtype=object)
+
+
+def load_register(path, cache_dir=CACHE_DIR, columns=COLUMNS, digest=None):
+    """
+    The register at `path` as read_register returns it, from a columnar
+    copy in `cache_dir` when one was made from the same workbook bytes
+    and columns; otherwise the workbook is read and the copy (re)written,
+    replacing copies of older workbooks. `digest` is the workbook's
+    SHA-256 if the caller already has it. Pass cache_dir=None to always
+    read the workbook.
+    """
+    import pandas as pd
+
+    if cache_dir is None:
+        return read_register(path, columns)
+
+    key = mf.hash_text(digest or mf.file_hash(path), *columns)
+    for cached in glob.glob(os.path.join(cache_dir, key + ".*")):
+        try:
+            start = time.perf_counter()
+            df = pd.read_feather(cached) if cached.endswith(".feather") else pd.read_pickle(cached)
+            print(f"[register] {path} unchanged; loaded {len(df)} rows from {cached} "
+                  f"in {time.perf_counter() - start:.3f}s")
+            return df
+        except Exception as e:
+            print(f"[register] Ignoring unreadable copy {cached}: {e}")
+
+    df = read_register(path, columns)
+
+    fmt = cache_format()
+    os.makedirs(cache_dir, exist_ok=True)
+    target = os.path.join(cache_dir, f"{key}.{fmt}")
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        if fmt == "feather":
+            df.to_feather(tmp)
+        else:
+            df.to_pickle(tmp)
+    except Exception as e:
+        # e.g. a column mixing numbers and text, which Arrow refuses
+        print(f"[register] Not keeping a copy of {path}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return df
+    os.replace(tmp, target)
+    for old in glob.glob(os.path.join(cache_dir, "*")):
+        if old != target and not old.endswith(".tmp"):
+            os.remove(old)
+    return df
@@ -0,0 +1,154 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import json
+import os
+import sys
+import time
+
+from utils import artifact_store as st
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_PATH = os.path.join("data", "run_report.json")
+
+
+def path_bytes(paths):
+    """
+    Total size in bytes of the given files, walking into directories.
+    Paths that do not exist count as 0.
+    """
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        pass
+    return total
+
+
+def store_bytes(store, kind):
+    """
+    Compressed bytes the artifact store at `store` keeps for `kind`
+    (st.BATCHES, st.SECTIONS or st.DEFINITIONS); 0 if there is no store.
+    """
+    if not os.path.isfile(store):
+        return 0
+    with st.ArtifactStore(store) as artifacts:
+        return artifacts.stats().get(kind, (0, 0, 0))[2]
+
+
+def artifact_bytes(items):
+    """
+    path_bytes for a list of paths and (store, kind) pairs, the latter
+    measured with store_bytes.
+    """
+    return sum(store_bytes(*item) if isinstance(item, tuple) else path_bytes([item])
+               for item in items)
+
+
+def peak_rss_mb(who=None):
+    """
+    Peak resident set size in MB, or None where the platform does not
+    report it. Linux reports KB, macOS bytes. `who` is RUSAGE_SELF (the
+    default: this process over its whole life so far, every stage run in
+    it included) or RUSAGE_CHILDREN (the largest child process waited
+    for so far, such as a parse pool worker).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def children_peak_rss_mb():
+    return peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else None
+
+
+def stage_record(name, status, wall_time, counts=None, bytes_in=0, bytes_out=0):
+    """
+    One row of the run report. `counts` is what the stage's main() returned:
+    {"items": ..., "skipped": ..., "failed": ...}. Stages share one process
+    and may overlap, so memory is not per stage: the row holds the peak
+    RSS of the process, and of its child processes, up to when it ended.
+    """
+    counts = counts or {}
+    items = counts.get("items", 0)
+    return {
+        "stage": name,
+        "status": status,
+        "wall_time_s": round(wall_time, 3),
+        "items": items,
+        "items_per_s": round(items / wall_time, 2) if wall_time > 0 else 0.0,
+        "skipped": counts.get("skipped", 0),
+        "failed": counts.get("failed", 0),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "peak_rss_so_far_mb": peak_rss_mb(),
+        "children_peak_rss_so_far_mb": children_peak_rss_mb(),
+    }
+
+
+def write_report(records, wall_time, path=REPORT_PATH):
+    report = {
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "wall_time_s": round(wall_time, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": children_peak_rss_mb(),
+        "stages": records,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def print_report(report):
+    print(f"\n{'=' * 100}")
+    print(f"  STAGE REPORT  (total {report['wall_time_s']:.1f}s, peak RSS {report['peak_rss_mb']} MB, "
+          f"largest child process {report['children_peak_rss_mb']} MB)")
+    print(f"{'=' * 100}")
+    print(f"  {'Stage':<20} {'Status':<8} {'Time':>8} {'Items':>7} {'Items/s':>9} "
+          f"{'Skip':>6} {'Fail':>6} {'In':>10} {'Out':>10}")
+    print(f"  {'-' * 96}")
+    for r in report["stages"]:
+        print(f"  {r['stage']:<20} {r['status']:<8} {r['wall_time_s']:>7.1f}s {r['items']:>7} "
+              f"{r['items_per_s']:>9.2f} {r['skipped']:>6} {r['failed']:>6} "
+              f"{_fmt_bytes(r['bytes_in']):>10} {_fmt_bytes(r['bytes_out']):>10}")
@@ -0,0 +1,278 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import random
+import re
+from collections import namedtuple
+
+from utils import links as lk
+
+# years:  (first, last) year, either end None for open; None for every year
+# areas:  normalised policy areas (e.g. "merger"); a case matches one it starts with
+# cases:  set of case numbers; None for every case
+# sample: number of cases, or a fraction of them (float below 1); None for all
+# seed:   seed of the sample, so a slice can be drawn again
+Selection = namedtuple("Selection", ["years", "areas", "cases", "sample", "seed"])
+
+
+def parse_years(spec):
+    """
+    Parse "2015-2020", "2015-", "-2010" or "2018" into (first, last).
+    Raises ValueError otherwise.
+    """
+    first, sep, last = str(spec).partition("-")
+    try:
+        first = int(first) if first.strip() else None
+        last = (int(last) if last.strip() else None) if sep else first
+    except ValueError:
+        raise ValueError(f"Years must look like 2015-2020, 2015-, -2010 or 2018, got {spec!r}")
+    if first is None and last is None or (first and last and first > last):
+        raise ValueError(f"Not a year range: {spec!r}")
+    return first, last
+
+
+def years_arg(spec):
+    """
+    argparse `type=` for a --years option.
+    """
+    try:
+        return parse_years(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def sample_arg(spec):
+    """
+    argparse `type=` for a --sample option: a number of cases ("500") or
+    a percentage of them ("2%").
+    """
+    try:
+        if spec.endswith("%"):
+            fraction = float(spec[:-1]) / 100
+            if 0 < fraction < 1:
+                return fraction
+        elif int(spec) > 0:
+            return int(spec)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Sample must be a number of cases or a percentage below 100%, got {spec!r}")
+
+
+def normalise_area(area):
+    """
+    "Antitrust & Cartels" → "antitrust_&_cartels", the form scrape_pdf_text uses.
+    """
+    return str(area).strip().lower().replace(" ", "_")
+
+
+def add_arguments(p):
+    """
+    Add the --years, --areas, --cases, --sample and --seed options to an
+    ArgumentParser; read them back with from_args().
+    """
+    p.add_argument(
+        "--years", type=years_arg, default=None,
+        help="Only cases whose last decision falls in these years, e.g. 2015-2020, 2015- or 2018")
+    p.add_argument(
+        "--areas", default=None,
+        help="Only these comma-separated policy areas, e.g. merger,state_aid")
+    p.add_argument(
+        "--cases", default=None,
+        help="Only these comma-separated case numbers, or those listed one per line in this file")
+    p.add_argument(
+        "--sample", type=sample_arg, default=None,
+        help="Only a sample of N cases (or P%%), drawn evenly across years and policy areas")
+    p.add_argument(
+        "--seed", type=int, default=0,
+        help="Seed of --sample; the same seed draws the same cases (default: %(default)s)")
+
+
+def from_args(args):
+    """
+    The Selection given on the command line, or None if it selects everything.
+    """
+    cases = None
+    if args.cases:
+        if os.path.isfile(args.cases):
+            with open(args.cases, encoding="utf-8") as f:
+                cases = {line.strip() for line in f if line.strip()}
+        else:
+            cases = {c.strip() for c in args.cases.split(",") if c.strip()}
+    areas = tuple(normalise_area(a) for a in args.areas.split(",")) if args.areas else None
+    if args.years is None and areas is None and cases is None and args.sample is None:
+        return None
+    return Selection(args.years, areas, cases, args.sample, args.seed)
+
+
+def to_argv(args):
+    """
+    The selection options of parsed `args` as arguments for another stage.
+    """
+    argv = []
+    if args.years:
+        first, last = args.years
+        argv += ["--years", f"{first or ''}-{last or ''}"]
+    for name in ("areas", "cases", "sample"):
+        value = getattr(args, name)
+        if value is not None:
+            argv += [f"--{name}", f"{value * 100:g}%" if isinstance(value, float) else str(value)]
+    if args.sample is not None:
+        argv += ["--seed", str(args.seed)]
+    return argv
+
+
+def describe(selection):
+    """
+    A stable description of `selection`, for manifest hashes and messages.
+    """
+    if selection is None:
+        return "all cases"
+    years, areas, cases, sample, seed = selection
+    parts = []
+    if years:
+        parts.append(f"years {years[0] or ''}-{years[1] or ''}")
+    if areas:
+        parts.append("areas " + ",".join(areas))
+    if cases is not None:
+        parts.append("cases " + ",".join(sorted(cases)))
+    if sample is not None:
+        parts.append(f"sample {sample} (seed {seed})")
+    return "; ".join(parts)
+
+
+def _year(year):
+    # ints from scrape_links, strings ("2024", "Unknown") from scrape_pdf_text
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+def matches(selection, case, year, area):
+    """
+    True if a link of `case` passes the year, area and case filters of
+    `selection`; always True for None. A case of unknown year never
+    matches a year range.
+    """
+    if selection is None:
+        return True
+    years, areas, cases, _, _ = selection
+    if cases is not None and str(case).strip() not in cases:
+        return False
+    if years:
+        y = _year(year)
+        if y is None or (years[0] and y < years[0]) or (years[1] and y > years[1]):
+            return False
+    if areas and not normalise_area(area).startswith(areas):
+        return False
+    return True
+
+
+def stratified_sample(links, size, seed=0):
+    """
+    The links of `size` cases (or that fraction of them) drawn from
+    (case, year, area, ...) tuples so that every (year, area) stratum
+    keeps its share of the cases. A case counts in the stratum of its
+    first link. Links keep their order.
+    """
+    strata, seen = {}, set()
+    for link in links:
+        case = str(link[0])
+        if case not in seen:
+            seen.add(case)
+            strata.setdefault((_year(link[1]), normalise_area(link[2])), []).append(case)
+    total = len(seen)
+    if isinstance(size, float):
+        size = max(1, round(total * size)) if total else 0
+    if size >= total:
+        return list(links)
+
+    # largest remainder: each stratum gets the whole cases of its share,
+    # then the cases left go one at a time to strata that have none yet,
+    # and then to those closest to another whole case
+    keys = sorted(strata, key=lambda k: (k[0] is None, k[0] or 0, k[1]))
+    shares = {k: size * len(strata[k]) / total for k in keys}
+    counts = {k: int(shares[k]) for k in keys}
+    order = sorted(keys, key=lambda k: (counts[k] > 0, counts[k] - shares[k]))
+    left = size - sum(counts.values())
+    while left:
+        for k in order:
+            if left and counts[k] < len(strata[k]):
+                counts[k] += 1
+                left -= 1
+
+    rng = random.Random(seed)
+    chosen = set()
+    for k in keys:
+        chosen.update(rng.sample(strata[k], counts[k]))
+    return [link for link in links if str(link[0]) in chosen]
+
+
+def select(selection, links):
+    """
+    The (case, year, area, ...) tuples in `links` that `selection` keeps:
+    the filtered links, then the stratified sample of them if one was asked for.
+    """
+    links = [link for link in links if matches(selection, *link[:3])]
+    if selection is not None and selection.sample is not None:
+        links = stratified_sample(links, selection.sample, selection.seed)
+    return links
+
+
+def link_keys(path):
+    """
+    The "<case>|<url>" keys of the links in the list at `path`, as
+    scrape_links wrote it for a selection. Batches are stored under the
+    same keys.
+    """
+    return {f"{link.case_number}|{link.link}" for link in lk.read_links(path)}
+
+
+def header_key(path):
+    """
+    The "<case>|<url>" key from the "Case Number:" and "Link:" lines that
+    scrape_pdf_text writes at the top of every batch file, or None if the
+    file has no such header.
+    """
+    case = url = None
+    with open(path, encoding="utf-8") as f:
+        for _, line in zip(range(8), f):
+            if line.startswith("Case Number:"):
+                case = line.split(":", 1)[1].strip()
+            elif line.startswith("Link:"):
+                url = line.split(":", 1)[1].strip()
+    return f"{case}|{url}" if case and url else None
+
+
+def batch_key(path, batch_dir):
+    """
+    header_key of the pdf_texts batch in `batch_dir` that a later stage's
+    file was made from, matched by size and batch number (both
+    extract-sections_80_batch_3.txt and extract-definitions_80_batch_3.json
+    come from pdf_texts_80_batch_3.txt), or None if that batch is gone.
+    """
+    m = re.search(r"_(\d+)_batch_(\d+)\.\w+$", os.path.basename(path))
+    batch = os.path.join(batch_dir, f"pdf_texts_{m.group(1)}_batch_{m.group(2)}.txt") if m else None
+    return header_key(batch) if batch and os.path.exists(batch) else None
@@ -0,0 +1,76 @@
+# ------------------------------------------------------------------------------------------
+#
+# Lextract - Extracts market definitions from European Commission's decision PDFs
+#
+# Copyright (C) 2025 Shriyan Yamali
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact: yamalishriyan@gmail.com
+#
+# ------------------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import os
+
+# Per-shard working directories live under here, e.g. data/shards/0-of-4/
+SHARDS_DIR = os.path.join("data", "shards")
+
+
+def parse_shard(spec):
+    """
+    Parse "i/N" into (i, N) with 0 <= i < N. Raises ValueError otherwise.
+    """
+    try:
+        index, count = (int(x) for x in spec.split("/"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Shard must look like i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must satisfy 0 <= i < N, got {spec!r}")
+    return index, count
+
+
+def shard_arg(spec):
+    """
+    argparse `type=` for a --shard option.
+    """
+    try:
+        return parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def shard_of(case_number, count):
+    """
+    Stable shard number for a case. Uses SHA-1 rather than hash(), which
+    is salted per interpreter and would differ between machines.
+    """
+    digest = hashlib.sha1(str(case_number).strip().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def in_shard(case_number, shard):
+    """
+    True if the case belongs to `shard` ((i, N) tuple); always True for None.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_of(case_number, count) == index
+
+
+def shard_dir(shard, root=SHARDS_DIR):
+    index, count = shard
+    return os.path.join(root, f"{index}-of-{count}")